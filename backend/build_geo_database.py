@@ -0,0 +1,23 @@
+"""
+Gera o arquivo de faixas usado pela geolocalização offline (GEOLOCATION_BACKEND=offline)
+a partir de um CSV de faixas de IP (ex.: DB-IP "IP to City Lite").
+Bases MaxMind .mmdb não precisam de conversão: aponte GEOLOCATION_DB direto para elas.
+
+Uso: python build_geo_database.py dbip-city-lite.csv geo_ranges.bin
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from backend.services.geo_offline import build_range_file
+
+if len(sys.argv) != 3:
+    print("Uso: python build_geo_database.py <faixas.csv> <saida.bin>")
+    exit(1)
+
+print(f"🔧 Convertendo {sys.argv[1]}...")
+inicio = time.time()
+total = build_range_file(sys.argv[1], sys.argv[2])
+print(f"✅ {total} faixas gravadas em {sys.argv[2]} ({time.time() - inicio:.1f}s)")
+print(f'Configure: $env:GEOLOCATION_BACKEND="offline"; $env:GEOLOCATION_DB="{os.path.abspath(sys.argv[2])}"')
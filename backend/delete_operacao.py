@@ -39,6 +39,11 @@ try:
         conn.execute(text(f"DELETE FROM comunicacoes WHERE operacao_id = {operacao_id}"))
         conn.commit()
         
+        # Deletar agregados diários do grafo
+        conn.execute(text(f"DELETE FROM arestas_diarias WHERE operacao_id = {operacao_id}"))
+        conn.execute(text(f"DELETE FROM mensagens_horarias WHERE operacao_id = {operacao_id}"))
+        conn.commit()
+        
         # 3. Deletar arquivos
         print("  📁 Deletando arquivos...")
         conn.execute(text(f"DELETE FROM arquivos WHERE operacao_id = {operacao_id}"))
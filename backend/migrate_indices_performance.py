@@ -0,0 +1,83 @@
+"""
+Script de migração para criar os índices de performance em bancos já existentes
+(create_all só cria índices junto com tabelas novas).
+Execute este script uma vez para atualizar o banco de dados
+"""
+import os
+from sqlalchemy import create_engine, text
+
+# Pegar URL do banco de dados (Supabase)
+DATABASE_URL = os.getenv("DATABASE_URL")
+
+if not DATABASE_URL:
+    print("❌ ERRO: Variável DATABASE_URL não encontrada!")
+    print("Execute este script com:")
+    print('$env:DATABASE_URL="postgresql://..."; python migrate_indices_performance.py')
+    exit(1)
+
+print("🔧 Conectando ao banco de dados...")
+engine = create_engine(DATABASE_URL)
+
+# SQL para criar os índices
+migration_sql = """
+-- Anti-join de telefones não cadastrados (intelligence.find_unregistered_phones)
+CREATE INDEX IF NOT EXISTS ix_telefones_operacao_numero
+ON telefones (operacao_id, numero);
+
+-- Paginação por cursor em /mensagens (messages.read_mensagens)
+CREATE INDEX IF NOT EXISTS ix_mensagens_operacao_data_hora_id
+ON mensagens (operacao_id, data_hora, id);
+
+CREATE INDEX IF NOT EXISTS ix_mensagens_operacao_remetente_id
+ON mensagens (operacao_id, remetente, id);
+
+CREATE INDEX IF NOT EXISTS ix_mensagens_operacao_destinatario_id
+ON mensagens (operacao_id, destinatario, id);
+
+CREATE INDEX IF NOT EXISTS ix_mensagens_operacao_alvo_id
+ON mensagens (operacao_id, alvo, id);
+
+-- Busca por número completo: igualdade com o telefone sem separadores
+-- (mesma expressão de message_filters.phone_digits_expr)
+CREATE INDEX IF NOT EXISTS ix_mensagens_remetente_digitos
+ON mensagens ((replace(replace(replace(replace(replace(replace(remetente, '+', ''), ' ', ''), '-', ''), '(', ''), ')', ''), '.', '')));
+
+CREATE INDEX IF NOT EXISTS ix_mensagens_destinatario_digitos
+ON mensagens ((replace(replace(replace(replace(replace(replace(destinatario, '+', ''), ' ', ''), '-', ''), '(', ''), ')', ''), '.', '')));
+
+CREATE INDEX IF NOT EXISTS ix_mensagens_alvo_digitos
+ON mensagens ((replace(replace(replace(replace(replace(replace(alvo, '+', ''), ' ', ''), '-', ''), '(', ''), ')', ''), '.', '')));
+
+-- Busca por substring (LIKE '%termo%') em /mensagens e /export/messages
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX IF NOT EXISTS ix_mensagens_remetente_trgm
+ON mensagens USING gin (remetente gin_trgm_ops);
+
+CREATE INDEX IF NOT EXISTS ix_mensagens_destinatario_trgm
+ON mensagens USING gin (destinatario gin_trgm_ops);
+
+CREATE INDEX IF NOT EXISTS ix_mensagens_alvo_trgm
+ON mensagens USING gin (alvo gin_trgm_ops);
+
+CREATE INDEX IF NOT EXISTS ix_mensagens_tipo_mensagem_trgm
+ON mensagens USING gin (tipo_mensagem gin_trgm_ops);
+
+CREATE INDEX IF NOT EXISTS ix_ips_endereco_trgm
+ON ips USING gin (endereco gin_trgm_ops);
+"""
+
+print("📝 Executando migração...")
+try:
+    with engine.connect() as conn:
+        # Executar cada comando SQL
+        for statement in migration_sql.strip().split(';'):
+            if statement.strip():
+                conn.execute(text(statement))
+        conn.commit()
+    
+    print("✅ Migração concluída com sucesso!")
+    
+except Exception as e:
+    print(f"❌ Erro durante migração: {e}")
+    exit(1)
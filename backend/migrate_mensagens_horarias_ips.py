@@ -0,0 +1,40 @@
+"""
+Script de migração para adicionar o sketch de IPs distintos (coluna ips) ao agregado horário.
+As linhas existentes do agregado são apagadas: a próxima leitura do dashboard (ou importação)
+refaz o agregado de cada operação já com a coluna preenchida.
+Execute este script uma vez para atualizar o banco de dados
+"""
+import os
+from sqlalchemy import create_engine, inspect, text
+
+# Pegar URL do banco de dados (Supabase)
+DATABASE_URL = os.getenv("DATABASE_URL")
+
+if not DATABASE_URL:
+    print("❌ ERRO: Variável DATABASE_URL não encontrada!")
+    print("Execute este script com:")
+    print('$env:DATABASE_URL="postgresql://..."; python migrate_mensagens_horarias_ips.py')
+    exit(1)
+
+print("🔧 Conectando ao banco de dados...")
+engine = create_engine(DATABASE_URL)
+
+print("📝 Executando migração...")
+try:
+    columns = [col["name"] for col in inspect(engine).get_columns("mensagens_horarias")]
+    if "ips" in columns:
+        print("Coluna 'ips' já existe na tabela 'mensagens_horarias'.")
+        exit(0)
+
+    tipo = "BYTEA" if engine.dialect.name == "postgresql" else "BLOB"
+    with engine.connect() as conn:
+        conn.execute(text(f"ALTER TABLE mensagens_horarias ADD COLUMN ips {tipo}"))
+        conn.execute(text("DELETE FROM mensagens_horarias"))
+        conn.commit()
+
+    print("✅ Migração concluída com sucesso!")
+    print("O agregado horário será refeito na próxima leitura de cada operação.")
+
+except Exception as e:
+    print(f"❌ Erro durante migração: {e}")
+    exit(1)
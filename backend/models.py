@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Float
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Float, Date, Index, LargeBinary
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from backend.database import Base
@@ -29,6 +29,10 @@ class Telefone(Base):
     total_mensagens = Column(Integer, default=0)
 
     operacao = relationship("Operacao", back_populates="telefones")
+
+    __table_args__ = (
+        Index("ix_telefones_operacao_numero", "operacao_id", "numero"),  # Anti-join de telefones não cadastrados
+    )
     # Relacionamentos para grafos podem ser complexos, definiremos conforme necessidade
 
 class IP(Base):
@@ -60,6 +64,14 @@ class Mensagem(Base):
     operacao = relationship("Operacao", back_populates="mensagens")
     ip_rel = relationship("IP", back_populates="mensagens")
 
+    __table_args__ = (
+        # Paginação por cursor: (coluna de ordenação, id) dentro da operação
+        Index("ix_mensagens_operacao_data_hora_id", "operacao_id", "data_hora", "id"),
+        Index("ix_mensagens_operacao_remetente_id", "operacao_id", "remetente", "id"),
+        Index("ix_mensagens_operacao_destinatario_id", "operacao_id", "destinatario", "id"),
+        Index("ix_mensagens_operacao_alvo_id", "operacao_id", "alvo", "id"),
+    )
+
 class Comunicacao(Base):
     __tablename__ = "comunicacoes"
 
@@ -71,6 +83,45 @@ class Comunicacao(Base):
 
     operacao = relationship("Operacao", back_populates="comunicacoes")
 
+class ArestaDiaria(Base):
+    """Mensagens por par (remetente, destinatário) e dia - base das janelas de tempo do grafo"""
+    __tablename__ = "arestas_diarias"
+
+    id = Column(Integer, primary_key=True, index=True)
+    operacao_id = Column(Integer, ForeignKey("operacoes.id"), nullable=False)
+    dia = Column(Date, nullable=False)
+    remetente = Column(String, nullable=False)
+    destinatario = Column(String, nullable=False)
+    quantidade = Column(Integer, default=0)
+
+    __table_args__ = (
+        Index("ix_arestas_diarias_operacao_dia", "operacao_id", "dia"),
+    )
+
+class MensagemHoraria(Base):
+    """Mensagens por operação, hora e tipo - base dos gráficos do dashboard"""
+    __tablename__ = "mensagens_horarias"
+
+    id = Column(Integer, primary_key=True, index=True)
+    operacao_id = Column(Integer, ForeignKey("operacoes.id"), nullable=False)
+    hora = Column(DateTime, nullable=True)  # Início da hora; NULL = mensagens sem data
+    tipo_mensagem = Column(String, nullable=True)
+    quantidade = Column(Integer, default=0)
+    remetentes = Column(LargeBinary)  # HyperLogLog (services/hll.py) dos remetentes distintos
+    ips = Column(LargeBinary)  # HyperLogLog dos ip_id distintos
+
+    __table_args__ = (
+        Index("ix_mensagens_horarias_operacao_hora", "operacao_id", "hora"),
+    )
+
+class VersaoDados(Base):
+    """Contador de versão dos dados (invalida caches); incrementado a cada escrita concluída"""
+    __tablename__ = "versoes_dados"
+
+    fonte = Column(String, primary_key=True)  # 'mensagens', 'telefones' ou 'ips'
+    operacao_id = Column(Integer, primary_key=True)  # 0 para fontes globais (ips)
+    versao = Column(Integer, nullable=False, default=0)
+
 class Arquivo(Base):
     __tablename__ = "arquivos"
 
@@ -1,48 +1,109 @@
-from functools import lru_cache
 from fastapi import APIRouter, Depends
 from sqlalchemy.orm import Session
 from sqlalchemy import func, desc, text
 from typing import Dict, Any, List
+from collections import defaultdict
 import backend.models as models
 from backend.database import get_db
-import time
+from backend.services import rollups
+from backend.services.hll import HyperLogLog
+from backend.services.cache import cached_response, response_cache_stats
 
 router = APIRouter(
     prefix="/dashboard",
     tags=["dashboard"]
 )
 
-# Cache para 2 minutos (TTL)
+# Cache para 2 minutos (TTL), invalidado antes disso por novas importações
 CACHE_TTL = 120
 
+@router.get("/cache/stats")
+def get_cache_stats():
+    """Acertos/falhas do cache de respostas (dashboard e mapa)"""
+    return response_cache_stats()
+
 @router.get("/{operacao_id}/stats")
+@cached_response(CACHE_TTL, fontes=("mensagens", "telefones"))
 def get_stats(operacao_id: int, db: Session = Depends(get_db)):
-    """Estatísticas básicas - Otimizado com uma única query"""
-    # Uma única query com subqueries para contar tudo de uma vez
+    """Estatísticas básicas - mensagens e IPs distintos (aproximado) vêm do agregado horário"""
+    rollups.ensure_hourly(db, operacao_id)
     result = db.execute(text("""
         SELECT 
             (SELECT COUNT(*) FROM telefones WHERE operacao_id = :op_id) as total_telefones,
-            (SELECT COUNT(*) FROM mensagens WHERE operacao_id = :op_id) as total_mensagens,
-            (SELECT COUNT(DISTINCT ip_id) FROM mensagens WHERE operacao_id = :op_id AND ip_id IS NOT NULL) as total_ips
+            (SELECT COALESCE(SUM(quantidade), 0) FROM mensagens_horarias WHERE operacao_id = :op_id) as total_mensagens
     """), {"op_id": operacao_id}).first()
     
     return {
         "total_telefones": result[0],
-        "total_mensagens": result[1],
-        "total_ips": result[2]
+        "total_mensagens": int(result[1]),
+        "total_ips": rollups.distinct_ips(db, operacao_id)
     }
 
 @router.get("/{operacao_id}/evolution")
+@cached_response(CACHE_TTL)
 def get_evolution(operacao_id: int, db: Session = Depends(get_db)):
-    """Evolução temporal - PostgreSQL date_trunc"""
-    results = db.query(
-        func.date_trunc('day', models.Mensagem.data_hora).label('data'),
-        func.count(models.Mensagem.id)
-    ).filter(
-        models.Mensagem.operacao_id == operacao_id,
-        models.Mensagem.data_hora.isnot(None)
-    ).group_by('data').order_by('data').all()
+    """Evolução diária (mensagens e remetentes distintos aproximados) a partir do agregado horário"""
+    dias = defaultdict(lambda: [0, HyperLogLog()])
+    for hora, quantidade, remetentes in rollups.hourly_senders(db, operacao_id):
+        if hora is None:
+            continue
+        dia = dias[hora.date()]
+        dia[0] += quantidade
+        dia[1].merge(HyperLogLog.from_bytes(remetentes))
     
-    return [{"data": str(r[0].date()), "total": r[1]} for r in results]
-
+    return [
+        {"data": str(dia), "total": total, "remetentes": sketch.count()}
+        for dia, (total, sketch) in sorted(dias.items())
+    ]
 
+@router.get("/{operacao_id}/overview")
+@cached_response(CACHE_TTL, fontes=("mensagens", "telefones"))
+def get_overview(operacao_id: int, limit: int = 5, db: Session = Depends(get_db)):
+    """
+    Todos os widgets do dashboard em uma chamada: estatísticas, evolução, tipos,
+    mapa de calor, horários de pico e principais interlocutores.
+    Os gráficos saem de uma única leitura do agregado horário e os interlocutores
+    das arestas diárias; nenhuma consulta lê a tabela de mensagens.
+    """
+    total_mensagens = 0
+    total_ips = HyperLogLog()
+    dias = defaultdict(lambda: [0, HyperLogLog()])
+    tipos = defaultdict(int)
+    heatmap = defaultdict(int)
+    horas = defaultdict(int)
+    
+    for hora, tipo, quantidade, remetentes, ips in rollups.hourly_rows(db, operacao_id):
+        total_mensagens += quantidade
+        total_ips.merge(HyperLogLog.from_bytes(ips))
+        tipos[tipo] += quantidade
+        if hora is None:
+            continue
+        dia = dias[hora.date()]
+        dia[0] += quantidade
+        dia[1].merge(HyperLogLog.from_bytes(remetentes))
+        # Dia no padrão do PostgreSQL (0 = domingo)
+        heatmap[(hora.hour, (hora.weekday() + 1) % 7)] += quantidade
+        horas[hora.hour] += quantidade
+    
+    total_telefones = db.execute(text(
+        "SELECT COUNT(*) FROM telefones WHERE operacao_id = :op_id"
+    ), {"op_id": operacao_id}).scalar()
+    
+    return {
+        "stats": {
+            "total_telefones": total_telefones,
+            "total_mensagens": total_mensagens,
+            "total_ips": total_ips.count()
+        },
+        "evolution": [
+            {"data": str(dia), "total": total, "remetentes": sketch.count()}
+            for dia, (total, sketch) in sorted(dias.items())
+        ],
+        "message_types": [{"tipo": tipo or "unknown", "count": count} for tipo, count in tipos.items()],
+        "activity_heatmap": [{"hour": hour, "day": day, "count": count} for (hour, day), count in heatmap.items()],
+        "top_interlocutors": [
+            {"numero": numero, "total": total}
+            for numero, total in rollups.top_edge_phones(db, operacao_id, limit)
+        ],
+        "peak_hours": [{"hour": h, "count": horas.get(h, 0)} for h in range(24)]
+    }
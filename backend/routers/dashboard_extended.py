@@ -1,59 +1,65 @@
 from fastapi import APIRouter, Depends
 from sqlalchemy.orm import Session
-from sqlalchemy import func, extract, desc
+from sqlalchemy import func, desc
 from typing import Dict, Any, List
+from collections import defaultdict
 import backend.models as models
 from backend.database import get_db
+from backend.services import analytics, rollups
+from backend.services.cache import cached_response
 
 router = APIRouter(
     prefix="/dashboard",
     tags=["dashboard"]
 )
 
+# Mesmo TTL do dashboard principal
+CACHE_TTL = 120
+
 @router.get("/message-types/{operacao_id}")
+@cached_response(CACHE_TTL)
 def get_message_types(operacao_id: int, db: Session = Depends(get_db)):
-    """Get distribution of message types"""
-    results = (
-        db.query(
-            models.Mensagem.tipo_mensagem,
-            func.count(models.Mensagem.id).label('count')
-        )
-        .filter(models.Mensagem.operacao_id == operacao_id)
-        .group_by(models.Mensagem.tipo_mensagem)
-        .all()
-    )
+    """Get distribution of message types (agregado horário)"""
+    tipos = defaultdict(int)
+    for _, tipo, count in rollups.hourly_totals(db, operacao_id, com_tipo=True):
+        tipos[tipo] += int(count)
     
     return [
-        {"tipo": r.tipo_mensagem or "unknown", "count": r.count}
-        for r in results
+        {"tipo": tipo or "unknown", "count": count}
+        for tipo, count in tipos.items()
     ]
 
 @router.get("/activity-heatmap/{operacao_id}")
+@cached_response(CACHE_TTL)
 def get_activity_heatmap(operacao_id: int, db: Session = Depends(get_db)):
-    """Get hourly activity heatmap - Otimizado"""
-    # Usando LIMIT para evitar processar milhares de registros
-    results = (
-        db.query(
-            extract('hour', models.Mensagem.data_hora).label('hour'),
-            extract('dow', models.Mensagem.data_hora).label('day'),
-            func.count(models.Mensagem.id).label('count')
-        )
-        .filter(
-            models.Mensagem.operacao_id == operacao_id,
-            models.Mensagem.data_hora.isnot(None)
-        )
-        .group_by('hour', 'day')
-        .all()
-    )
+    """Get hourly activity heatmap - somando as horas do agregado horário"""
+    cells = defaultdict(int)
+    for hora, count in rollups.hourly_totals(db, operacao_id):
+        if hora is None:
+            continue
+        # Dia no padrão do PostgreSQL (0 = domingo)
+        cells[(hora.hour, (hora.weekday() + 1) % 7)] += int(count)
     
     return [
-        {"hour": int(r.hour) if r.hour is not None else 0, "day": int(r.day) if r.day is not None else 0, "count": r.count}
-        for r in results
+        {"hour": hour, "day": day, "count": count}
+        for (hour, day), count in cells.items()
     ]
 
 @router.get("/top-interlocutors/{operacao_id}")
+@cached_response(CACHE_TTL)
 def get_top_interlocutors(operacao_id: int, limit: int = 5, db: Session = Depends(get_db)):
     """Get top 5 interlocutors (most active numbers)"""
+    return top_interlocutors(db, operacao_id, limit)
+
+def top_interlocutors(db: Session, operacao_id: int, limit: int = 5):
+    """Números com mais aparições como remetente ou destinatário (também usado no overview)"""
+    frame = analytics.get_frame(db, operacao_id)
+    if frame is not None:
+        return [
+            {"numero": numero, "total": total}
+            for numero, total in frame.phone_appearances()[:limit]
+        ]
+    
     # Contar mensagens onde o número é remetente
     sent = db.query(
         models.Mensagem.remetente.label('numero'),
@@ -106,24 +112,13 @@ def get_top_interlocutors(operacao_id: int, limit: int = 5, db: Session = Depend
     ]
 
 @router.get("/peak-hours/{operacao_id}")
+@cached_response(CACHE_TTL)
 def get_peak_hours(operacao_id: int, db: Session = Depends(get_db)):
-    """Get message volume by hour of day"""
-    results = (
-        db.query(
-            extract('hour', models.Mensagem.data_hora).label('hour'),
-            func.count(models.Mensagem.id).label('count')
-        )
-        .filter(
-            models.Mensagem.operacao_id == operacao_id,
-            models.Mensagem.data_hora.isnot(None)
-        )
-        .group_by('hour')
-        .order_by('hour')
-        .all()
-    )
+    """Get message volume by hour of day (agregado horário)"""
+    hours_data = defaultdict(int)
+    for hora, count in rollups.hourly_totals(db, operacao_id):
+        if hora is not None:
+            hours_data[hora.hour] += int(count)
     
     # Preencher horas vazias
-    hours_data = {int(r.hour): r.count for r in results}
-    final_data = [{"hour": h, "count": hours_data.get(h, 0)} for h in range(24)]
-    
-    return final_data
+    return [{"hour": h, "count": hours_data.get(h, 0)} for h in range(24)]
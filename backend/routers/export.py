@@ -1,21 +1,39 @@
-from fastapi import APIRouter, Depends, Response
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
+from sqlalchemy import func, distinct, select, union_all, or_
 from reportlab.lib.pagesizes import letter, A4
 from reportlab.lib import colors
 from reportlab.lib.units import inch
 from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, PageBreak
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.enums import TA_CENTER, TA_LEFT
-from io import BytesIO
 from datetime import datetime
+from typing import Optional
+import csv
+import io
+import json
 import backend.models as models
-from backend.database import get_db
+from backend.database import get_db, SessionLocal
+from backend.services.message_filters import MODOS_BUSCA, date_filters, search_filter
+from backend.services.pdf_stream import pdf_streaming_response, split_pages
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow é opcional; sem ele só CSV e JSONL
+    pa = None
 
 router = APIRouter(
     prefix="/export",
     tags=["export"]
 )
 
+# Linhas lidas do cursor por vez (e por row group no Parquet)
+EXPORT_CHUNK = 10000
+
+MESSAGE_COLUMNS = ["id", "data_hora", "alvo", "remetente", "destinatario", "ip", "porta", "tipo_mensagem", "pais", "cidade"]
+
 @router.get("/pdf/{operacao_id}")
 def export_pdf(operacao_id: int, db: Session = Depends(get_db)):
     """Generate PDF report for an operation"""
@@ -25,12 +43,50 @@ def export_pdf(operacao_id: int, db: Session = Depends(get_db)):
     if not operacao:
         return {"error": "Operação não encontrada"}
     
-    # Create PDF buffer
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=A4)
+    # Statistics
+    stats = db.query(
+        db.query(func.count(models.Telefone.id)).filter(
+            models.Telefone.operacao_id == operacao_id
+        ).scalar_subquery(),
+        func.count(models.Mensagem.id),
+        func.count(distinct(models.Mensagem.ip_id))
+    ).filter(models.Mensagem.operacao_id == operacao_id).one()
+    
+    # Aparições como remetente ou destinatário (a mesma mensagem conta uma vez por telefone)
+    envolvidos = union_all(
+        select(models.Mensagem.remetente.label("numero")).where(
+            models.Mensagem.operacao_id == operacao_id
+        ),
+        select(models.Mensagem.destinatario.label("numero")).where(
+            models.Mensagem.operacao_id == operacao_id,
+            or_(models.Mensagem.remetente.is_(None), models.Mensagem.destinatario != models.Mensagem.remetente)
+        )
+    ).subquery()
     
-    # Container for elements
-    elements = []
+    total = func.count(envolvidos.c.numero).label('total')
+    top_phones = db.query(
+        models.Telefone.numero,
+        total
+    ).outerjoin(
+        envolvidos, envolvidos.c.numero == models.Telefone.numero
+    ).filter(
+        models.Telefone.operacao_id == operacao_id
+    ).group_by(
+        models.Telefone.numero
+    ).order_by(
+        total.desc(),
+        models.Telefone.numero
+    ).limit(10).all()
+    
+    # PDF enviado em blocos: cada seção é montada e enviada antes da seguinte
+    return pdf_streaming_response(
+        split_pages(_pdf_story(operacao, stats, top_phones)),
+        f"relatorio_{operacao.nome}_{datetime.now().strftime('%Y%m%d')}.pdf"
+    )
+
+
+def _pdf_story(operacao, stats, top_phones):
+    """Flowables do relatório, gerados sob demanda; cada PageBreak fecha um grupo de páginas"""
     styles = getSampleStyleSheet()
     
     # Custom styles
@@ -53,9 +109,8 @@ def export_pdf(operacao_id: int, db: Session = Depends(get_db)):
     )
     
     # Title
-    title = Paragraph(f"Relatório Forense - {operacao.nome}", title_style)
-    elements.append(title)
-    elements.append(Spacer(1, 0.2*inch))
+    yield Paragraph(f"Relatório Forense - {operacao.nome}", title_style)
+    yield Spacer(1, 0.2*inch)
     
     # Operation info
     info_data = [
@@ -76,15 +131,12 @@ def export_pdf(operacao_id: int, db: Session = Depends(get_db)):
         ('GRID', (0, 0), (-1, -1), 0.5, colors.grey)
     ]))
     
-    elements.append(info_table)
-    elements.append(Spacer(1, 0.3*inch))
+    yield info_table
+    yield Spacer(1, 0.3*inch)
     
     # Statistics
-    total_phones = db.query(models.Telefone).filter(models.Telefone.operacao_id == operacao_id).count()
-    total_messages = db.query(models.Mensagem).filter(models.Mensagem.operacao_id == operacao_id).count()
-    total_ips = db.query(models.IP).distinct(models.IP.endereco).count()
-    
-    elements.append(Paragraph("Estatísticas Gerais", heading_style))
+    total_phones, total_messages, total_ips = stats
+    yield Paragraph("Estatísticas Gerais", heading_style)
     
     stats_data = [
         ['Total de Telefones', str(total_phones)],
@@ -104,19 +156,11 @@ def export_pdf(operacao_id: int, db: Session = Depends(get_db)):
         ('GRID', (0, 0), (-1, -1), 1, colors.black)
     ]))
     
-    elements.append(stats_table)
-    elements.append(Spacer(1, 0.3*inch))
+    yield stats_table
+    yield PageBreak()
     
     # Top phones
-    elements.append(Paragraph("Top 10 Telefones Mais Ativos", heading_style))
-    
-    top_phones = db.query(
-        models.Telefone.numero,
-        db.query(models.Mensagem).filter(
-            (models.Mensagem.remetente == models.Telefone.numero) | 
-            (models.Mensagem.destinatario == models.Telefone.numero)
-        ).filter(models.Mensagem.operacao_id == operacao_id).count().label('total')
-    ).filter(models.Telefone.operacao_id == operacao_id).limit(10).all()
+    yield Paragraph("Top 10 Telefones Mais Ativos", heading_style)
     
     if top_phones:
         phone_data = [['Telefone', 'Mensagens']]
@@ -134,20 +178,162 @@ def export_pdf(operacao_id: int, db: Session = Depends(get_db)):
             ('GRID', (0, 0), (-1, -1), 0.5, colors.grey)
         ]))
         
-        elements.append(phone_table)
-    
-    # Build PDF
-    doc.build(elements)
-    
-    # Get PDF value
-    pdf_value = buffer.getvalue()
-    buffer.close()
-    
-    # Return as response
-    return Response(
-        content=pdf_value,
-        media_type="application/pdf",
-        headers={
-            "Content-Disposition": f"attachment; filename=relatorio_{operacao.nome}_{datetime.now().strftime('%Y%m%d')}.pdf"
-        }
+        yield phone_table
+
+
+def _message_rows(operacao_id: int, search: Optional[str], modo_busca: str, data_inicio: Optional[str], data_fim: Optional[str]):
+    """
+    Lê as mensagens filtradas com cursor no servidor, em blocos de EXPORT_CHUNK linhas.
+    Usa sessão própria: o gerador roda enquanto a resposta é enviada.
+    """
+    db = SessionLocal()
+    try:
+        query = db.query(
+            models.Mensagem.id,
+            models.Mensagem.data_hora,
+            models.Mensagem.alvo,
+            models.Mensagem.remetente,
+            models.Mensagem.destinatario,
+            models.IP.endereco,
+            models.Mensagem.porta,
+            models.Mensagem.tipo_mensagem,
+            models.IP.pais,
+            models.IP.cidade
+        ).outerjoin(
+            models.IP, models.Mensagem.ip_id == models.IP.id
+        ).filter(
+            models.Mensagem.operacao_id == operacao_id,
+            *date_filters(data_inicio, data_fim)
+        )
+        if search:
+            query = query.filter(search_filter(search, modo_busca))
+
+        chunk = []
+        for row in query.order_by(models.Mensagem.data_hora, models.Mensagem.id).yield_per(EXPORT_CHUNK):
+            chunk.append(tuple(row))
+            if len(chunk) >= EXPORT_CHUNK:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+    finally:
+        db.close()
+
+
+def _csv_stream(chunks):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    buffer.write("\ufeff")  # BOM para o Excel reconhecer UTF-8
+    writer.writerow(MESSAGE_COLUMNS)
+    for chunk in chunks:
+        writer.writerows(chunk)
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+def _jsonl_stream(chunks):
+    for chunk in chunks:
+        lines = [
+            json.dumps(dict(zip(MESSAGE_COLUMNS, row)), ensure_ascii=False, default=str)
+            for row in chunk
+        ]
+        yield ("\n".join(lines) + "\n").encode("utf-8")
+
+
+class _Drain(io.RawIOBase):
+    """Destino de escrita que acumula bytes até serem retirados pelo gerador"""
+
+    def __init__(self):
+        self.parts = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def take(self):
+        data = b"".join(self.parts)
+        self.parts = []
+        return data
+
+
+def _parquet_stream(chunks):
+    schema = pa.schema([
+        ("id", pa.int64()),
+        ("data_hora", pa.timestamp("s")),
+        ("alvo", pa.string()),
+        ("remetente", pa.string()),
+        ("destinatario", pa.string()),
+        ("ip", pa.string()),
+        ("porta", pa.int32()),
+        ("tipo_mensagem", pa.string()),
+        ("pais", pa.string()),
+        ("cidade", pa.string())
+    ])
+    sink = _Drain()
+    writer = pq.ParquetWriter(sink, schema)
+    try:
+        # Cada bloco vira um row group, enviado assim que escrito
+        for chunk in chunks:
+            columns = list(zip(*chunk))
+            writer.write_table(pa.Table.from_arrays(
+                [pa.array(col, type=field.type) for col, field in zip(columns, schema)],
+                schema=schema
+            ))
+            data = sink.take()
+            if data:
+                yield data
+    finally:
+        writer.close()
+    yield sink.take()
+
+
+EXPORT_FORMATS = {
+    "csv": (_csv_stream, "text/csv; charset=utf-8"),
+    "jsonl": (_jsonl_stream, "application/x-ndjson"),
+    "parquet": (_parquet_stream, "application/vnd.apache.parquet"),
+}
+
+
+@router.get("/messages/{operacao_id}")
+def export_messages(
+    operacao_id: int,
+    formato: str = "csv",
+    search: Optional[str] = None,
+    modo_busca: str = "auto",
+    data_inicio: Optional[str] = None,
+    data_fim: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """
+    Exporta todas as mensagens da operação (mesmos filtros de /mensagens) em CSV, JSONL ou Parquet.
+    A resposta é gerada em blocos a partir de um cursor no servidor, com memória constante.
+    """
+    if formato not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Formato inválido. Use: {', '.join(EXPORT_FORMATS)}")
+    if formato == "parquet" and pa is None:
+        raise HTTPException(status_code=400, detail="Formato parquet indisponível no servidor")
+    if modo_busca not in MODOS_BUSCA:
+        raise HTTPException(status_code=400, detail=f"modo_busca inválido. Use: {', '.join(MODOS_BUSCA)}")
+
+    operacao = db.query(models.Operacao).filter(models.Operacao.id == operacao_id).first()
+    if not operacao:
+        raise HTTPException(status_code=404, detail="Operação não encontrada")
+
+    stream, media_type = EXPORT_FORMATS[formato]
+    filename = f"mensagens_{operacao.nome.replace(' ', '_')}_{datetime.now().strftime('%Y%m%d')}.{formato}"
+    return StreamingResponse(
+        stream(_message_rows(operacao_id, search, modo_busca, data_inicio, data_fim)),
+        media_type=media_type,
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
     )
@@ -1,23 +1,33 @@
-from fastapi import APIRouter, Depends, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 from sqlalchemy import func, String
 from typing import List
 import backend.models as models
 from backend.database import get_db
-from backend.services import geolocation
+from backend.services import geolocation, map_clusters, sql_compat, trajectory
+from backend.services.cache import cached_response
+from backend.services.message_filters import date_filters
 
 router = APIRouter(
     prefix="/geolocation",
     tags=["geolocation"],
 )
 
+# O mapa também é invalidado quando IPs são geolocalizados
+MAP_CACHE_TTL = 120
+
 @router.post("/{operacao_id}/sync")
-def sync_geolocation(operacao_id: int, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
-    # Iniciar processo em background para não travar a UI
-    background_tasks.add_task(geolocation.geolocate_ips, operacao_id, db)
-    return {"message": "Sincronização de geolocalização iniciada"}
+def sync_geolocation(operacao_id: int):
+    # Enfileira os IPs pendentes; o worker de geolocalização roda em background com sessão própria
+    enfileirados = geolocation.enqueue_operation(operacao_id)
+    return {
+        "message": "Sincronização de geolocalização iniciada",
+        "enfileirados": enfileirados,
+        "pendentes": geolocation.pending_count()
+    }
 
 @router.get("/{operacao_id}")
+@cached_response(MAP_CACHE_TTL, fontes=("mensagens", "ips"))
 def get_map_data(
     operacao_id: int, 
     data_inicio: str = None, 
@@ -47,9 +57,7 @@ def get_map_data(
             data_fim_adjusted = data_fim
         filters.append(models.Mensagem.data_hora <= data_fim_adjusted)
     
-    # Query otimizada com string_agg (PostgreSQL)
-    from sqlalchemy import text
-    
+    # Query otimizada agregando os telefones de cada IP (string_agg / group_concat)
     results = db.query(
         models.IP.id,
         models.IP.endereco,
@@ -59,7 +67,7 @@ def get_map_data(
         models.IP.pais,
         models.IP.provedor,
         func.count(models.Mensagem.id).label('total_mensagens'),
-        func.string_agg(func.distinct(models.Mensagem.remetente), text("','")).label('telefones')
+        sql_compat.distinct_string_agg(db, models.Mensagem.remetente).label('telefones')
     ).join(
         models.Mensagem, models.Mensagem.ip_id == models.IP.id
     ).filter(
@@ -83,4 +91,88 @@ def get_map_data(
     ]
 
 
+@router.get("/{operacao_id}/clusters")
+def get_map_clusters(
+    operacao_id: int,
+    bbox: str,
+    zoom: int = Query(..., ge=0, le=map_clusters.MAX_ZOOM),
+    data_inicio: str = None,
+    data_fim: str = None,
+    db: Session = Depends(get_db)
+):
+    """IPs agrupados em células de grade da área visível (bbox 'oeste,sul,leste,norte')"""
+    janela = map_clusters.parse_bbox(bbox)
+    index = map_clusters.get_index(db, operacao_id, data_inicio, data_fim)
+    return {
+        "zoom": zoom,
+        "total_ips": len(index),
+        "clusters": map_clusters.clusters(index, janela, zoom)
+    }
+
+
+@router.get("/{operacao_id}/clusters/detalhes")
+def get_cluster_details(
+    operacao_id: int,
+    chave: str,
+    data_inicio: str = None,
+    data_fim: str = None,
+    limit: int = Query(200, ge=1, le=5000),
+    db: Session = Depends(get_db)
+):
+    """IPs e telefones de um cluster (carregados só quando o cluster é aberto no mapa)"""
+    filters = [
+        models.Mensagem.operacao_id == operacao_id,
+        map_clusters.cell_filter(chave),
+        *date_filters(data_inicio, data_fim)
+    ]
+    ips = db.query(models.IP).join(
+        models.Mensagem, models.Mensagem.ip_id == models.IP.id
+    ).filter(*filters).distinct()
+
+    telefones = db.query(
+        models.Mensagem.remetente,
+        func.count(models.Mensagem.id).label('total')
+    ).join(
+        models.IP, models.Mensagem.ip_id == models.IP.id
+    ).filter(*filters).group_by(models.Mensagem.remetente)
+
+    # Só a página pedida sai do banco; os totais vêm de COUNTs separados
+    ip_rows = ips.order_by(models.IP.endereco).limit(limit).all()
+    telefone_rows = telefones.order_by(
+        func.count(models.Mensagem.id).desc(), models.Mensagem.remetente
+    ).limit(limit).all()
 
+    return {
+        "chave": chave,
+        "ips": [
+            {
+                "id": ip.id,
+                "endereco": ip.endereco,
+                "latitude": ip.latitude,
+                "longitude": ip.longitude,
+                "cidade": ip.cidade,
+                "pais": ip.pais,
+                "provedor": ip.provedor
+            }
+            for ip in ip_rows
+        ],
+        "total_ips": ips.count(),
+        "telefones": [{"numero": t.remetente, "total_mensagens": t.total} for t in telefone_rows],
+        "total_telefones": telefones.count()
+    }
+
+
+@router.get("/{operacao_id}/trajectory/{numero}")
+@cached_response(MAP_CACHE_TTL, fontes=("mensagens", "ips"))
+def get_trajectory(
+    operacao_id: int,
+    numero: str,
+    agrupar: str = "cidade",
+    data_inicio: str = None,
+    data_fim: str = None,
+    db: Session = Depends(get_db)
+):
+    """Deslocamento do telefone no tempo: segmentos consecutivos no mesmo local (cidade ou IP)"""
+    if agrupar not in trajectory.AGRUPAMENTOS:
+        raise HTTPException(status_code=400, detail=f"agrupar deve ser um de: {', '.join(trajectory.AGRUPAMENTOS)}")
+    return trajectory.build_trajectory(db, operacao_id, numero, agrupar, data_inicio, data_fim)
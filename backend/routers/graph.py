@@ -1,20 +1,113 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 from sqlalchemy import func
 from typing import List, Dict, Any
 import backend.models as models
 from backend.database import get_db
+from backend.services import graph_paths, graph_codec, rollups, analytics, centrality
 
 router = APIRouter(
     prefix="/graph",
     tags=["graph"],
 )
 
+IP_COLOR = "#F43F5E"  # Rose-500 (IP)
+
+
+def _phone_color(categoria, tipo):
+    """Cor do nó pela categoria de investigação (Paleta Harmoniosa)"""
+    if categoria == 'SUSPEITO':
+        return "#E11D48"  # Rose-600 (Suspeito) - Alerta mas elegante
+    if categoria == 'TESTEMUNHA':
+        return "#059669"  # Emerald-600 (Testemunha) - Calmo
+    if categoria == 'VITIMA':
+        return "#7C3AED"  # Violet-600 (Vítima) - Distinto
+    if categoria == 'OUTRO':
+        return "#D97706"  # Amber-600 (Outro) - Atenção moderada
+    if tipo == 'ALVO':
+        return "#E11D48"  # Rose-600 (Alvo legado) - Mesmo que suspeito
+    return "#64748B"  # Slate-500 (Padrão/Sem Categoria) - Neutro
+
+
+def _parse_dia(valor, parametro: str):
+    """Data de um parâmetro da janela; 400 se não estiver no formato YYYY-MM-DD"""
+    try:
+        return rollups.parse_dia(valor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Data inválida em {parametro}: use YYYY-MM-DD")
+
+
+def _edge_columns(rows):
+    """Colunas source/target/weight a partir de linhas (origem, destino, quantidade)"""
+    sources, targets, weights = zip(*rows) if rows else ((), (), ())
+    return {"source": list(sources), "target": list(targets), "weight": list(weights)}
+
+
+def _ip_columns(ips, phone_counts=None):
+    """Nós de IP em colunas (phone_counts: telefones por ip_id, nos IPs compartilhados)"""
+    columns = {
+        "id": [f"ip_{ip.id}" for ip in ips],
+        "label": [ip.endereco for ip in ips],
+        "type": ["IP"] * len(ips),
+        "ip_id": [ip.id for ip in ips],
+        "endereco": [ip.endereco for ip in ips],
+        "provedor": [ip.provedor for ip in ips],
+        "pais": [ip.pais for ip in ips],
+        "cidade": [ip.cidade for ip in ips],
+        "latitude": [ip.latitude for ip in ips],
+        "longitude": [ip.longitude for ip in ips],
+    }
+    if phone_counts is not None:
+        columns["phone_count"] = [phone_counts.get(ip.id, 0) for ip in ips]  # Número de telefones conectados
+    columns["color"] = [IP_COLOR] * len(ips)
+    return columns
+
+
+def _ip_phone_graph(db: Session, operacao_id: int, ips, conexoes, phone_counts=None):
+    """
+    Grafo telefone-IP a partir das linhas (telefone, ip_id, quantidade): nós de IP,
+    nós dos telefones que aparecem nas conexões (dados do cadastro, quando houver) e arestas.
+    """
+    numeros = list(dict.fromkeys(tel for tel, _, _ in conexoes))
+    cadastro = {}
+    if numeros:
+        cadastro = {t.numero: t for t in db.query(models.Telefone).filter(
+            models.Telefone.operacao_id == operacao_id,
+            models.Telefone.numero.in_(numeros)
+        ).all()}
+    telefones = [cadastro.get(n) for n in numeros]
+
+    phone_nodes = {
+        "id": numeros,
+        "label": [(t.identificacao if t else None) or n for n, t in zip(numeros, telefones)],
+        "identificacao": [t.identificacao if t else None for t in telefones],
+        "foto": [t.foto if t else None for t in telefones],
+        "telefone_id": [t.id if t else None for t in telefones],
+        "categoria": [t.categoria if t else None for t in telefones],
+        "observacoes": [t.observacoes if t else None for t in telefones],
+        "type": ["TELEFONE"] * len(numeros),
+        "color": [_phone_color(t.categoria, t.tipo) if t else _phone_color(None, None) for t in telefones],
+    }
+    return {
+        "nodes": graph_codec.concat_columns(_ip_columns(ips, phone_counts), phone_nodes),
+        "edges": _edge_columns([(tel, f"ip_{ip_id}", count) for tel, ip_id, count in conexoes])
+    }
+
 @router.get("/{operacao_id}/general")
-def get_general_graph(operacao_id: int, db: Session = Depends(get_db)):
+def get_general_graph(
+    operacao_id: int,
+    data_inicio: str = None,
+    data_fim: str = None,
+    formato: str = "json",
+    db: Session = Depends(get_db)
+):
     # Construir grafo de comunicações entre telefones
     # Nós: Telefones
     # Arestas: Mensagens trocadas
+    # Com data_inicio/data_fim, o grafo é montado a partir das arestas diárias (granularidade de dia)
+    inicio = _parse_dia(data_inicio, "data_inicio")
+    fim = _parse_dia(data_fim, "data_fim")
+    janela = inicio is not None or fim is not None
     
     # Buscar todos os telefones da operação
     telefones = db.query(models.Telefone).filter(models.Telefone.operacao_id == operacao_id).all()
@@ -28,101 +121,140 @@ def get_general_graph(operacao_id: int, db: Session = Depends(get_db)):
     
     # Calcular total de mensagens por telefone
     mensagens_por_tel = {}
-    mensagens_count = db.query(
-        models.Mensagem.remetente,
-        func.count(models.Mensagem.id)
-    ).filter(
-        models.Mensagem.operacao_id == operacao_id,
-        models.Mensagem.remetente.isnot(None)
-    ).group_by(models.Mensagem.remetente).all()
     
-    for tel, count in mensagens_count:
-        mensagens_por_tel[tel] = mensagens_por_tel.get(tel, 0) + count
-    
-    mensagens_recebidas = db.query(
-        models.Mensagem.destinatario,
-        func.count(models.Mensagem.id)
-    ).filter(
-        models.Mensagem.operacao_id == operacao_id,
-        models.Mensagem.destinatario.isnot(None)
-    ).group_by(models.Mensagem.destinatario).all()
-    
-    for tel, count in mensagens_recebidas:
-        mensagens_por_tel[tel] = mensagens_por_tel.get(tel, 0) + count
+    if janela:
+        comms = rollups.daily_edge_weights(db, operacao_id, inicio, fim)
+        for rem, dest, count in comms:
+            mensagens_por_tel[rem] = mensagens_por_tel.get(rem, 0) + count
+            mensagens_por_tel[dest] = mensagens_por_tel.get(dest, 0) + count
+        # Na janela, só entram os telefones ativos no período
+        telefones = [t for t in telefones if t.numero in mensagens_por_tel]
+    else:
+        frame = analytics.get_frame(db, operacao_id)
+        if frame is not None:
+            # Operação em memória: agregações vetorizadas
+            mensagens_por_tel = frame.phone_totals()
+            comms = frame.pair_counts()
+        else:
+            mensagens_count = db.query(
+                models.Mensagem.remetente,
+                func.count(models.Mensagem.id)
+            ).filter(
+                models.Mensagem.operacao_id == operacao_id,
+                models.Mensagem.remetente.isnot(None)
+            ).group_by(models.Mensagem.remetente).all()
+        
+            for tel, count in mensagens_count:
+                mensagens_por_tel[tel] = mensagens_por_tel.get(tel, 0) + count
+        
+            mensagens_recebidas = db.query(
+                models.Mensagem.destinatario,
+                func.count(models.Mensagem.id)
+            ).filter(
+                models.Mensagem.operacao_id == operacao_id,
+                models.Mensagem.destinatario.isnot(None)
+            ).group_by(models.Mensagem.destinatario).all()
+        
+            for tel, count in mensagens_recebidas:
+                mensagens_por_tel[tel] = mensagens_por_tel.get(tel, 0) + count
+        
+            # Buscar comunicações para identificar conexões com alvos
+            comms = db.query(
+                models.Mensagem.remetente,
+                models.Mensagem.destinatario,
+                func.count(models.Mensagem.id)
+            ).filter(
+                models.Mensagem.operacao_id == operacao_id,
+                models.Mensagem.remetente.isnot(None),
+                models.Mensagem.destinatario.isnot(None)
+            ).group_by(
+                models.Mensagem.remetente,
+                models.Mensagem.destinatario
+            ).all()
     
-    # Buscar comunicações para identificar conexões com alvos
-    comms = db.query(
-        models.Mensagem.remetente,
-        models.Mensagem.destinatario,
-        func.count(models.Mensagem.id)
-    ).filter(
-        models.Mensagem.operacao_id == operacao_id,
-        models.Mensagem.remetente.isnot(None),
-        models.Mensagem.destinatario.isnot(None)
-    ).group_by(
-        models.Mensagem.remetente,
-        models.Mensagem.destinatario
-    ).all()
+    # Métricas de centralidade (histórico completo) como atributos dos nós
+    metricas = {} if janela else centrality.get_centrality(db, operacao_id, comms)
     
     # Identificar quem está conectado a alvos
     conectados_a_alvos = set()
-    for c in comms:
-        if c.remetente in alvos_set:
-            conectados_a_alvos.add(c.destinatario)
-        if c.destinatario in alvos_set:
-            conectados_a_alvos.add(c.remetente)
+    for rem, dest, _ in comms:
+        if rem in alvos_set:
+            conectados_a_alvos.add(dest)
+        if dest in alvos_set:
+            conectados_a_alvos.add(rem)
     
-    nodes = []
-    for t in telefones:
-        # Definir cor baseada na categoria de investigação (Paleta Harmoniosa)
-        color = "#64748B"  # Slate-500 (Padrão/Sem Categoria) - Neutro
-        if t.categoria == 'SUSPEITO':
-            color = "#E11D48"  # Rose-600 (Suspeito) - Alerta mas elegante
-        elif t.categoria == 'TESTEMUNHA':
-            color = "#059669"  # Emerald-600 (Testemunha) - Calmo
-        elif t.categoria == 'VITIMA':
-            color = "#7C3AED"  # Violet-600 (Vítima) - Distinto
-        elif t.categoria == 'OUTRO':
-            color = "#D97706"  # Amber-600 (Outro) - Atenção moderada
-        elif t.tipo == 'ALVO':
-            color = "#E11D48"  # Rose-600 (Alvo legado) - Mesmo que suspeito
-        
-        total_msgs = mensagens_por_tel.get(t.numero, 0)
-        is_target = t.numero in alvos_set
-        connected_to_target = t.numero in conectados_a_alvos and not is_target
-        
-        nodes.append({
-            "data": {
-                "id": t.numero,
-                "label": t.identificacao or t.numero,
-                "identificacao": t.identificacao,
-                "foto": t.foto,
-                "telefone_id": t.id,
-                "type": t.tipo,
-                "categoria": t.categoria,
-                "observacoes": t.observacoes,
-                "total_mensagens": total_msgs,
-                "is_target": is_target,
-                "connected_to_target": connected_to_target,
-                "color": color
-            }
-        })
-        
-    edges = []
-    for c in comms:
-        if c.remetente and c.destinatario:
-            edges.append({
-                "data": {
-                    "source": c.remetente,
-                    "target": c.destinatario,
-                    "weight": c[2]
-                }
-            })
+    # Nós e arestas montados direto em colunas a partir das linhas das consultas
+    numeros = [t.numero for t in telefones]
+    nodes = {
+        "id": numeros,
+        "label": [t.identificacao or t.numero for t in telefones],
+        "identificacao": [t.identificacao for t in telefones],
+        "foto": [t.foto for t in telefones],
+        "telefone_id": [t.id for t in telefones],
+        "type": [t.tipo for t in telefones],
+        "categoria": [t.categoria for t in telefones],
+        "observacoes": [t.observacoes for t in telefones],
+        "total_mensagens": [mensagens_por_tel.get(n, 0) for n in numeros],
+        "is_target": [n in alvos_set for n in numeros],
+        "connected_to_target": [n in conectados_a_alvos and n not in alvos_set for n in numeros],
+        "color": [_phone_color(t.categoria, t.tipo) for t in telefones],
+    }
+    if metricas:
+        linhas = [metricas.get(n) for n in numeros]
+        for key in ("grau_ponderado", "pagerank", "intermediacao", "k_core"):
+            nodes[key] = [m[key] if m else None for m in linhas]
+    
+    edges = _edge_columns([(rem, dest, count) for rem, dest, count in comms if rem and dest])
             
-    return {"elements": {"nodes": nodes, "edges": edges}}
+    return graph_codec.graph_response({"nodes": nodes, "edges": edges}, formato)
+
+@router.get("/{operacao_id}/diff")
+def get_graph_diff(
+    operacao_id: int,
+    inicio_a: str = None,
+    fim_a: str = None,
+    inicio_b: str = None,
+    fim_b: str = None,
+    db: Session = Depends(get_db)
+):
+    """
+    Diferença entre o grafo de duas janelas de tempo (A e B):
+    nós e arestas que surgiram, sumiram ou mudaram de peso.
+    """
+    peso_a = {
+        (rem, dest): count
+        for rem, dest, count in rollups.daily_edge_weights(db, operacao_id, _parse_dia(inicio_a, "inicio_a"), _parse_dia(fim_a, "fim_a"))
+    }
+    peso_b = {
+        (rem, dest): count
+        for rem, dest, count in rollups.daily_edge_weights(db, operacao_id, _parse_dia(inicio_b, "inicio_b"), _parse_dia(fim_b, "fim_b"))
+    }
+    
+    nos_a = {n for par in peso_a for n in par}
+    nos_b = {n for par in peso_b for n in par}
+    
+    novas = [{"source": rem, "target": dest, "weight": w} for (rem, dest), w in peso_b.items() if (rem, dest) not in peso_a]
+    removidas = [{"source": rem, "target": dest, "weight": w} for (rem, dest), w in peso_a.items() if (rem, dest) not in peso_b]
+    alteradas = [
+        {"source": rem, "target": dest, "peso_a": peso_a[(rem, dest)], "peso_b": w, "variacao": w - peso_a[(rem, dest)]}
+        for (rem, dest), w in peso_b.items()
+        if (rem, dest) in peso_a and peso_a[(rem, dest)] != w
+    ]
+    
+    return {
+        "nos": {
+            "novos": sorted(nos_b - nos_a),
+            "removidos": sorted(nos_a - nos_b)
+        },
+        "arestas": {
+            "novas": novas,
+            "removidas": removidas,
+            "alteradas": sorted(alteradas, key=lambda x: abs(x["variacao"]), reverse=True)
+        }
+    }
 
 @router.get("/{operacao_id}/common-ips")
-def get_common_ips_graph(operacao_id: int, db: Session = Depends(get_db)):
+def get_common_ips_graph(operacao_id: int, formato: str = "json", db: Session = Depends(get_db)):
     # Grafo de Telefones conectados a IPs
     # Nós: Telefones (coloridos por categoria) e IPs (Vermelho)
     # Arestas: Telefone usou IP
@@ -130,226 +262,159 @@ def get_common_ips_graph(operacao_id: int, db: Session = Depends(get_db)):
     # 1. Buscar IPs usados na operação
     ips_usados = db.query(models.IP).join(models.Mensagem).filter(models.Mensagem.operacao_id == operacao_id).distinct().all()
     
-    nodes = []
-    ip_ids = set()
-    
-    for ip in ips_usados:
-        nodes.append({
-            "data": {
-                "id": f"ip_{ip.id}",
-                "label": ip.endereco,
-                "type": "IP",
-                "ip_id": ip.id,
-                "endereco": ip.endereco,
-                "provedor": ip.provedor,
-                "pais": ip.pais,
-                "cidade": ip.cidade,
-                "latitude": ip.latitude,
-                "longitude": ip.longitude,
-                "color": "#F43F5E"  # Rose-500 (IP)
-            }
-        })
-        ip_ids.add(ip.id)
-        
     # 2. Buscar telefones que usaram esses IPs
-    conexoes = db.query(
-        models.Mensagem.remetente,
-        models.Mensagem.ip_id,
-        func.count(models.Mensagem.id)
-    ).filter(
-        models.Mensagem.operacao_id == operacao_id,
-        models.Mensagem.ip_id.isnot(None),
-        models.Mensagem.remetente.isnot(None)
-    ).group_by(
-        models.Mensagem.remetente,
-        models.Mensagem.ip_id
-    ).all()
+    frame = analytics.get_frame(db, operacao_id)
+    if frame is not None:
+        conexoes = frame.phone_ip_counts()
+    else:
+        conexoes = db.query(
+            models.Mensagem.remetente,
+            models.Mensagem.ip_id,
+            func.count(models.Mensagem.id)
+        ).filter(
+            models.Mensagem.operacao_id == operacao_id,
+            models.Mensagem.ip_id.isnot(None),
+            models.Mensagem.remetente.isnot(None)
+        ).group_by(
+            models.Mensagem.remetente,
+            models.Mensagem.ip_id
+        ).all()
     
-    telefones_nodes = set()
-    edges = []
-    
-    for conn in conexoes:
-        tel = conn[0]
-        ip_id = conn[1]
-        count = conn[2]
-        
-        if tel not in telefones_nodes:
-            # Buscar dados do telefone
-            telefone_obj = db.query(models.Telefone).filter(
-                models.Telefone.operacao_id == operacao_id,
-                models.Telefone.numero == tel
-            ).first()
-            
-            if telefone_obj:
-                # Cor baseada na categoria (Paleta Harmoniosa)
-                color = "#64748B"  # Slate-500
-                if telefone_obj.categoria == 'SUSPEITO':
-                    color = "#E11D48"  # Rose-600
-                elif telefone_obj.categoria == 'TESTEMUNHA':
-                    color = "#059669"  # Emerald-600
-                elif telefone_obj.categoria == 'VITIMA':
-                    color = "#7C3AED"  # Violet-600
-                elif telefone_obj.categoria == 'OUTRO':
-                    color = "#D97706"  # Amber-600
-                elif telefone_obj.tipo == 'ALVO':
-                    color = "#E11D48"  # Rose-600
-                
-                nodes.append({
-                    "data": {
-                        "id": tel,
-                        "label": telefone_obj.identificacao or tel,
-                        "identificacao": telefone_obj.identificacao,
-                        "foto": telefone_obj.foto,
-                        "telefone_id": telefone_obj.id,
-                        "categoria": telefone_obj.categoria,
-                        "observacoes": telefone_obj.observacoes,
-                        "type": "TELEFONE",
-                        "color": color
-                    }
-                })
-            else:
-                nodes.append({
-                    "data": {
-                        "id": tel,
-                        "label": tel,
-                        "type": "TELEFONE",
-                        "color": "#64748B" # Slate-500
-                    }
-                })
-            telefones_nodes.add(tel)
-            
-        edges.append({
-            "data": {
-                "source": tel,
-                "target": f"ip_{ip_id}",
-                "weight": count
-            }
-        })
-        
-    return {"elements": {"nodes": nodes, "edges": edges}}
+    return graph_codec.graph_response(_ip_phone_graph(db, operacao_id, ips_usados, conexoes), formato)
 
 @router.get("/{operacao_id}/shared-ips")
-def get_shared_ips_graph(operacao_id: int, db: Session = Depends(get_db)):
+def get_shared_ips_graph(operacao_id: int, formato: str = "json", db: Session = Depends(get_db)):
     # Grafo de IPs Compartilhados (usados por 2+ telefones)
     # Útil para identificar infraestrutura compartilhada ou padrões suspeitos
     
     # 1. Buscar IPs com contagem de telefones únicos
-    ip_phone_counts = db.query(
-        models.Mensagem.ip_id,
-        func.count(func.distinct(models.Mensagem.remetente)).label('phone_count')
-    ).filter(
-        models.Mensagem.operacao_id == operacao_id,
-        models.Mensagem.ip_id.isnot(None),
-        models.Mensagem.remetente.isnot(None)
-    ).group_by(
-        models.Mensagem.ip_id
-    ).having(
-        func.count(func.distinct(models.Mensagem.remetente)) > 1  # Mais de 1 telefone
-    ).all()
+    frame = analytics.get_frame(db, operacao_id)
+    if frame is not None:
+        ip_phone_counts = [(ip_id, count) for ip_id, count in frame.ip_sender_counts().items() if count > 1]
+    else:
+        ip_phone_counts = db.query(
+            models.Mensagem.ip_id,
+            func.count(func.distinct(models.Mensagem.remetente)).label('phone_count')
+        ).filter(
+            models.Mensagem.operacao_id == operacao_id,
+            models.Mensagem.ip_id.isnot(None),
+            models.Mensagem.remetente.isnot(None)
+        ).group_by(
+            models.Mensagem.ip_id
+        ).having(
+            func.count(func.distinct(models.Mensagem.remetente)) > 1  # Mais de 1 telefone
+        ).all()
     
     shared_ip_ids = {ip_id for ip_id, _ in ip_phone_counts}
     
     if not shared_ip_ids:
-        return {"elements": {"nodes": [], "edges": []}}
+        return graph_codec.graph_response({"nodes": {}, "edges": {}}, formato)
     
     # 2. Buscar detalhes dos IPs compartilhados
     ips_compartilhados = db.query(models.IP).filter(models.IP.id.in_(shared_ip_ids)).all()
     
-    nodes = []
-    for ip in ips_compartilhados:
-        # Calcular o número de telefones conectados a este IP
-        phone_count = next((count for ip_id, count in ip_phone_counts if ip_id == ip.id), 0)
-        
-        nodes.append({
-            "data": {
-                "id": f"ip_{ip.id}",
-                "label": ip.endereco,
-                "type": "IP",
-                "ip_id": ip.id,
-                "endereco": ip.endereco,
-                "provedor": ip.provedor,
-                "pais": ip.pais,
-                "cidade": ip.cidade,
-                "latitude": ip.latitude,
-                "longitude": ip.longitude,
-                "phone_count": phone_count,  # Número de telefones conectados
-                "color": "#F43F5E"  # Rose-500 (IP)
-            }
-        })
-    
     # 3. Buscar telefones conectados aos IPs compartilhados
-    conexoes = db.query(
-        models.Mensagem.remetente,
-        models.Mensagem.ip_id,
-        func.count(models.Mensagem.id)
-    ).filter(
-        models.Mensagem.operacao_id == operacao_id,
-        models.Mensagem.ip_id.in_(shared_ip_ids),
-        models.Mensagem.remetente.isnot(None)
-    ).group_by(
-        models.Mensagem.remetente,
-        models.Mensagem.ip_id
-    ).all()
+    if frame is not None:
+        conexoes = frame.phone_ip_counts(shared_ip_ids)
+    else:
+        conexoes = db.query(
+            models.Mensagem.remetente,
+            models.Mensagem.ip_id,
+            func.count(models.Mensagem.id)
+        ).filter(
+            models.Mensagem.operacao_id == operacao_id,
+            models.Mensagem.ip_id.in_(shared_ip_ids),
+            models.Mensagem.remetente.isnot(None)
+        ).group_by(
+            models.Mensagem.remetente,
+            models.Mensagem.ip_id
+        ).all()
     
-    telefones_nodes = set()
-    edges = []
-    
-    for conn in conexoes:
-        tel = conn[0]
-        ip_id = conn[1]
-        count = conn[2]
-        
-        if tel not in telefones_nodes:
-            # Buscar dados do telefone
-            telefone_obj = db.query(models.Telefone).filter(
-                models.Telefone.operacao_id == operacao_id,
-                models.Telefone.numero == tel
-            ).first()
-            
-            if telefone_obj:
-                # Cor baseada na categoria
-                color = "#64748B"  # Slate-500
-                if telefone_obj.categoria == 'SUSPEITO':
-                    color = "#E11D48"  # Rose-600
-                elif telefone_obj.categoria == 'TESTEMUNHA':
-                    color = "#059669"  # Emerald-600
-                elif telefone_obj.categoria == 'VITIMA':
-                    color = "#7C3AED"  # Violet-600
-                elif telefone_obj.categoria == 'OUTRO':
-                    color = "#D97706"  # Amber-600
-                elif telefone_obj.tipo == 'ALVO':
-                    color = "#E11D48"  # Rose-600
-                
-                nodes.append({
-                    "data": {
-                        "id": tel,
-                        "label": telefone_obj.identificacao or tel,
-                        "identificacao": telefone_obj.identificacao,
-                        "foto": telefone_obj.foto,
-                        "telefone_id": telefone_obj.id,
-                        "categoria": telefone_obj.categoria,
-                        "observacoes": telefone_obj.observacoes,
-                        "type": "TELEFONE",
-                        "color": color
-                    }
-                })
-            else:
-                nodes.append({
-                    "data": {
-                        "id": tel,
-                        "label": tel,
-                        "type": "TELEFONE",
-                        "color": "#64748B"
-                    }
-                })
-            telefones_nodes.add(tel)
-            
-        edges.append({
-            "data": {
-                "source": tel,
-                "target": f"ip_{ip_id}",
-                "weight": count
+    return graph_codec.graph_response(
+        _ip_phone_graph(db, operacao_id, ips_compartilhados, conexoes, dict(ip_phone_counts)),
+        formato
+    )
+
+@router.get("/{operacao_id}/path")
+def get_connection_paths(
+    operacao_id: int,
+    origem: str,
+    destino: str,
+    k: int = 3,
+    modo: str = "saltos",
+    incluir_ips: bool = True,
+    max_saltos: int = 6,
+    db: Session = Depends(get_db)
+):
+    """
+    Cadeias de conexão entre dois telefones, com a evidência de cada ligação.
+    modo="saltos": menos intermediários; modo="peso": prefere vínculos com mais mensagens.
+    """
+    k = max(1, min(k, 10))
+    max_saltos = max(1, min(max_saltos, 12))
+
+    index = graph_paths.get_graph_index(db, operacao_id)
+    for numero in (origem, destino):
+        if numero not in index.index:
+            raise HTTPException(status_code=404, detail=f"Telefone {numero} não encontrado no grafo da operação")
+
+    caminhos = index.k_shortest_paths(
+        origem, destino, k=k, weighted=(modo == "peso"),
+        incluir_ips=incluir_ips, max_saltos=max_saltos
+    )
+
+    # Buscar dados dos nós envolvidos em uma única consulta por tipo
+    labels = {index.labels[n] for _, nodes, _ in caminhos for n in nodes}
+    ip_ids = {int(label[3:]) for label in labels if label.startswith("ip_")}
+    numeros = labels - {f"ip_{ip_id}" for ip_id in ip_ids}
+
+    telefones = {}
+    if numeros:
+        telefones = {t.numero: t for t in db.query(models.Telefone).filter(
+            models.Telefone.operacao_id == operacao_id,
+            models.Telefone.numero.in_(numeros)
+        ).all()}
+    ips = {}
+    if ip_ids:
+        ips = {ip.id: ip for ip in db.query(models.IP).filter(models.IP.id.in_(ip_ids)).all()}
+
+    def node_data(label):
+        if label.startswith("ip_"):
+            ip = ips.get(int(label[3:]))
+            return {
+                "id": label,
+                "label": ip.endereco if ip else label,
+                "type": "IP",
+                "provedor": ip.provedor if ip else None,
+                "cidade": ip.cidade if ip else None
             }
+        tel = telefones.get(label)
+        return {
+            "id": label,
+            "label": (tel.identificacao if tel else None) or label,
+            "type": "TELEFONE",
+            "categoria": tel.categoria if tel else None
+        }
+
+    result = []
+    for custo, nodes, edges in caminhos:
+        arestas = []
+        for i, e in enumerate(edges):
+            first = index.edge_first[e]
+            last = index.edge_last[e]
+            arestas.append({
+                "source": index.labels[nodes[i]],
+                "target": index.labels[nodes[i + 1]],
+                "tipo": "IP" if index.edge_kind[e] == graph_paths.EDGE_IP else "MENSAGEM",
+                "mensagens": index.edge_count[e],
+                "primeira": first.isoformat() if first else None,
+                "ultima": last.isoformat() if last else None
+            })
+        result.append({
+            "saltos": len(edges),
+            "custo": round(custo, 6),
+            "nos": [node_data(index.labels[n]) for n in nodes],
+            "arestas": arestas
         })
-        
-    return {"elements": {"nodes": nodes, "edges": edges}}
+
+    return {"origem": origem, "destino": destino, "modo": modo, "caminhos": result}
@@ -1,94 +1,208 @@
-from fastapi import APIRouter, Depends, HTTPException
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, Depends, HTTPException, Header, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from typing import Optional
 from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy import func, extract, case, union_all, select, and_
 from datetime import datetime
 from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
+from contextlib import contextmanager
+from threading import Lock
 import backend.models as models
-from backend.database import get_db
-from reportlab.lib.pagesizes import A4
+from backend.database import get_db, SessionLocal
+from backend.services import analytics, centrality
+from backend.services.cache import OperationCache, source_versions
+from backend.services.report_store import report_store, fingerprint
+from backend.services.pdf_stream import pdf_streaming_response, tee_groups
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, PageBreak
+from reportlab.platypus import Paragraph, Spacer, Table, TableStyle
 from reportlab.lib.units import cm
 from reportlab.lib import colors
 import os
-import tempfile
 
 router = APIRouter(
     prefix="/intelligence",
     tags=["intelligence"],
 )
 
-def analyze_network(db: Session, operacao_id: int):
-    """Análise de rede social: hubs, grau de centralidade"""
-    # Buscar todas as comunicações
-    comms = db.query(
-        models.Mensagem.remetente,
-        models.Mensagem.destinatario,
-        func.count(models.Mensagem.id).label('count')
+# Nomes dos dias (mesmos de strftime('%A')) indexados como o dow do PostgreSQL: 0 = domingo
+WEEKDAY_NAMES = ['Sunday', 'Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday']
+
+
+# Análises aditivas (contagens): o estado cobre as mensagens até um id e, depois de uma
+# importação, só as mensagens acima dele são lidas e somadas. As demais dependem do conjunto
+# inteiro (centralidade, país predominante, ponto médio do período) e são recalculadas.
+def _collect_stats(db: Session, filters, state):
+    ips = state.setdefault("ips", set())
+    ips.update(ip_id for (ip_id,) in db.query(models.Mensagem.ip_id).filter(
+        *filters, models.Mensagem.ip_id.isnot(None)
+    ).distinct())
+
+
+def _collect_temporal(db: Session, filters, state):
+    dated = [*filters, models.Mensagem.data_hora.isnot(None)]
+    inicio, fim = db.query(func.min(models.Mensagem.data_hora), func.max(models.Mensagem.data_hora)).filter(*dated).first()
+    if inicio is not None:
+        state["inicio"] = min(state.get("inicio") or inicio, inicio)
+        state["fim"] = max(state.get("fim") or fim, fim)
+
+    buckets = state.setdefault("buckets", Counter())
+    hora = extract('hour', models.Mensagem.data_hora)
+    dow = extract('dow', models.Mensagem.data_hora)
+    for h, d, count in db.query(hora, dow, func.count(models.Mensagem.id)).filter(*dated).group_by(hora, dow):
+        buckets[(int(h), int(d))] += count
+
+
+def _collect_geographic(db: Session, filters, state):
+    usage = state.setdefault("ips", Counter())
+    for ip_id, count in db.query(models.Mensagem.ip_id, func.count(models.Mensagem.id)).filter(
+        *filters, models.Mensagem.ip_id.isnot(None)
+    ).group_by(models.Mensagem.ip_id):
+        usage[ip_id] += count
+
+
+def _collect_rankings(db: Session, filters, state):
+    tipos = state.setdefault("tipos", Counter())
+    for tipo, count in db.query(models.Mensagem.tipo_mensagem, func.count(models.Mensagem.id)).filter(
+        *filters, models.Mensagem.tipo_mensagem.isnot(None)
+    ).group_by(models.Mensagem.tipo_mensagem):
+        tipos[tipo] += count
+
+    pares = state.setdefault("pares", Counter())
+    for rem, dest, count in db.query(
+        models.Mensagem.remetente, models.Mensagem.destinatario, func.count(models.Mensagem.id)
     ).filter(
-        models.Mensagem.operacao_id == operacao_id,
+        *filters,
         models.Mensagem.remetente.isnot(None),
         models.Mensagem.destinatario.isnot(None)
-    ).group_by(
-        models.Mensagem.remetente,
-        models.Mensagem.destinatario
-    ).all()
-    
-    # Calcular grau (número de conexões únicas)
-    connections = defaultdict(set)
-    for rem, dest, count in comms:
-        connections[rem].add(dest)
-        connections[dest].add(rem)
+    ).group_by(models.Mensagem.remetente, models.Mensagem.destinatario):
+        pares[(rem, dest)] += count
+
+
+PARTIAL_COLLECTORS = {
+    "stats": _collect_stats,
+    "temporal": _collect_temporal,
+    "geographic": _collect_geographic,
+    "rankings": _collect_rankings,
+}
+
+_partial_states = OperationCache(max_entries=16 * len(PARTIAL_COLLECTORS))
+_partial_locks = {}
+_partial_locks_guard = Lock()
+
+
+@contextmanager
+def partial_state(db: Session, operacao_id: int, name: str):
+    """
+    Estado da análise aditiva atualizado até a última mensagem da operação (o lock
+    fica com quem monta o resultado). Se o número de mensagens até o id já contado mudou
+    (operação recriada, mensagens removidas, importação concorrente que gravou ids
+    menores depois), o estado é refeito do zero.
+    """
+    key = (operacao_id, name)
+    with _partial_locks_guard:
+        lock = _partial_locks.setdefault(key, Lock())
+
+    with lock:
+        da_operacao = models.Mensagem.operacao_id == operacao_id
+        ate_id = db.query(func.max(models.Mensagem.id)).filter(da_operacao).scalar() or 0
+
+        state = _partial_states.get(key, None)
+        if state is not None:
+            contadas = db.query(func.count(models.Mensagem.id)).filter(
+                da_operacao, models.Mensagem.id <= state["ate_id"]
+            ).scalar()
+            if contadas != state["mensagens"]:
+                state = None
+        if state is None:
+            state = {"ate_id": 0, "mensagens": 0}
+
+        if ate_id > state["ate_id"]:
+            filters = [da_operacao, models.Mensagem.id > state["ate_id"], models.Mensagem.id <= ate_id]
+            PARTIAL_COLLECTORS[name](db, filters, state)
+            state["mensagens"] += db.query(func.count(models.Mensagem.id)).filter(*filters).scalar()
+            state["ate_id"] = ate_id
+        _partial_states.put(key, None, state)
+        yield state
+
+
+def analyze_network(db: Session, operacao_id: int):
+    """Análise de rede social: hubs e centralidade (grau, PageRank, intermediação, k-core)"""
+    metrics = centrality.get_centrality(db, operacao_id)
     
     # Top hubs (telefones com mais conexões)
-    hubs = sorted(
-        [(tel, len(conns)) for tel, conns in connections.items()],
-        key=lambda x: x[1],
-        reverse=True
-    )[:10]
+    hubs = sorted(metrics.items(), key=lambda x: x[1]["grau"], reverse=True)[:10]
     
-    # Buscar informações dos telefones
-    hubs_detailed = []
-    for telefone, conexoes in hubs:
-        tel_obj = db.query(models.Telefone).filter(
+    # Buscar informações dos telefones (uma única consulta)
+    tel_objs = {}
+    if hubs:
+        tel_objs = {t.numero: t for t in db.query(models.Telefone).filter(
             models.Telefone.operacao_id == operacao_id,
-            models.Telefone.numero == telefone
-        ).first()
-        
+            models.Telefone.numero.in_([tel for tel, _ in hubs])
+        ).all()}
+    
+    hubs_detailed = []
+    for telefone, m in hubs:
+        tel_obj = tel_objs.get(telefone)
         hubs_detailed.append({
             "telefone": telefone,
             "identificacao": tel_obj.identificacao if tel_obj else None,
             "categoria": tel_obj.categoria if tel_obj else None,
-            "conexoes": conexoes,
-            "grau": conexoes / max(len(connections), 1)
+            "conexoes": m["grau"],
+            "grau": m["grau"] / max(len(metrics), 1),
+            "grau_ponderado": m["grau_ponderado"],
+            "pagerank": m["pagerank"],
+            "intermediacao": m["intermediacao"],
+            "k_core": m["k_core"]
         })
     
-    return {"hubs": hubs_detailed, "total_nodes": len(connections)}
+    def top(metric):
+        ranked = sorted(metrics.items(), key=lambda x: x[1][metric], reverse=True)[:10]
+        return [{"telefone": tel, "valor": m[metric]} for tel, m in ranked]
+    
+    return {
+        "hubs": hubs_detailed,
+        "total_nodes": len(metrics),
+        "centralidade": {
+            "pagerank": top("pagerank"),
+            "intermediacao": top("intermediacao"),
+            "grau_ponderado": top("grau_ponderado"),
+            "k_core_max": max((m["k_core"] for m in metrics.values()), default=0)
+        }
+    }
 
 def analyze_temporal(db: Session, operacao_id: int):
-    """Análise de padrões temporais"""
-    mensagens = db.query(models.Mensagem).filter(
-        models.Mensagem.operacao_id == operacao_id,
-        models.Mensagem.data_hora.isnot(None)
-    ).all()
-    
-    if not mensagens:
+    """Análise de padrões temporais - agregada por (hora, dia da semana), sem carregar mensagens"""
+    frame = analytics.get_frame(db, operacao_id)
+    if frame is not None:
+        time_range = frame.time_range()
+        buckets = frame.hour_dow_counts()
+    else:
+        with partial_state(db, operacao_id, "temporal") as state:
+            time_range = (state["inicio"], state["fim"]) if state.get("inicio") else None
+            buckets = [(h, d, count) for (h, d), count in state.get("buckets", {}).items()]
+    
+    if time_range is None:
         return {"error": "Sem mensagens com data/hora"}
     
+    hour_counts = Counter()
+    weekday_counts = Counter()
+    for h, d, count in buckets:
+        hour_counts[h] += count
+        weekday_counts[WEEKDAY_NAMES[d]] += count
+    
     # Horários de pico
-    hour_counts = Counter([msg.data_hora.hour for msg in mensagens])
     pico_horario = hour_counts.most_common(1)[0] if hour_counts else (0, 0)
     
     # Dias da semana mais ativos
-    weekday_counts = Counter([msg.data_hora.strftime('%A') for msg in mensagens])
     dia_mais_ativo = weekday_counts.most_common(1)[0] if weekday_counts else ('', 0)
     
     # Primeiro e último registro
-    datas = [msg.data_hora for msg in mensagens]
     periodo = {
-        "inicio": min(datas).strftime('%d/%m/%Y %H:%M'),
-        "fim": max(datas).strftime('%d/%m/%Y %H:%M')
+        "inicio": time_range[0].strftime('%d/%m/%Y %H:%M'),
+        "fim": time_range[1].strftime('%d/%m/%Y %H:%M')
     }
     
     return {
@@ -100,21 +214,16 @@ def analyze_temporal(db: Session, operacao_id: int):
 
 def analyze_geographic(db: Session, operacao_id: int):
     """Inteligência geográfica: IPs, provedores, regiões"""
-    ip_usage = db.query(
-        models.IP.endereco,
-        models.IP.pais,
-        models.IP.cidade,
-        models.IP.provedor,
-        func.count(models.Mensagem.id).label('mensagens')
-    ).join(
-        models.Mensagem
-    ).filter(
-        models.Mensagem.operacao_id == operacao_id
-    ).group_by(
-        models.IP.id
-    ).order_by(
-        func.count(models.Mensagem.id).desc()
-    ).limit(10).all()
+    # Mensagens por IP vêm do estado incremental; os dados do IP (geolocalização) são lidos na hora
+    with partial_state(db, operacao_id, "geographic") as state:
+        top = sorted(state.get("ips", {}).items(), key=lambda x: (-x[1], x[0]))[:10]
+    ips = {}
+    if top:
+        ips = {ip.id: ip for ip in db.query(models.IP).filter(models.IP.id.in_([ip_id for ip_id, _ in top]))}
+    ip_usage = [
+        (ips[ip_id].endereco, ips[ip_id].pais, ips[ip_id].cidade, ips[ip_id].provedor, count)
+        for ip_id, count in top if ip_id in ips
+    ]
     
     # Top provedores
     provedor_counts = defaultdict(int)
@@ -159,34 +268,16 @@ def analyze_top_rankings(db: Session, operacao_id: int):
         models.Telefone.total_mensagens.desc()
     ).limit(10).all()
     
-    # Top tipos de mensagem
-    tipo_counts = db.query(
-        models.Mensagem.tipo_mensagem,
-        func.count(models.Mensagem.id)
-    ).filter(
-        models.Mensagem.operacao_id == operacao_id,
-        models.Mensagem.tipo_mensagem.isnot(None)
-    ).group_by(
-        models.Mensagem.tipo_mensagem
-    ).order_by(
-        func.count(models.Mensagem.id).desc()
-    ).all()
+    frame = analytics.get_frame(db, operacao_id)
     
-    # Top conexões (pares de telefones)
-    top_connections = db.query(
-        models.Mensagem.remetente,
-        models.Mensagem.destinatario,
-        func.count(models.Mensagem.id).label('msgs')
-    ).filter(
-        models.Mensagem.operacao_id == operacao_id,
-        models.Mensagem.remetente.isnot(None),
-        models.Mensagem.destinatario.isnot(None)
-    ).group_by(
-        models.Mensagem.remetente,
-        models.Mensagem.destinatario
-    ).order_by(
-        func.count(models.Mensagem.id).desc()
-    ).limit(10).all()
+    # Top tipos de mensagem e top conexões (pares de telefones)
+    if frame is not None:
+        tipo_counts = sorted(frame.type_counts(include_null=False).items(), key=lambda x: x[1], reverse=True)
+        top_connections = sorted(frame.pair_counts(), key=lambda x: x[2], reverse=True)[:10]
+    else:
+        with partial_state(db, operacao_id, "rankings") as state:
+            tipo_counts = state.get("tipos", Counter()).most_common()
+            top_connections = [(rem, dest, count) for (rem, dest), count in state.get("pares", Counter()).most_common(10)]
     
     return {
         "telefones_ativos": [
@@ -214,33 +305,39 @@ def analyze_top_rankings(db: Session, operacao_id: int):
 
 def find_unregistered_phones(db: Session, operacao_id: int):
     """Encontrar telefones que aparecem nas mensagens mas não estão cadastrados"""
-    # Telefones cadastrados
-    registered = {t.numero for t in db.query(models.Telefone).filter(
-        models.Telefone.operacao_id == operacao_id
-    ).all()}
-    
-    # Telefones nas mensagens
-    in_messages = set()
-    msgs = db.query(models.Mensagem).filter(
-        models.Mensagem.operacao_id == operacao_id
-    ).all()
-    
-    for msg in msgs:
-        if msg.remetente:
-            in_messages.add(msg.remetente)
-        if msg.destinatario:
-            in_messages.add(msg.destinatario)
-    
-    # Não cadastrados
-    unregistered = in_messages - registered
-    
-    # Contar aparições
-    unregistered_counts = Counter()
-    for msg in msgs:
-        if msg.remetente in unregistered:
-            unregistered_counts[msg.remetente] += 1
-        if msg.destinatario in unregistered:
-            unregistered_counts[msg.destinatario] += 1
+    # Aparições como remetente ou destinatário (UNION ALL)
+    envolvidos = union_all(
+        select(models.Mensagem.remetente.label('numero')).where(
+            models.Mensagem.operacao_id == operacao_id,
+            models.Mensagem.remetente.isnot(None),
+            models.Mensagem.remetente != ''
+        ),
+        select(models.Mensagem.destinatario.label('numero')).where(
+            models.Mensagem.operacao_id == operacao_id,
+            models.Mensagem.destinatario.isnot(None),
+            models.Mensagem.destinatario != ''
+        )
+    ).subquery()
+    
+    # Anti-join com os telefones cadastrados: só os 20 mais frequentes voltam do banco
+    aparicoes = func.count().label('aparicoes')
+    unregistered = db.query(
+        envolvidos.c.numero,
+        aparicoes
+    ).outerjoin(
+        models.Telefone,
+        and_(
+            models.Telefone.operacao_id == operacao_id,
+            models.Telefone.numero == envolvidos.c.numero
+        )
+    ).filter(
+        models.Telefone.id.is_(None)
+    ).group_by(
+        envolvidos.c.numero
+    ).order_by(
+        aparicoes.desc(),
+        envolvidos.c.numero
+    ).limit(20).all()
     
     return [
         {
@@ -248,7 +345,7 @@ def find_unregistered_phones(db: Session, operacao_id: int):
             "aparicoes": count,
             "sugestao": "Adicionar à investigação" if count > 5 else "Contato secundário"
         }
-        for tel, count in unregistered_counts.most_common(20)
+        for tel, count in unregistered
     ]
 
 def analyze_shared_terminals(db: Session, operacao_id: int):
@@ -390,61 +487,90 @@ def analyze_period_comparison(db: Session, operacao_id: int):
     """
     Compara comportamento entre dois períodos (primeira metade vs segunda metade da investigação).
     Identifica mudanças de padrão que podem indicar eventos significativos.
+    Tudo é calculado com agregações agrupadas por período no banco.
     """
-    # Buscar todas as mensagens com data
-    mensagens = db.query(models.Mensagem).filter(
+    base_filter = [
         models.Mensagem.operacao_id == operacao_id,
         models.Mensagem.data_hora.isnot(None)
-    ).order_by(models.Mensagem.data_hora).all()
+    ]
     
-    if not mensagens or len(mensagens) < 10:
-        return {"error": "Dados insuficientes para comparação"}
+    total, data_inicio, data_fim = db.query(
+        func.count(models.Mensagem.id),
+        func.min(models.Mensagem.data_hora),
+        func.max(models.Mensagem.data_hora)
+    ).filter(*base_filter).first()
     
-    # Encontrar ponto médio temporal
-    datas = [msg.data_hora for msg in mensagens]
-    data_inicio = min(datas)
-    data_fim = max(datas)
+    if not total or total < 10:
+        return {"error": "Dados insuficientes para comparação"}
     
     # Calcular ponto médio
     delta = data_fim - data_inicio
     data_meio = data_inicio + delta / 2
     
-    # Dividir mensagens em dois períodos
-    periodo1 = [msg for msg in mensagens if msg.data_hora < data_meio]
-    periodo2 = [msg for msg in mensagens if msg.data_hora >= data_meio]
+    # 1 = primeira metade, 2 = segunda metade
+    periodo = case((models.Mensagem.data_hora < data_meio, 1), else_=2)
+    
+    resumo = {
+        p: {"total": count, "inicio": inicio, "fim": fim}
+        for p, count, inicio, fim in db.query(
+            periodo,
+            func.count(models.Mensagem.id),
+            func.min(models.Mensagem.data_hora),
+            func.max(models.Mensagem.data_hora)
+        ).filter(*base_filter).group_by(periodo).all()
+    }
     
-    if not periodo1 or not periodo2:
+    if 1 not in resumo or 2 not in resumo:
         return {"error": "Não foi possível dividir em dois períodos"}
     
-    # Função auxiliar para analisar um período
-    def analyze_period(msgs):
-        # Contatos únicos
-        remetentes = {msg.remetente for msg in msgs if msg.remetente}
-        destinatarios = {msg.destinatario for msg in msgs if msg.destinatario}
-        contatos_unicos = len(remetentes | destinatarios)
-        
+    hora = extract('hour', models.Mensagem.data_hora)
+    horas = defaultdict(Counter)
+    for p, h, count in db.query(periodo, hora, func.count(models.Mensagem.id)).filter(
+        *base_filter
+    ).group_by(periodo, hora).all():
+        horas[p][int(h)] = count
+    
+    tipos = defaultdict(Counter)
+    for p, tipo, count in db.query(periodo, models.Mensagem.tipo_mensagem, func.count(models.Mensagem.id)).filter(
+        *base_filter,
+        models.Mensagem.tipo_mensagem.isnot(None)
+    ).group_by(periodo, models.Mensagem.tipo_mensagem).all():
+        tipos[p][tipo] = count
+    
+    # Contatos únicos: remetentes e destinatários do período
+    envolvidos = union_all(
+        select(periodo.label('periodo'), models.Mensagem.remetente.label('numero')).where(
+            *base_filter, models.Mensagem.remetente.isnot(None)
+        ),
+        select(periodo.label('periodo'), models.Mensagem.destinatario.label('numero')).where(
+            *base_filter, models.Mensagem.destinatario.isnot(None)
+        )
+    ).subquery()
+    contatos = dict(db.query(
+        envolvidos.c.periodo,
+        func.count(func.distinct(envolvidos.c.numero))
+    ).group_by(envolvidos.c.periodo).all())
+    
+    # Função auxiliar para montar a análise de um período
+    def analyze_period(p):
         # Mensagens por dia (média)
-        dias_span = (max(msg.data_hora for msg in msgs) - min(msg.data_hora for msg in msgs)).days + 1
-        msgs_por_dia = len(msgs) / max(dias_span, 1)
+        dias_span = (resumo[p]["fim"] - resumo[p]["inicio"]).days + 1
+        msgs_por_dia = resumo[p]["total"] / max(dias_span, 1)
         
         # Horários mais ativos (distribuição)
-        hours = Counter([msg.data_hora.hour for msg in msgs])
-        horarios_pico = hours.most_common(3)
-        
-        # Tipos de mensagem
-        tipos = Counter([msg.tipo_mensagem for msg in msgs if msg.tipo_mensagem])
+        horarios_pico = sorted(horas[p].items(), key=lambda x: (-x[1], x[0]))[:3]
         
         return {
-            "total_mensagens": len(msgs),
-            "contatos_unicos": contatos_unicos,
+            "total_mensagens": resumo[p]["total"],
+            "contatos_unicos": contatos.get(p, 0),
             "msgs_por_dia": round(msgs_por_dia, 1),
             "horarios_pico": [{"hora": h, "msgs": c} for h, c in horarios_pico],
-            "tipos_mensagem": dict(tipos.most_common(5))
+            "tipos_mensagem": dict(tipos[p].most_common(5))
         }
     
     # Analisar ambos os períodos
-    analise_p1 = analyze_period(periodo1)
-    analise_p2 = analyze_period(periodo2)
+    analise_p1 = analyze_period(1)
+    analise_p2 = analyze_period(2)
     
     # Calcular variações percentuais
     def calc_variacao(val1, val2):
@@ -473,11 +599,11 @@ def analyze_period_comparison(db: Session, operacao_id: int):
     
     return {
         "periodo1": {
-            "datas": f"{periodo1[0].data_hora.strftime('%d/%m/%Y')} a {periodo1[-1].data_hora.strftime('%d/%m/%Y')}",
+            "datas": f"{resumo[1]['inicio'].strftime('%d/%m/%Y')} a {resumo[1]['fim'].strftime('%d/%m/%Y')}",
             "analise": analise_p1
         },
         "periodo2": {
-            "datas": f"{periodo2[0].data_hora.strftime('%d/%m/%Y')} a {periodo2[-1].data_hora.strftime('%d/%m/%Y')}",
+            "datas": f"{resumo[2]['inicio'].strftime('%d/%m/%Y')} a {resumo[2]['fim'].strftime('%d/%m/%Y')}",
             "analise": analise_p2
         },
         "variacoes": variacoes,
@@ -485,37 +611,147 @@ def analyze_period_comparison(db: Session, operacao_id: int):
         "data_divisao": data_meio.strftime('%d/%m/%Y')
     }
 
+def report_stats(db: Session, operacao_id: int):
+    """Estatísticas gerais do relatório"""
+    with partial_state(db, operacao_id, "stats") as state:
+        total_mensagens, total_ips = state["mensagens"], len(state.get("ips", ()))
+    return {
+        "total_telefones": db.query(models.Telefone).filter(models.Telefone.operacao_id == operacao_id).count(),
+        "total_mensagens": total_mensagens,
+        "total_ips": total_ips
+    }
+
+
+# Análises que compõem o relatório (todas independentes entre si) e as fontes de dados que leem:
+# mensagens (importações), telefones (cadastro/edição) e ips (geolocalização).
+# Depois de uma importação, stats, temporal, geographic e rankings só leem as mensagens novas (partial_state)
+REPORT_ANALYSES = {
+    "stats": (report_stats, ("mensagens", "telefones")),
+    "network": (analyze_network, ("mensagens", "telefones")),
+    "temporal": (analyze_temporal, ("mensagens",)),
+    "geographic": (analyze_geographic, ("mensagens", "ips")),
+    "rankings": (analyze_top_rankings, ("mensagens", "telefones")),
+    "unregistered": (find_unregistered_phones, ("mensagens", "telefones")),
+    "shared_terminals": (analyze_shared_terminals, ("mensagens", "telefones", "ips")),
+    "geo_anomalies": (analyze_geographic_anomalies, ("mensagens", "ips")),
+    "period_comparison": (analyze_period_comparison, ("mensagens",)),
+}
+
+# Pool compartilhado entre requisições: limita as conexões abertas pelos relatórios
+_report_pool = ThreadPoolExecutor(
+    max_workers=int(os.getenv("REPORT_WORKERS", "8")),
+    thread_name_prefix="intelligence"
+)
+
+# Resultados por (operação, análise), válidos enquanto as fontes da análise não mudarem
+_analysis_cache = OperationCache(max_entries=16 * len(REPORT_ANALYSES))
+
+
+def analysis_version(name: str, versions):
+    """Versões das fontes lidas pela análise"""
+    return tuple(versions[source] for source in REPORT_ANALYSES[name][1])
+
+
+def _run_analysis(analysis, operacao_id: int):
+    """Executa uma análise com sessão própria do pool de conexões"""
+    db = SessionLocal()
+    try:
+        return analysis(db, operacao_id)
+    finally:
+        db.close()
+
+
+def run_report_analyses(operacao_id: int, versions, names=None):
+    """
+    Devolve {nome: resultado}. Só as análises cujas fontes mudaram são recalculadas,
+    em paralelo; as demais vêm do cache.
+    """
+    names = list(REPORT_ANALYSES) if names is None else names
+    results = {}
+    futures = {}
+    for name in names:
+        version = analysis_version(name, versions)
+        cached = _analysis_cache.get((operacao_id, name), version)
+        if cached is not None:
+            results[name] = cached
+        else:
+            futures[name] = (version, _report_pool.submit(_run_analysis, REPORT_ANALYSES[name][0], operacao_id))
+
+    for name, (version, future) in futures.items():
+        results[name] = _analysis_cache.put((operacao_id, name), version, future.result())
+    return results
+
+
+@router.get("/{operacao_id}/analysis/{name}")
+def get_analysis(
+    operacao_id: int,
+    name: str,
+    if_none_match: Optional[str] = Header(None),
+    db: Session = Depends(get_db)
+):
+    """
+    Resultado de uma análise do relatório em JSON (mesmo cache usado pelo PDF).
+    O ETag muda junto com as fontes de dados da análise; If-None-Match devolve 304.
+    """
+    if name not in REPORT_ANALYSES:
+        raise HTTPException(status_code=404, detail=f"Análise desconhecida. Disponíveis: {', '.join(REPORT_ANALYSES)}")
+
+    operacao = db.query(models.Operacao.id).filter(models.Operacao.id == operacao_id).first()
+    if not operacao:
+        raise HTTPException(status_code=404, detail="Operação não encontrada")
+
+    versions = source_versions(db, operacao_id)
+    etag = f'"{name}-{fingerprint(analysis_version(name, versions))}"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+
+    if if_none_match and etag in [t.strip() for t in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+
+    result = run_report_analyses(operacao_id, versions, names=[name])[name]
+    return JSONResponse(content=jsonable_encoder(result), headers=headers)
+
+
 @router.get("/{operacao_id}/report")
 def generate_intelligence_report(operacao_id: int, db: Session = Depends(get_db)):
-    """Gera relatório de inteligência completo em PDF"""
+    """
+    Gera relatório de inteligência completo em PDF.
+    As seções ficam no report_store por versão dos dados; a capa (com a data de geração)
+    é montada a cada pedido e as páginas das seções são copiadas logo depois dela. Sem
+    artefato, as seções são montadas e enviadas uma a uma enquanto o artefato é gravado.
+    """
     # Buscar operação
     operacao = db.query(models.Operacao).filter(models.Operacao.id == operacao_id).first()
     if not operacao:
         raise HTTPException(status_code=404, detail="Operação não encontrada")
     
-    # Estatísticas gerais
-    stats = {
-        "total_telefones": db.query(models.Telefone).filter(models.Telefone.operacao_id == operacao_id).count(),
-        "total_mensagens": db.query(models.Mensagem).filter(models.Mensagem.operacao_id == operacao_id).count(),
-        "total_ips": db.query(models.IP).join(models.Mensagem).filter(models.Mensagem.operacao_id == operacao_id).distinct().count()
-    }
-    
-    # Executar análises
-    network_analysis = analyze_network(db, operacao_id)
-    temporal_analysis = analyze_temporal(db, operacao_id)
-    geographic_analysis = analyze_geographic(db, operacao_id)
-    rankings = analyze_top_rankings(db, operacao_id)
-    unregistered = find_unregistered_phones(db, operacao_id)
-    shared_terminals = analyze_shared_terminals(db, operacao_id)
-    geo_anomalies = analyze_geographic_anomalies(db, operacao_id)
-    period_comparison = analyze_period_comparison(db, operacao_id)
-    
-    # Gerar PDF
-    temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.pdf')
-    pdf_path = temp_file.name
-    temp_file.close()
-    
-    doc = SimpleDocTemplate(pdf_path, pagesize=A4)
+    versions = source_versions(db, operacao_id)
+    key = fingerprint(versions)
+
+    # Seções já geradas para estas versões dos dados
+    sections_path = report_store.get(operacao_id, key)
+    if sections_path is None:
+        # Cada seção é montada, enviada e gravada no report_store antes da seguinte
+        results = run_report_analyses(operacao_id, versions)
+        sections = report_store.save_iter(operacao_id, key, lambda f: tee_groups(_report_sections(results), f))
+    else:
+        results = run_report_analyses(operacao_id, versions, names=COVER_ANALYSES)
+        sections = [sections_path]
+
+    return pdf_streaming_response(
+        chain([_report_cover(operacao.nome, results)], sections),
+        f"Relatorio_Inteligencia_{operacao.nome.replace(' ', '_')}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
+    )
+
+
+# Análises usadas na capa (sumário executivo)
+COVER_ANALYSES = ["stats", "temporal"]
+
+
+def _report_cover(nome: str, results):
+    """Capa do relatório: título, data de geração e sumário executivo"""
+    stats = results["stats"]
+    temporal_analysis = results["temporal"]
+
     story = []
     styles = getSampleStyleSheet()
     
@@ -531,7 +767,7 @@ def generate_intelligence_report(operacao_id: int, db: Session = Depends(get_db)
     
     # Título
     story.append(Paragraph(f"RELATÓRIO DE INTELIGÊNCIA", title_style))
-    story.append(Paragraph(f"Operação: {operacao.nome}", styles['Heading2']))
+    story.append(Paragraph(f"Operação: {nome}", styles['Heading2']))
     story.append(Paragraph(f"Data de Geração: {datetime.now().strftime('%d/%m/%Y %H:%M')}", styles['Normal']))
     story.append(Spacer(1, 1*cm))
     
@@ -555,7 +791,25 @@ def generate_intelligence_report(operacao_id: int, db: Session = Depends(get_db)
         ('GRID', (0, 0), (-1, -1), 1, colors.black)
     ]))
     story.append(t)
-    story.append(PageBreak())
+    return story
+
+
+def _report_sections(results):
+    """
+    Seções do relatório (tudo depois da capa) a partir dos resultados das análises.
+    Gerador: cada item é um grupo de páginas, montado só quando o anterior já foi enviado.
+    """
+    network_analysis = results["network"]
+    temporal_analysis = results["temporal"]
+    geographic_analysis = results["geographic"]
+    rankings = results["rankings"]
+    unregistered = results["unregistered"]
+    shared_terminals = results["shared_terminals"]
+    geo_anomalies = results["geo_anomalies"]
+    period_comparison = results["period_comparison"]
+
+    story = []
+    styles = getSampleStyleSheet()
     
     # Análise de Rede Social
     story.append(Paragraph("ANÁLISE DE REDE SOCIAL", styles['Heading2']))
@@ -563,17 +817,19 @@ def generate_intelligence_report(operacao_id: int, db: Session = Depends(get_db)
     story.append(Spacer(1, 0.5*cm))
     story.append(Paragraph("Top 10 Hubs (Telefones Mais Conectados):", styles['Heading3']))
     
-    hub_data = [["#", "Telefone", "Identificação", "Categoria", "Conexões"]]
+    hub_data = [["#", "Telefone", "Identificação", "Categoria", "Conexões", "PageRank", "k-core"]]
     for i, hub in enumerate(network_analysis['hubs'][:10], 1):
         hub_data.append([
             str(i),
             hub['telefone'],
             Paragraph(hub['identificacao'] or 'N/A', styles['Normal']), # Wrap text
             hub['categoria'] or 'N/A',
-            str(hub['conexoes'])
+            str(hub['conexoes']),
+            f"{hub['pagerank']:.4f}",
+            str(hub['k_core'])
         ])
     
-    t = Table(hub_data, colWidths=[1*cm, 3.5*cm, 5*cm, 3*cm, 2.5*cm])
+    t = Table(hub_data, colWidths=[1*cm, 3.2*cm, 3.8*cm, 2.4*cm, 1.9*cm, 2.1*cm, 1.6*cm])
     t.setStyle(TableStyle([
         ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#1e3a8a')),
         ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
@@ -584,7 +840,26 @@ def generate_intelligence_report(operacao_id: int, db: Session = Depends(get_db)
         ('GRID', (0, 0), (-1, -1), 1, colors.black)
     ]))
     story.append(t)
-    story.append(PageBreak())
+    story.append(Spacer(1, 0.5*cm))
+    
+    # Intermediários: quem mais aparece nos caminhos entre outros telefones
+    story.append(Paragraph("Top 10 Intermediários (Centralidade de Intermediação):", styles['Heading3']))
+    bridge_data = [["#", "Telefone", "Intermediação"]]
+    for i, item in enumerate(network_analysis['centralidade']['intermediacao'], 1):
+        bridge_data.append([str(i), item['telefone'], f"{item['valor']:.4f}"])
+    
+    t = Table(bridge_data, colWidths=[1*cm, 5*cm, 4*cm])
+    t.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#1e3a8a')),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, -1), 9),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black)
+    ]))
+    story.append(t)
+    yield story
+    story = []
     
     # Terminais Compartilhados (NOVO)
     if shared_terminals:
@@ -614,7 +889,8 @@ def generate_intelligence_report(operacao_id: int, db: Session = Depends(get_db)
             ('GRID', (0, 0), (-1, -1), 1, colors.black)
         ]))
         story.append(t)
-        story.append(PageBreak())
+        yield story
+        story = []
 
     # Anomalias Geográficas (NOVO)
     if geo_anomalies['anomalies']:
@@ -640,7 +916,8 @@ def generate_intelligence_report(operacao_id: int, db: Session = Depends(get_db)
             ('GRID', (0, 0), (-1, -1), 1, colors.black)
         ]))
         story.append(t)
-        story.append(PageBreak())
+        yield story
+        story = []
     
     # Padrões Temporais
     story.append(Paragraph("PADRÕES TEMPORAIS", styles['Heading2']))
@@ -685,7 +962,8 @@ def generate_intelligence_report(operacao_id: int, db: Session = Depends(get_db)
             for alerta in period_comparison['alertas']:
                 story.append(Paragraph(alerta, styles['Normal']))
         
-        story.append(PageBreak())
+        yield story
+        story = []
     
     # Inteligência Geográfica
     story.append(Paragraph("INTELIGÊNCIA GEOGRÁFICA", styles['Heading2']))
@@ -730,7 +1008,8 @@ def generate_intelligence_report(operacao_id: int, db: Session = Depends(get_db)
         ('GRID', (0, 0), (-1, -1), 1, colors.black)
     ]))
     story.append(t)
-    story.append(PageBreak())
+    yield story
+    story = []
     
     # Rankings
     story.append(Paragraph("TOP RANKINGS", styles['Heading2']))
@@ -784,12 +1063,4 @@ def generate_intelligence_report(operacao_id: int, db: Session = Depends(get_db)
         ]))
         story.append(t)
     
-    # Construir PDF
-    doc.build(story)
-    
-    # Retornar arquivo
-    return FileResponse(
-        pdf_path,
-        media_type='application/pdf',
-        filename=f"Relatorio_Inteligencia_{operacao.nome.replace(' ', '_')}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
-    )
+    yield story
@@ -1,18 +1,33 @@
-from fastapi import APIRouter, Depends, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import or_
 from typing import List, Optional
 import backend.models as models, backend.schemas as schemas
 from backend.database import get_db
+from backend.services import pagination, row_counts
+from backend.services.cache import OperationCache, data_generation
+from backend.services.message_filters import MODOS_BUSCA, date_filters, search_filter
 
 router = APIRouter(
     prefix="/mensagens",
     tags=["mensagens"],
 )
 
+# Colunas aceitas em sort_by (todas com desempate por id para a paginação por cursor)
+SORTABLE_COLUMNS = {
+    "data_hora": models.Mensagem.data_hora,
+    "alvo": models.Mensagem.alvo,
+    "remetente": models.Mensagem.remetente,
+    "destinatario": models.Mensagem.destinatario,
+    "tipo_mensagem": models.Mensagem.tipo_mensagem,
+    "porta": models.Mensagem.porta,
+    "id": models.Mensagem.id,
+    "ip": models.IP.endereco,
+}
+
 @router.get("/{operacao_id}", response_model=List[schemas.Mensagem])
 def read_mensagens(
     operacao_id: int,
+    response: Response,
     skip: int = 0,
     limit: int = 100,  # Aumentado para 100
     search: Optional[str] = None,
@@ -20,72 +35,109 @@ def read_mensagens(
     order: Optional[str] = "desc",
     data_inicio: Optional[str] = None,
     data_fim: Optional[str] = None,
+    cursor: Optional[str] = None,
+    modo_busca: str = "auto",
     db: Session = Depends(get_db)
 ):
+    """
+    Lista mensagens da operação.
+    Navegação por cursor: use os cabeçalhos X-Next-Cursor / X-Prev-Cursor da resposta
+    no parâmetro cursor (custo constante em qualquer página). skip continua aceito.
+    modo_busca: auto (pelo formato do termo), exato, prefixo ou contem.
+    """
+    if modo_busca not in MODOS_BUSCA:
+        raise HTTPException(status_code=400, detail=f"modo_busca inválido. Use: {', '.join(MODOS_BUSCA)}")
+    
     # Limitar máximo para 500 para evitar sobrecarregar o Supabase
     limit = min(limit, 500)
     
+    # Ordenação inválida cai no padrão (data_hora desc)
+    if sort_by not in SORTABLE_COLUMNS:
+        sort_by, order = "data_hora", "desc"
+    order = "asc" if order == "asc" else "desc"
+    sort_column = SORTABLE_COLUMNS[sort_by]
+    descending = order == "desc"
+    
     # Base query com eager loading otimizado
     query = db.query(models.Mensagem).filter(models.Mensagem.operacao_id == operacao_id)
     
     # Filtro de data
-    if data_inicio:
-        query = query.filter(models.Mensagem.data_hora >= data_inicio)
-    if data_fim:
-        # Ajustar data_fim para incluir todo o dia
-        if len(data_fim) == 10:  # Formato YYYY-MM-DD
-            data_fim_adjusted = data_fim + " 23:59:59"
-        else:
-            data_fim_adjusted = data_fim
-        query = query.filter(models.Mensagem.data_hora <= data_fim_adjusted)
+    query = query.filter(*date_filters(data_inicio, data_fim))
     
-    # Só fazer join com IP se realmente precisar (busca por IP)
-    needs_ip_join = search and any(c.isdigit() or c == '.' or c == ':' for c in search)
-    
-    if needs_ip_join:
-        # Eager load com join otimizado
-        query = query.options(joinedload(models.Mensagem.ip_rel))
+    # Eager load do IP em todos os casos; join explícito só para ordenar por IP
+    # (a busca por IP usa subconsulta em ips)
+    query = query.options(joinedload(models.Mensagem.ip_rel))
+    if sort_by == "ip":
         query = query.outerjoin(models.IP)
-        search_filter = or_(
-            models.Mensagem.alvo.like(f'%{search}%'),
-            models.Mensagem.remetente.like(f'%{search}%'),
-            models.Mensagem.destinatario.like(f'%{search}%'),
-            models.Mensagem.tipo_mensagem.like(f'%{search}%'),
-            models.IP.endereco.like(f'%{search}%')
-        )
-        query = query.filter(search_filter)
-    elif search:
-        # Busca sem IP (mais rápida)
-        query = query.options(joinedload(models.Mensagem.ip_rel))
-        search_filter = or_(
-            models.Mensagem.alvo.like(f'%{search}%'),
-            models.Mensagem.remetente.like(f'%{search}%'),
-            models.Mensagem.destinatario.like(f'%{search}%'),
-            models.Mensagem.tipo_mensagem.like(f'%{search}%')
-        )
-        query = query.filter(search_filter)
-    else:
-        # Sem busca - apenas eager load (mais rápido)
-        query = query.options(joinedload(models.Mensagem.ip_rel))
+    if search:
+        query = query.filter(search_filter(search, modo_busca))
     
-    # Sorting logic
-    if sort_by:
-        sort_column = None
-        if sort_by == "ip" and needs_ip_join:
-            sort_column = models.IP.endereco
-        elif hasattr(models.Mensagem, sort_by):
-            sort_column = getattr(models.Mensagem, sort_by)
-            
-        if sort_column is not None:
-            if order == "desc":
-                query = query.order_by(sort_column.desc())
-            else:
-                query = query.order_by(sort_column.asc())
-        else:
-             # Default sort if invalid column
-             query = query.order_by(models.Mensagem.data_hora.desc())
+    # Página anterior = mesma busca no sentido inverso, depois revertida.
+    # Uma linha a mais indica se existe outra página nesse sentido
+    direction = "next"
+    if cursor:
+        value, row_id, direction = pagination.decode_cursor(cursor, sort_by, order, sort_column)
+        scan_descending = descending if direction == "next" else not descending
+        mensagens = []
+        for condition, ordering in pagination.keyset_steps(sort_column, models.Mensagem.id, value, row_id, scan_descending):
+            mensagens += query.filter(condition).order_by(*ordering).limit(limit + 1 - len(mensagens)).all()
+            if len(mensagens) > limit:
+                break
     else:
-        query = query.order_by(models.Mensagem.data_hora.desc())
+        query = query.order_by(*pagination.order_by(sort_column, models.Mensagem.id, descending))
+        if skip:
+            query = query.offset(skip)
+        mensagens = query.limit(limit + 1).all()
+    has_more = len(mensagens) > limit
+    mensagens = mensagens[:limit]
+    if direction == "prev":
+        mensagens.reverse()
+    
+    if mensagens:
+        def sort_value(m):
+            return m.ip_rel.endereco if sort_by == "ip" and m.ip_rel else getattr(m, sort_by, None)
         
-    mensagens = query.offset(skip).limit(limit).all()
+        first, last = mensagens[0], mensagens[-1]
+        if has_more or direction == "prev":
+            response.headers["X-Next-Cursor"] = pagination.encode_cursor(sort_by, order, sort_value(last), last.id, "next")
+        if (has_more and direction == "prev") or (direction == "next" and (cursor or skip)):
+            response.headers["X-Prev-Cursor"] = pagination.encode_cursor(sort_by, order, sort_value(first), first.id, "prev")
+    
     return mensagens
+
+
+# Totais por (operação, filtros), válidos até a próxima importação
+_count_cache = OperationCache(max_entries=256)
+
+@router.get("/{operacao_id}/count")
+def count_mensagens(
+    operacao_id: int,
+    search: Optional[str] = None,
+    modo_busca: str = "auto",
+    data_inicio: Optional[str] = None,
+    data_fim: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """
+    Total de mensagens com os mesmos filtros da listagem.
+    Exato até um limite; acima dele, estimativa do banco com aproximado=true.
+    Não depende da ordenação nem da página, então trocar de página não reconta.
+    """
+    if modo_busca not in MODOS_BUSCA:
+        raise HTTPException(status_code=400, detail=f"modo_busca inválido. Use: {', '.join(MODOS_BUSCA)}")
+    
+    key = (operacao_id, search or None, modo_busca if search else None, data_inicio or None, data_fim or None)
+    generation = data_generation(db, operacao_id)
+    cached = _count_cache.get(key, generation)
+    if cached is not None:
+        return cached
+    
+    query = db.query(models.Mensagem.id).filter(
+        models.Mensagem.operacao_id == operacao_id,
+        *date_filters(data_inicio, data_fim)
+    )
+    if search:
+        query = query.filter(search_filter(search, modo_busca))
+    
+    total, aproximado = row_counts.count_rows(db, query)
+    return _count_cache.put(key, generation, {"total": total, "aproximado": aproximado})
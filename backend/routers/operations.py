@@ -3,6 +3,8 @@ from sqlalchemy.orm import Session
 from typing import List
 import backend.models as models, backend.schemas as schemas
 from backend.database import get_db
+from backend.services.cache import bump_version
+from backend.services.report_store import report_store
 
 router = APIRouter(
     prefix="/operacoes",
@@ -53,6 +55,8 @@ def delete_operacao(operacao_id: int, db: Session = Depends(get_db)):
         
         # 2. Deletar outros dados relacionados
         db.execute(text(f"DELETE FROM comunicacoes WHERE operacao_id = {operacao_id}"))
+        db.execute(text(f"DELETE FROM arestas_diarias WHERE operacao_id = {operacao_id}"))
+        db.execute(text(f"DELETE FROM mensagens_horarias WHERE operacao_id = {operacao_id}"))
         db.execute(text(f"DELETE FROM arquivos WHERE operacao_id = {operacao_id}"))
         db.execute(text(f"DELETE FROM telefones WHERE operacao_id = {operacao_id}"))
         db.commit()
@@ -60,6 +64,11 @@ def delete_operacao(operacao_id: int, db: Session = Depends(get_db)):
         # 3. Deletar a operação
         db.delete(operacao)
         db.commit()
+
+        # 4. Remover relatórios gerados e invalidar caches (o id pode ser reutilizado no SQLite)
+        report_store.purge(operacao_id)
+        bump_version(db, "telefones", operacao_id, commit=False)
+        bump_version(db, "mensagens", operacao_id)
         
     except Exception as e:
         db.rollback()
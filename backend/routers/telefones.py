@@ -4,6 +4,7 @@ from typing import List
 import backend.models as models
 import backend.schemas as schemas
 from backend.database import get_db
+from backend.services.cache import bump_version
 
 router = APIRouter(prefix="/telefones", tags=["telefones"])
 
@@ -39,7 +40,8 @@ def update_telefone(
     if data.observacoes is not None:
         telefone.observacoes = data.observacoes
     
-    db.commit()
+    # Commit junto com a nova versão dos telefones (invalida as respostas em cache)
+    bump_version(db, "telefones", telefone.operacao_id)
     db.refresh(telefone)
     return telefone
 
@@ -1,9 +1,10 @@
-from fastapi import APIRouter, Depends, UploadFile, File, HTTPException, Form, BackgroundTasks
+from fastapi import APIRouter, Depends, UploadFile, File, HTTPException, Form
 from sqlalchemy.orm import Session
 from typing import List
 import backend.models as models, backend.schemas as schemas
 from backend.database import get_db
-from backend.services import parser, geolocation
+from backend.services import parser
+from backend.services.cache import bump_import_versions
 
 router = APIRouter(
     prefix="/upload",
@@ -14,7 +15,6 @@ router = APIRouter(
 async def upload_files(
     operacao_id: int = Form(...),
     files: List[UploadFile] = File(...),
-    background_tasks: BackgroundTasks = None,
     db: Session = Depends(get_db)
 ):
     # Verificar se operação existe
@@ -26,6 +26,7 @@ async def upload_files(
 
     total_processed = 0
     skipped_files = []
+    importou = False
     
     for file in files:
         is_html = file.filename.lower().endswith(('.html', '.htm'))
@@ -74,14 +75,20 @@ async def upload_files(
                 
             total_processed += count
             db.commit() # Commit a cada arquivo processado com sucesso
+            importou = True
         except Exception as e:
             db.rollback()
+            # O parser grava em lotes: parte do arquivo pode ter sido gravada
+            bump_import_versions(db, operacao_id)
             raise HTTPException(status_code=500, detail=f"Erro ao processar arquivo {file.filename}: {str(e)}")
     
-    # Iniciar geolocalização automática em background
-    if background_tasks and total_processed > 0:
-        background_tasks.add_task(geolocation.geolocate_ips, operacao_id, db)
-            
+    # Nova versão dos dados só depois do último commit da importação: leituras feitas
+    # durante ela ficam em cache com a versão antiga e são descartadas aqui
+    if importou:
+        bump_import_versions(db, operacao_id)
+
+    # A geolocalização dos IPs novos é enfileirada pelo parser (geolocation.enqueue_ips)
+
     msg = f"Processamento concluído. {total_processed} mensagens importadas."
     if skipped_files:
         msg += f" Arquivos ignorados (duplicados): {', '.join(skipped_files)}"
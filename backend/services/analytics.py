@@ -0,0 +1,256 @@
+"""
+Motor analítico em memória por operação.
+
+Carrega as mensagens da operação uma única vez como colunas NumPy
+(telefones e tipos codificados como inteiros, IP, timestamp em segundos)
+e responde as agregações de grafo, dashboard e inteligência com group-bys vetorizados.
+Quando a operação não está carregada (ou o motor está desligado) os routers usam SQL.
+"""
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+import numpy as np
+from sqlalchemy.orm import Session
+import backend.models as models
+from backend.services.cache import data_generation
+
+# NumPy é dependência obrigatória (também usada por services/centrality);
+# ANALYTICS_ENGINE=0 desliga só o motor em memória e tudo vai para o SQL
+ENABLED = os.getenv("ANALYTICS_ENGINE", "1") != "0"
+MEMORY_BUDGET = int(os.getenv("ANALYTICS_MEMORY_MB", "512")) * 1024 * 1024
+LOAD_CHUNK = 50000
+
+NAT = -(2 ** 63)  # Valor de NaT quando datetime64 é visto como int64
+
+
+class _Vocab:
+    """Codifica strings em inteiros (None -> -1)"""
+
+    def __init__(self):
+        self.values = []
+        self.codes = {}
+
+    def code(self, value):
+        if value is None:
+            return -1
+        c = self.codes.get(value)
+        if c is None:
+            c = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return c
+
+
+class OperationFrame:
+    """Colunas das mensagens de uma operação"""
+
+    def __init__(self, phones, tipos, rem, dest, ip, ts, tipo):
+        self.phones = phones  # lista: código -> número
+        self.tipos = tipos  # lista: código -> tipo de mensagem
+        self.rem = rem
+        self.dest = dest
+        self.ip = ip
+        self.ts = ts  # int64 em segundos desde a época (NAT = sem data)
+        self.tipo = tipo
+
+    @property
+    def size(self):
+        return len(self.rem)
+
+    @property
+    def nbytes(self):
+        arrays = self.rem.nbytes + self.dest.nbytes + self.ip.nbytes + self.ts.nbytes + self.tipo.nbytes
+        # Estimativa grosseira para os vocabulários (strings + dict)
+        return arrays + 120 * (len(self.phones) + len(self.tipos))
+
+    # --- Agregações ---------------------------------------------------------
+
+    def _pair_counts(self, a, b, mask):
+        """Contagem por par (a, b) nas linhas do mask: (a_codes, b_codes, counts)"""
+        a = a[mask].astype(np.int64)
+        b = b[mask].astype(np.int64)
+        if len(a) == 0:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty, empty
+        width = int(b.max()) + 1
+        keys, counts = np.unique(a * width + b, return_counts=True)
+        return keys // width, keys % width, counts
+
+    def pair_counts(self):
+        """Mensagens por (remetente, destinatario)"""
+        pa, pb, counts = self._pair_counts(self.rem, self.dest, (self.rem >= 0) & (self.dest >= 0))
+        return [(self.phones[a], self.phones[b], int(c)) for a, b, c in zip(pa.tolist(), pb.tolist(), counts.tolist())]
+
+    def phone_totals(self):
+        """Mensagens enviadas + recebidas por telefone"""
+        n = len(self.phones)
+        totals = np.bincount(self.rem[self.rem >= 0], minlength=n) + np.bincount(self.dest[self.dest >= 0], minlength=n)
+        nz = np.nonzero(totals)[0]
+        return {self.phones[c]: int(totals[c]) for c in nz.tolist()}
+
+    def phone_ip_counts(self, ip_ids=None):
+        """Mensagens por (remetente, ip_id); opcionalmente só nos IPs informados"""
+        mask = (self.rem >= 0) & (self.ip >= 0)
+        if ip_ids is not None:
+            mask &= np.isin(self.ip, np.fromiter(ip_ids, dtype=np.int64))
+        pa, pb, counts = self._pair_counts(self.rem, self.ip, mask)
+        return [(self.phones[a], int(b), int(c)) for a, b, c in zip(pa.tolist(), pb.tolist(), counts.tolist())]
+
+    def ip_sender_counts(self):
+        """Quantidade de remetentes distintos por ip_id"""
+        pa, pb, _ = self._pair_counts(self.ip, self.rem, (self.rem >= 0) & (self.ip >= 0))
+        ips, counts = np.unique(pa, return_counts=True)
+        return {int(i): int(c) for i, c in zip(ips.tolist(), counts.tolist())}
+
+    def type_counts(self, include_null=True):
+        """Mensagens por tipo (None para mensagens sem tipo)"""
+        counts = np.bincount(self.tipo[self.tipo >= 0], minlength=len(self.tipos))
+        result = {self.tipos[c]: int(counts[c]) for c in np.nonzero(counts)[0].tolist()}
+        if include_null:
+            nulls = int((self.tipo < 0).sum())
+            if nulls:
+                result[None] = nulls
+        return result
+
+    def _dated(self):
+        return self.ts[self.ts != NAT]
+
+    def hour_counts(self):
+        """Mensagens por hora do dia (0-23)"""
+        ts = self._dated()
+        counts = np.bincount((ts // 3600) % 24, minlength=24)
+        return {h: int(c) for h, c in enumerate(counts.tolist()) if c}
+
+    def hour_dow_counts(self):
+        """Mensagens por (hora, dia da semana) - dia no padrão do PostgreSQL (0 = domingo)"""
+        ts = self._dated()
+        hours = (ts // 3600) % 24
+        dows = (ts // 86400 + 4) % 7  # 01/01/1970 foi uma quinta-feira
+        counts = np.bincount(hours * 7 + dows, minlength=24 * 7)
+        return [(int(k // 7), int(k % 7), int(counts[k])) for k in np.nonzero(counts)[0].tolist()]
+
+    def time_range(self):
+        """(menor, maior) data_hora, ou None se não houver datas"""
+        ts = self._dated()
+        if len(ts) == 0:
+            return None
+        epoch = datetime(1970, 1, 1)
+        return epoch + timedelta(seconds=int(ts.min())), epoch + timedelta(seconds=int(ts.max()))
+
+    def phone_appearances(self, exclude_empty=True):
+        """Aparições por telefone como remetente ou destinatário (maior primeiro)"""
+        totals = self.phone_totals()
+        if exclude_empty:
+            totals.pop('', None)
+        return sorted(totals.items(), key=lambda x: x[1], reverse=True)
+
+
+def load_operation(db: Session, operacao_id: int) -> OperationFrame:
+    """Lê as colunas da operação em blocos, sem hidratar objetos ORM"""
+    phones = _Vocab()
+    tipos = _Vocab()
+    chunks = {"rem": [], "dest": [], "ip": [], "ts": [], "tipo": []}
+
+    rows = db.query(
+        models.Mensagem.remetente,
+        models.Mensagem.destinatario,
+        models.Mensagem.ip_id,
+        models.Mensagem.data_hora,
+        models.Mensagem.tipo_mensagem
+    ).filter(
+        models.Mensagem.operacao_id == operacao_id
+    ).yield_per(LOAD_CHUNK)
+
+    def flush(buffer):
+        rem, dest, ip, ts, tipo = zip(*buffer)
+        chunks["rem"].append(np.fromiter((phones.code(v) for v in rem), dtype=np.int32, count=len(rem)))
+        chunks["dest"].append(np.fromiter((phones.code(v) for v in dest), dtype=np.int32, count=len(dest)))
+        chunks["ip"].append(np.fromiter((-1 if v is None else v for v in ip), dtype=np.int32, count=len(ip)))
+        chunks["ts"].append(np.array(ts, dtype="datetime64[s]").view(np.int64))
+        chunks["tipo"].append(np.fromiter((tipos.code(v) for v in tipo), dtype=np.int16, count=len(tipo)))
+
+    buffer = []
+    for row in rows:
+        buffer.append(tuple(row))
+        if len(buffer) >= LOAD_CHUNK:
+            flush(buffer)
+            buffer = []
+    if buffer:
+        flush(buffer)
+
+    def column(name, dtype):
+        return np.concatenate(chunks[name]) if chunks[name] else np.zeros(0, dtype=dtype)
+
+    return OperationFrame(
+        phones.values, tipos.values,
+        column("rem", np.int32), column("dest", np.int32), column("ip", np.int32),
+        column("ts", np.int64), column("tipo", np.int16)
+    )
+
+
+class AnalyticsEngine:
+    """LRU de OperationFrame limitado por memória, invalidado pela geração dos dados"""
+
+    def __init__(self, memory_budget: int):
+        self.memory_budget = memory_budget
+        self._frames = OrderedDict()  # operacao_id -> (generation, frame)
+        self._loading = set()
+        self._lock = threading.Lock()
+
+    def get(self, operacao_id: int, generation):
+        with self._lock:
+            entry = self._frames.get(operacao_id)
+            if entry is None or entry[0] != generation:
+                return None
+            self._frames.move_to_end(operacao_id)
+            return entry[1]
+
+    def put(self, operacao_id: int, generation, frame: OperationFrame):
+        with self._lock:
+            self._frames[operacao_id] = (generation, frame)
+            self._frames.move_to_end(operacao_id)
+            used = sum(f.nbytes for _, f in self._frames.values())
+            while used > self.memory_budget and len(self._frames) > 1:
+                _, (_, evicted) = self._frames.popitem(last=False)
+                used -= evicted.nbytes
+            if used > self.memory_budget:
+                # Nem sozinha a operação cabe no orçamento
+                self._frames.pop(operacao_id, None)
+
+    def warm(self, operacao_id: int):
+        """Carrega a operação em uma thread própria (com sessão própria)"""
+        with self._lock:
+            if operacao_id in self._loading:
+                return
+            self._loading.add(operacao_id)
+
+        def run():
+            from backend.database import SessionLocal
+            db = SessionLocal()
+            try:
+                generation = data_generation(db, operacao_id)
+                self.put(operacao_id, generation, load_operation(db, operacao_id))
+            except Exception as e:
+                print(f"Erro ao carregar operação {operacao_id} no motor analítico: {e}")
+            finally:
+                db.close()
+                with self._lock:
+                    self._loading.discard(operacao_id)
+
+        threading.Thread(target=run, daemon=True).start()
+
+
+_engine = AnalyticsEngine(MEMORY_BUDGET) if ENABLED else None
+
+
+def get_frame(db: Session, operacao_id: int):
+    """
+    Colunas da operação se já estiverem em memória e atualizadas; senão None
+    (o chamador usa SQL) e o carregamento é disparado em segundo plano.
+    """
+    if _engine is None:
+        return None
+    frame = _engine.get(operacao_id, data_generation(db, operacao_id))
+    if frame is None:
+        _engine.warm(operacao_id)
+    return frame
@@ -0,0 +1,241 @@
+import functools
+import inspect
+import json
+import os
+import time
+from collections import OrderedDict, defaultdict
+from threading import Lock
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+try:
+    import redis
+except ImportError:  # redis é opcional; sem ele o cache de respostas fica só em memória
+    redis = None
+
+
+# Fontes de dados versionadas: mensagens (importações), telefones (cadastro/edição) e
+# ips (criação/geolocalização). ips é global (operacao_id 0); as demais são por operação.
+GLOBAL_SOURCES = ("ips",)
+
+
+def bump_version(db: Session, fonte: str, operacao_id: int = 0, commit: bool = True):
+    """
+    Incrementa a versão de uma fonte de dados e faz commit (junto com a escrita pendente na sessão).
+    Chamado depois que a escrita foi concluída (ex.: fim de uma importação), para que
+    leituras feitas no meio dela não fiquem em cache com a versão final.
+    """
+    if fonte in GLOBAL_SOURCES:
+        operacao_id = 0
+    db.execute(text("""
+        INSERT INTO versoes_dados (fonte, operacao_id, versao) VALUES (:fonte, :op_id, 1)
+        ON CONFLICT (fonte, operacao_id) DO UPDATE SET versao = versoes_dados.versao + 1
+    """), {"fonte": fonte, "op_id": operacao_id})
+    if commit:
+        db.commit()
+
+
+def bump_import_versions(db: Session, operacao_id: int):
+    """Fim de uma importação: mensagens e telefones da operação (novos e totais) e IPs novos"""
+    bump_version(db, "telefones", operacao_id, commit=False)
+    bump_version(db, "ips", commit=False)
+    bump_version(db, "mensagens", operacao_id)
+
+
+def data_versions(db: Session, operacao_id: int):
+    """Versões de todas as fontes da operação (e das globais) numa consulta pela chave primária"""
+    rows = db.execute(text("""
+        SELECT fonte, operacao_id, versao FROM versoes_dados WHERE operacao_id IN (:op_id, 0)
+    """), {"op_id": operacao_id}).all()
+    return {(fonte, op_id): int(versao) for fonte, op_id, versao in rows}
+
+
+def _version(db: Session, fonte: str, operacao_id: int) -> int:
+    row = db.execute(text("""
+        SELECT versao FROM versoes_dados WHERE fonte = :fonte AND operacao_id = :op_id
+    """), {"fonte": fonte, "op_id": operacao_id}).first()
+    return int(row[0]) if row else 0
+
+
+def source_versions(db: Session, operacao_id: int, fontes=("mensagens", "telefones", "ips")):
+    """{fonte: versão} das fontes pedidas, numa consulta só"""
+    versions = data_versions(db, operacao_id)
+    return {
+        fonte: versions.get((fonte, 0 if fonte in GLOBAL_SOURCES else operacao_id), 0)
+        for fonte in fontes
+    }
+
+
+def data_generation(db: Session, operacao_id: int):
+    """
+    Identifica a "geração" das mensagens de uma operação.
+    O upload incrementa a versão só depois do último commit da importação
+    (e a exclusão da operação também), então dados parciais nunca ficam em cache.
+    """
+    return _version(db, "mensagens", operacao_id)
+
+
+class OperationCache:
+    """
+    Cache LRU por operação, invalidado pela geração dos dados.
+    Guarda estruturas caras de montar (índices de grafo, métricas) entre requisições.
+    """
+
+    def __init__(self, max_entries: int = 8):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key, generation):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != generation:
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key, generation, value):
+        with self._lock:
+            self._entries[key] = (generation, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+    def invalidate(self, key=None):
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+
+def telefones_version(db: Session, operacao_id: int):
+    """Versão dos telefones da operação: muda quando são criados (importação) ou editados"""
+    return _version(db, "telefones", operacao_id)
+
+
+def ips_version(db: Session):
+    """Versão da tabela de IPs (global): muda quando IPs são criados ou geolocalizados"""
+    return _version(db, "ips", 0)
+
+
+# --- Cache de respostas dos routers de leitura ----------------------------------
+
+class MemoryResponseStore:
+    """Respostas em memória do processo: LRU limitado por quantidade, com expiração"""
+
+    name = "memory"
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # chave -> (expira_em, geração, valor)
+        self._lock = Lock()
+
+    def get(self, key, generation):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, entry_generation, value = entry
+            if expires_at < time.monotonic() or entry_generation != generation:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, generation, value, ttl: int):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, generation, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class RedisResponseStore:
+    """Respostas no Redis (compartilhadas entre workers do uvicorn), serializadas em JSON"""
+
+    name = "redis"
+    PREFIX = "forense:resp:"
+
+    def __init__(self, url: str):
+        self._client = redis.Redis.from_url(url)
+
+    def get(self, key, generation):
+        try:
+            raw = self._client.get(self.PREFIX + key)
+        except redis.RedisError:
+            return None
+        if raw is None:
+            return None
+        entry = json.loads(raw)
+        if entry["g"] != json.loads(json.dumps(generation, default=str)):
+            return None
+        return entry["v"]
+
+    def put(self, key, generation, value, ttl: int):
+        try:
+            self._client.set(self.PREFIX + key, json.dumps({"g": generation, "v": value}, default=str), ex=ttl)
+        except redis.RedisError:
+            pass
+
+
+RESPONSE_CACHE_URL = os.getenv("RESPONSE_CACHE_REDIS_URL")
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1024"))
+
+if RESPONSE_CACHE_URL and redis is not None:
+    response_store = RedisResponseStore(RESPONSE_CACHE_URL)
+else:
+    response_store = MemoryResponseStore(RESPONSE_CACHE_MAX_ENTRIES)
+
+_stats_lock = Lock()
+_response_stats = defaultdict(lambda: {"hits": 0, "misses": 0})
+
+
+def _count(name: str, hit: bool):
+    with _stats_lock:
+        _response_stats[name]["hits" if hit else "misses"] += 1
+
+
+def response_cache_stats():
+    """Acertos e falhas por endpoint (contadores deste processo)"""
+    with _stats_lock:
+        endpoints = {name: dict(counts) for name, counts in _response_stats.items()}
+    return {"backend": response_store.name, "endpoints": endpoints}
+
+
+def cached_response(ttl: int, fontes=("mensagens",)):
+    """
+    Memoriza a resposta de um endpoint por (parâmetros, geração dos dados) durante ttl segundos.
+    O endpoint precisa receber operacao_id e db; fontes define o que invalida a resposta:
+    mensagens (importações), telefones (cadastro/edição) e ips (geolocalização).
+    """
+    def decorator(endpoint):
+        signature = inspect.signature(endpoint)
+        name = f"{endpoint.__module__.rsplit('.', 1)[-1]}.{endpoint.__name__}"
+
+        @functools.wraps(endpoint)
+        def wrapper(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            db = bound.arguments["db"]
+            operacao_id = bound.arguments["operacao_id"]
+
+            # Uma consulta pela chave primária de versoes_dados, qualquer que seja o número de fontes
+            versions = source_versions(db, operacao_id, fontes)
+            generation = [versions[fonte] for fonte in fontes]
+
+            params = sorted((k, v) for k, v in bound.arguments.items() if k != "db")
+            key = f"{name}:{params!r}"
+            value = response_store.get(key, generation)
+            if value is not None:
+                _count(name, True)
+                return value
+
+            _count(name, False)
+            value = endpoint(*args, **kwargs)
+            response_store.put(key, generation, value, ttl)
+            return value
+
+        return wrapper
+    return decorator
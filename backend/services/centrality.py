@@ -0,0 +1,213 @@
+"""
+Métricas de centralidade da rede de comunicações (telefone -> telefone).
+
+Grau ponderado, PageRank (iteração de potência sobre matriz esparsa),
+intermediação (Brandes com amostragem de origens em grafos grandes) e número de k-core.
+O resultado é guardado por operação e geração dos dados.
+"""
+import random
+import numpy as np
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+import backend.models as models
+from backend.services import analytics
+from backend.services.cache import OperationCache, data_generation
+
+PAGERANK_DAMPING = 0.85
+PAGERANK_MAX_ITER = 100
+PAGERANK_TOL = 1e-9
+
+# Orçamento de entradas de adjacência processadas na intermediação (define o tamanho da amostra)
+BETWEENNESS_BUDGET = 30_000_000
+
+
+def _pagerank(n, src, dst, weight):
+    """PageRank ponderado e direcionado; nós sem saída distribuem para todos"""
+    out_weight = np.bincount(src, weights=weight, minlength=n)
+    dangling = out_weight == 0
+    # Peso normalizado de cada aresta (fração da saída do nó de origem)
+    norm = weight / out_weight[src]
+
+    rank = np.full(n, 1.0 / n)
+    for _ in range(PAGERANK_MAX_ITER):
+        spread = np.bincount(dst, weights=rank[src] * norm, minlength=n)
+        new_rank = PAGERANK_DAMPING * (spread + rank[dangling].sum() / n) + (1 - PAGERANK_DAMPING) / n
+        delta = np.abs(new_rank - rank).sum()
+        rank = new_rank
+        if delta < PAGERANK_TOL:
+            break
+    return rank
+
+
+def _csr(n, u, v):
+    """Adjacência não direcionada em CSR: (offsets, vizinhos, origem de cada entrada)"""
+    a = np.concatenate([u, v])
+    b = np.concatenate([v, u])
+    order = np.argsort(a, kind="stable")
+    offsets = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(a, minlength=n), out=offsets[1:])
+    return offsets, b[order], a[order]
+
+
+def _betweenness(n, offsets, neighbors):
+    """
+    Intermediação (Brandes, não ponderada) com BFS por níveis vetorizada.
+    Em grafos grandes usa uma amostra de origens proporcional ao orçamento e extrapola para n.
+    """
+    if n < 3:
+        return np.zeros(n)
+
+    degree = np.diff(offsets)
+    cost = len(neighbors) + n
+    samples = n if n * cost <= BETWEENNESS_BUDGET else max(8, min(n, BETWEENNESS_BUDGET // cost))
+    sources = range(n) if samples == n else random.Random(n).sample(range(n), samples)
+
+    result = np.zeros(n)
+    for s in sources:
+        dist = np.full(n, -1, dtype=np.int64)
+        sigma = np.zeros(n)
+        dist[s] = 0
+        sigma[s] = 1.0
+        frontier = np.array([s], dtype=np.int64)
+        levels = []
+        depth = 0
+
+        while frontier.size:
+            counts = degree[frontier]
+            total = int(counts.sum())
+            if total == 0:
+                break
+            # Índices de todas as entradas de adjacência da fronteira
+            first = np.repeat(offsets[frontier] - np.cumsum(counts) + counts, counts)
+            idx = first + np.arange(total)
+            u = np.repeat(frontier, counts)
+            w = neighbors[idx]
+
+            new = np.unique(w[dist[w] < 0])
+            dist[new] = depth + 1
+            keep = dist[w] == depth + 1
+            u, w = u[keep], w[keep]
+            sigma += np.bincount(w, weights=sigma[u], minlength=n)
+            levels.append((u, w))
+            frontier = new
+            depth += 1
+
+        delta = np.zeros(n)
+        for u, w in reversed(levels):
+            delta += np.bincount(u, weights=sigma[u] / sigma[w] * (1.0 + delta[w]), minlength=n)
+        delta[s] = 0.0
+        result += delta
+
+    # Não direcionado: cada par foi contado nos dois sentidos; normaliza para [0, 1]
+    return result * ((n / samples) / ((n - 1) * (n - 2)))
+
+
+def _core_numbers(n, offsets, neighbors, origins):
+    """Número de k-core de cada nó, removendo em rodadas os nós de grau <= k"""
+    degree = np.diff(offsets).astype(np.int64)
+    core = np.zeros(n, dtype=np.int64)
+    alive = np.ones(n, dtype=bool)
+    k = 0
+
+    while alive.any():
+        k = max(k, int(degree[alive].min()))
+        while True:
+            peel = alive & (degree <= k)
+            if not peel.any():
+                break
+            core[peel] = k
+            alive[peel] = False
+            # Cada nó removido reduz o grau dos vizinhos
+            removed = peel[origins]
+            degree -= np.bincount(neighbors[removed], minlength=n)
+    return core
+
+
+def compute_centrality(comms):
+    """
+    comms: iterável de (remetente, destinatario, mensagens).
+    Retorna {numero: {"grau", "grau_ponderado", "pagerank", "intermediacao", "k_core"}}.
+    """
+    labels = []
+    index = {}
+    src, dst, weight = [], [], []
+    for rem, dest, count in comms:
+        if not rem or not dest or rem == dest:
+            continue
+        for tel in (rem, dest):
+            if tel not in index:
+                index[tel] = len(labels)
+                labels.append(tel)
+        src.append(index[rem])
+        dst.append(index[dest])
+        weight.append(count)
+
+    n = len(labels)
+    if n == 0:
+        return {}
+
+    src = np.array(src, dtype=np.int64)
+    dst = np.array(dst, dtype=np.int64)
+    weight = np.array(weight, dtype=np.float64)
+
+    pagerank = _pagerank(n, src, dst, weight)
+    weighted_degree = np.bincount(src, weights=weight, minlength=n) + np.bincount(dst, weights=weight, minlength=n)
+
+    # Arestas não direcionadas únicas (A->B e B->A contam uma vez)
+    lo = np.minimum(src, dst)
+    hi = np.maximum(src, dst)
+    pairs = np.unique(lo * n + hi)
+    u = pairs // n
+    v = pairs % n
+    offsets, neighbors, origins = _csr(n, u, v)
+
+    degree = np.diff(offsets).tolist()
+    weighted_degree = weighted_degree.tolist()
+    pagerank = pagerank.tolist()
+    betweenness = _betweenness(n, offsets, neighbors).tolist()
+    cores = _core_numbers(n, offsets, neighbors, origins).tolist()
+
+    return {
+        labels[i]: {
+            "grau": degree[i],
+            "grau_ponderado": int(weighted_degree[i]),
+            "pagerank": pagerank[i],
+            "intermediacao": betweenness[i],
+            "k_core": cores[i]
+        }
+        for i in range(n)
+    }
+
+
+_centrality_cache = OperationCache(max_entries=8)
+
+
+def get_centrality(db: Session, operacao_id: int, comms=None):
+    """
+    Métricas da operação (em cache até a próxima importação).
+    comms pode ser passado por quem já agregou os pares (remetente, destinatario, mensagens).
+    """
+    generation = data_generation(db, operacao_id)
+    metrics = _centrality_cache.get(operacao_id, generation)
+    if metrics is not None:
+        return metrics
+
+    if comms is None:
+        frame = analytics.get_frame(db, operacao_id)
+        if frame is not None:
+            comms = frame.pair_counts()
+        else:
+            comms = db.query(
+                models.Mensagem.remetente,
+                models.Mensagem.destinatario,
+                func.count(models.Mensagem.id)
+            ).filter(
+                models.Mensagem.operacao_id == operacao_id,
+                models.Mensagem.remetente.isnot(None),
+                models.Mensagem.destinatario.isnot(None)
+            ).group_by(
+                models.Mensagem.remetente,
+                models.Mensagem.destinatario
+            ).all()
+
+    return _centrality_cache.put(operacao_id, generation, compute_centrality(comms))
@@ -0,0 +1,172 @@
+"""
+Geolocalização offline a partir de uma base local (estações sem internet).
+
+Aceita dois formatos:
+- .mmdb (MaxMind GeoLite2/GeoIP2 City), lido pela biblioteca maxminddb (opcional), em modo mmap;
+- arquivo de faixas gerado por build_range_file a partir de um CSV (DB-IP lite ou início,fim,país,cidade,lat,lon[,provedor]).
+
+O arquivo de faixas guarda as faixas IPv4 e IPv6 ordenadas pelo início, em registros de tamanho
+fixo, e é aberto com mmap: a consulta é uma busca binária direto nos bytes do arquivo, sem carregar
+as faixas na memória. Os dados de local (país, cidade, coordenadas) ficam numa tabela deduplicada no final.
+"""
+import csv
+import ipaddress
+import json
+import mmap
+import struct
+from typing import Optional
+
+try:
+    import maxminddb
+except ImportError:  # maxminddb é opcional; só necessário para bases .mmdb
+    maxminddb = None
+
+MAGIC = b"FGEO\x00\x00\x00\x01"
+_HEADER = struct.Struct("<8sIIQ")   # magic, faixas IPv4, faixas IPv6, offset da tabela de locais
+_V4 = struct.Struct("<III")          # início, fim, local
+_V6 = struct.Struct("<16s16sI")      # início, fim (big-endian, comparáveis como bytes), local
+
+
+def _parse_ip(valor: str):
+    """Aceita endereço em texto ou inteiro (formato IP2Location)"""
+    valor = valor.strip()
+    if valor.isdigit():
+        numero = int(valor)
+        return ipaddress.IPv4Address(numero) if numero < 2 ** 32 else ipaddress.IPv6Address(numero)
+    return ipaddress.ip_address(valor)
+
+
+def _float(valor):
+    try:
+        return float(valor)
+    except (TypeError, ValueError):
+        return None
+
+
+def _csv_rows(csv_path: str):
+    """(início, fim, local) de cada linha do CSV"""
+    with open(csv_path, newline="", encoding="utf-8") as f:
+        for row in csv.reader(f):
+            if not row or not row[0].strip() or row[0].startswith("#"):
+                continue
+            try:
+                inicio, fim = _parse_ip(row[0]), _parse_ip(row[1])
+            except ValueError:
+                continue  # cabeçalho ou linha inválida
+            if len(row) >= 8:
+                # DB-IP "IP to City Lite": início, fim, continente, país, estado, cidade, lat, lon
+                local = (row[3] or None, row[5] or None, _float(row[6]), _float(row[7]), None)
+            else:
+                extra = row[2:] + [None] * 5
+                local = (extra[0] or None, extra[1] or None, _float(extra[2]), _float(extra[3]), extra[4] or None)
+            yield inicio, fim, local
+
+
+def build_range_file(csv_path: str, out_path: str) -> int:
+    """Converte o CSV de faixas para o formato binário consultado por RangeDatabase"""
+    locais, indices = [], {}
+    v4, v6 = [], []
+    for inicio, fim, local in _csv_rows(csv_path):
+        if inicio.version != fim.version:
+            continue
+        if local not in indices:
+            indices[local] = len(locais)
+            locais.append(local)
+        if inicio.version == 4:
+            v4.append((int(inicio), int(fim), indices[local]))
+        else:
+            v6.append((inicio.packed, fim.packed, indices[local]))
+    v4.sort()
+    v6.sort()
+
+    offset = _HEADER.size + len(v4) * _V4.size + len(v6) * _V6.size
+    with open(out_path, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, len(v4), len(v6), offset))
+        for faixa in v4:
+            f.write(_V4.pack(*faixa))
+        for faixa in v6:
+            f.write(_V6.pack(*faixa))
+        f.write(json.dumps(locais, ensure_ascii=False).encode("utf-8"))
+    return len(v4) + len(v6)
+
+
+def _result(endereco, pais, cidade, lat, lon, provedor):
+    # Mesmo formato das respostas do ip-api, para o restante do fluxo não depender da origem
+    return {"status": "success", "query": endereco, "country": pais, "city": cidade,
+            "lat": lat, "lon": lon, "isp": provedor}
+
+
+class RangeDatabase:
+    """Consulta por busca binária no arquivo de faixas mapeado em memória"""
+
+    def __init__(self, path: str):
+        self._file = open(path, "rb")
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.n4, self.n6, offset = _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} não é um arquivo de faixas de geolocalização")
+        self._v4_offset = _HEADER.size
+        self._v6_offset = self._v4_offset + self.n4 * _V4.size
+        self._locais = json.loads(self._mm[offset:].decode("utf-8"))
+
+    def _search(self, chave, base: int, count: int, layout: struct.Struct):
+        # Última faixa com início <= chave
+        lo, hi = 0, count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if layout.unpack_from(self._mm, base + mid * layout.size)[0] <= chave:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo == 0:
+            return None
+        _, fim, local = layout.unpack_from(self._mm, base + (lo - 1) * layout.size)
+        return local if chave <= fim else None
+
+    def lookup(self, endereco: str) -> Optional[dict]:
+        try:
+            ip = ipaddress.ip_address(endereco)
+        except ValueError:
+            return None
+        if ip.version == 4:
+            local = self._search(int(ip), self._v4_offset, self.n4, _V4)
+        else:
+            local = self._search(ip.packed, self._v6_offset, self.n6, _V6)
+        if local is None:
+            return None
+        return _result(endereco, *self._locais[local])
+
+    def close(self):
+        self._mm.close()
+        self._file.close()
+
+
+class MMDBDatabase:
+    """Base MaxMind (.mmdb) lida em modo mmap pela biblioteca maxminddb"""
+
+    def __init__(self, path: str):
+        if maxminddb is None:
+            raise RuntimeError("Biblioteca maxminddb não instalada (necessária para bases .mmdb)")
+        self._reader = maxminddb.open_database(path, maxminddb.MODE_MMAP)
+
+    def lookup(self, endereco: str) -> Optional[dict]:
+        try:
+            data = self._reader.get(endereco)
+        except ValueError:
+            return None
+        if not data:
+            return None
+        nome = lambda item: (item or {}).get("names", {}).get("pt-BR") or (item or {}).get("names", {}).get("en")
+        location = data.get("location", {})
+        return _result(endereco, nome(data.get("country")), nome(data.get("city")),
+                       location.get("latitude"), location.get("longitude"),
+                       data.get("autonomous_system_organization"))
+
+    def close(self):
+        self._reader.close()
+
+
+def open_database(path: str):
+    if path.lower().endswith(".mmdb"):
+        return MMDBDatabase(path)
+    return RangeDatabase(path)
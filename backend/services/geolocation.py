@@ -1,40 +1,290 @@
-import requests
+"""
+Geolocalização dos IPs pela API do ip-api.com.
+
+Usa o endpoint em lote (/batch, até 100 IPs por requisição) com algumas requisições
+em paralelo (asyncio), limitadas por um token bucket que se ajusta aos cabeçalhos
+de limite do provedor (X-Rl: requisições restantes, X-Ttl: segundos até renovar).
+Cada lote é gravado assim que chega, então uma interrupção não perde o que já foi resolvido.
+
+GEOLOCATION_API_URL permite apontar para um servidor local (testes e benchmarks).
+Com GEOLOCATION_BACKEND=offline, os IPs são resolvidos pela base local em GEOLOCATION_DB
+(ver geo_offline), sem acesso à internet.
+"""
+import asyncio
+import os
 import time
+import queue
+from threading import Lock, Thread
+import requests
 from sqlalchemy.orm import Session
 import backend.models as models
+from backend.database import SessionLocal
+from backend.services.cache import bump_version
+from backend.services import geo_offline
+
+BACKEND = os.getenv("GEOLOCATION_BACKEND", "api")  # api | offline
+OFFLINE_DB = os.getenv("GEOLOCATION_DB", "")
+
+API_URL = os.getenv("GEOLOCATION_API_URL", "http://ip-api.com").rstrip("/")
+BATCH_SIZE = int(os.getenv("GEOLOCATION_BATCH_SIZE", "100"))  # máximo aceito pelo /batch
+RATE_PER_MINUTE = float(os.getenv("GEOLOCATION_RATE_PER_MINUTE", "15"))  # limite do /batch na versão gratuita
+CONCURRENCY = int(os.getenv("GEOLOCATION_CONCURRENCY", "2"))
+MAX_RETRIES = int(os.getenv("GEOLOCATION_MAX_RETRIES", "4"))
+REQUEST_TIMEOUT = float(os.getenv("GEOLOCATION_TIMEOUT", "15"))
+
+FIELDS = "status,message,query,country,city,lat,lon,isp"
+
+
+class TokenBucket:
+    """
+    Limitador de taxa assíncrono. `rate` fichas por segundo, acumulando até `capacity`.
+    `pause` bloqueia todas as requisições até um instante (limite esgotado ou HTTP 429).
+    """
+
+    def __init__(self, rate: float, capacity: float = 1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0
+
+    def adapt(self, remaining, ttl):
+        """Ajusta ao que o provedor informa: sem requisições restantes, espera a janela renovar"""
+        if remaining is None or ttl is None:
+            return
+        if remaining <= 0:
+            self.pause(ttl + 1)
+        elif ttl > 0:
+            # Distribui as requisições restantes pelo tempo que falta na janela
+            self.rate = remaining / ttl
 
-def geolocate_ips(operacao_id: int, db: Session):
-    # Buscar IPs da operação que ainda não têm geolocalização
-    # IPs estão na tabela 'ips', ligados a mensagens da operação
-    
-    # Subquery para pegar IPs da operação
-    ips_to_update = db.query(models.IP).join(models.Mensagem).filter(
-        models.Mensagem.operacao_id == operacao_id,
-        models.IP.latitude.is_(None) # Assumindo que se tem lat, já foi processado
-    ).distinct().all()
-    
-    updated_count = 0
-    
-    for ip in ips_to_update:
+
+def _int_header(headers, name):
+    try:
+        return int(headers.get(name))
+    except (TypeError, ValueError):
+        return None
+
+
+def _post_batch(enderecos):
+    """Requisição síncrona ao /batch (executada em thread pelo asyncio)"""
+    return requests.post(
+        f"{API_URL}/batch",
+        params={"fields": FIELDS},
+        json=[{"query": endereco} for endereco in enderecos],
+        timeout=REQUEST_TIMEOUT
+    )
+
+
+async def _resolve_batch(enderecos, bucket: TokenBucket):
+    """Resultados do lote ({endereco: dados}); None se esgotar as tentativas"""
+    for tentativa in range(MAX_RETRIES + 1):
+        await bucket.acquire()
         try:
-            # ip-api.com (free, 45 req/min)
-            response = requests.get(f"http://ip-api.com/json/{ip.endereco}")
+            response = await asyncio.to_thread(_post_batch, enderecos)
+        except requests.RequestException as e:
+            print(f"Erro ao geolocalizar lote de {len(enderecos)} IPs: {e}")
+            response = None
+
+        if response is not None:
+            bucket.adapt(_int_header(response.headers, "X-Rl"), _int_header(response.headers, "X-Ttl"))
             if response.status_code == 200:
-                data = response.json()
-                if data.get('status') == 'success':
-                    ip.pais = data.get('country')
-                    ip.cidade = data.get('city')
-                    ip.latitude = data.get('lat')
-                    ip.longitude = data.get('lon')
-                    ip.provedor = data.get('isp')
-                    updated_count += 1
-            
-            # Respeitar rate limit (simples sleep)
-            time.sleep(1.5) 
-            
-        except Exception as e:
-            print(f"Erro ao geolocalizar IP {ip.endereco}: {e}")
+                return {item.get("query"): item for item in response.json()}
+            if response.status_code == 429:
+                bucket.pause(_int_header(response.headers, "X-Ttl") or 60)
+            elif response.status_code < 500:
+                print(f"Geolocalização recusada (HTTP {response.status_code}): {response.text[:200]}")
+                return None
+
+        if tentativa < MAX_RETRIES:
+            await asyncio.sleep(2 ** tentativa)  # backoff exponencial
+    return None
+
+
+def _apply(ips_by_endereco, resultados) -> int:
+    updated = 0
+    for endereco, data in resultados.items():
+        ip = ips_by_endereco.get(endereco)
+        if ip is None or data.get('status') != 'success':
             continue
-            
-    db.commit()
-    return updated_count
+        ip.pais = data.get('country')
+        ip.cidade = data.get('city')
+        ip.latitude = data.get('lat')
+        ip.longitude = data.get('lon')
+        ip.provedor = data.get('isp')
+        updated += 1
+    return updated
+
+
+def _commit(db: Session, updated: int) -> int:
+    """Grava o lote; se algum IP mudou, no mesmo commit da nova versão dos IPs (invalida os caches)"""
+    if updated:
+        bump_version(db, "ips")
+    else:
+        db.commit()
+    return updated
+
+
+async def _geolocate(ips, db: Session) -> int:
+    bucket = TokenBucket(RATE_PER_MINUTE / 60, capacity=CONCURRENCY)
+    ips_by_endereco = {ip.endereco: ip for ip in ips}
+    enderecos = list(ips_by_endereco)
+    batches = [enderecos[i:i + BATCH_SIZE] for i in range(0, len(enderecos), BATCH_SIZE)]
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+
+    async def run(batch):
+        async with semaphore:
+            return await _resolve_batch(batch, bucket)
+
+    updated = 0
+    tasks = [asyncio.create_task(run(batch)) for batch in batches]
+    try:
+        for finished in asyncio.as_completed(tasks):
+            resultados = await finished
+            if not resultados:
+                continue
+            # Gravação no loop (uma thread só usa a sessão), um commit por lote
+            updated += _commit(db, _apply(ips_by_endereco, resultados))
+    finally:
+        for task in tasks:
+            task.cancel()
+    return updated
+
+
+_offline_db = None
+_offline_lock = Lock()
+
+
+def offline_database():
+    """Base local aberta uma vez por processo (o mmap é compartilhado entre as consultas)"""
+    global _offline_db
+    with _offline_lock:
+        if _offline_db is None:
+            if not OFFLINE_DB:
+                raise RuntimeError("GEOLOCATION_DB não configurado para a geolocalização offline")
+            _offline_db = geo_offline.open_database(OFFLINE_DB)
+        return _offline_db
+
+
+def _geolocate_offline(ips, db: Session) -> int:
+    base = offline_database()
+    ips_by_endereco = {ip.endereco: ip for ip in ips}
+    resultados = {}
+    for endereco in ips_by_endereco:
+        data = base.lookup(endereco)
+        if data:
+            resultados[endereco] = data
+    return _commit(db, _apply(ips_by_endereco, resultados))
+
+
+def resolve_ips(ips, db: Session) -> int:
+    """Geolocaliza os IPs informados pela origem configurada; devolve quantos foram resolvidos"""
+    if not ips:
+        return 0
+    if BACKEND == "offline":
+        return _geolocate_offline(ips, db)
+    return asyncio.run(_geolocate(ips, db))
+
+
+# Etapa da importação: IPs novos entram numa fila e uma thread própria os resolve,
+# com sessão própria (a sessão da requisição é fechada antes de tarefas em background rodarem).
+# IP.endereco é único em todas as operações, então cada IP é resolvido uma única vez.
+WORKER_CHUNK = int(os.getenv("GEOLOCATION_WORKER_CHUNK", "1000"))
+
+_queue = queue.Queue()
+_pending = set()    # ids na fila ou em processamento
+_attempted = set()  # ids que o provedor não resolveu (IPs privados, inválidos, falha de rede)
+_state_lock = Lock()
+_worker = None
+
+
+def enqueue_ips(ip_ids, retry: bool = False) -> int:
+    """Coloca os IPs na fila de geolocalização; retry=True tenta de novo os que já falharam"""
+    global _worker
+    added = 0
+    with _state_lock:
+        for ip_id in ip_ids:
+            if ip_id in _pending or (ip_id in _attempted and not retry):
+                continue
+            _attempted.discard(ip_id)
+            _pending.add(ip_id)
+            _queue.put(ip_id)
+            added += 1
+        if added and (_worker is None or not _worker.is_alive()):
+            _worker = Thread(target=_run_worker, name="geolocation", daemon=True)
+            _worker.start()
+    return added
+
+
+def enqueue_operation(operacao_id: int) -> int:
+    """Enfileira os IPs ainda sem coordenadas de uma operação (sincronização manual)"""
+    db = SessionLocal()
+    try:
+        ip_ids = [row[0] for row in db.query(models.IP.id).join(models.Mensagem).filter(
+            models.Mensagem.operacao_id == operacao_id,
+            models.IP.latitude.is_(None)
+        ).distinct()]
+    finally:
+        db.close()
+    return enqueue_ips(ip_ids, retry=True)
+
+
+def pending_count() -> int:
+    with _state_lock:
+        return len(_pending)
+
+
+def _next_chunk():
+    chunk = [_queue.get()]
+    while len(chunk) < WORKER_CHUNK:
+        try:
+            chunk.append(_queue.get_nowait())
+        except queue.Empty:
+            break
+    return chunk
+
+
+def _run_worker():
+    while True:
+        chunk = _next_chunk()
+        db = SessionLocal()
+        try:
+            ips = db.query(models.IP).filter(
+                models.IP.id.in_(chunk),
+                models.IP.latitude.is_(None)  # pode ter sido resolvido por outra importação
+            ).all()
+            resolve_ips(ips, db)
+            unresolved = {ip_id for (ip_id,) in db.query(models.IP.id).filter(
+                models.IP.id.in_(chunk), models.IP.latitude.is_(None)
+            )}
+        except Exception as e:
+            print(f"Erro na geolocalização de {len(chunk)} IPs: {e}")
+            db.rollback()
+            unresolved = set(chunk)
+        finally:
+            db.close()
+        with _state_lock:
+            _pending.difference_update(chunk)
+            _attempted.update(unresolved)
@@ -0,0 +1,104 @@
+import json
+from fastapi import HTTPException
+from fastapi.responses import Response
+
+try:
+    import msgpack
+except ImportError:  # msgpack é opcional; sem ele o formato compacto sai em JSON
+    msgpack = None
+
+COMPACT_VERSION = 1
+
+
+def _count(columns) -> int:
+    return len(next(iter(columns.values()), ()))
+
+
+def concat_columns(*blocks):
+    """
+    Junta blocos de colunas (ex.: nós de IP e nós de telefone) em um só;
+    atributos que não existem em um bloco ficam None nas linhas dele.
+    """
+    keys = list(dict.fromkeys(key for block in blocks for key in block))
+    columns = {key: [] for key in keys}
+    for block in blocks:
+        count = _count(block)
+        for key in keys:
+            columns[key].extend(block[key] if key in block else [None] * count)
+    return columns
+
+
+def to_elements(graph):
+    """Elementos do Cytoscape ({"data": {...}} por nó e por aresta) a partir das colunas"""
+    return {
+        part: [{"data": dict(zip(columns, values))} for values in zip(*columns.values())]
+        for part, columns in graph.items()
+    }
+
+
+def _encode_columns(columns, string_index):
+    """
+    Colunas só de texto viram índices na tabela de strings (-1 = nulo);
+    as demais (números, booleanos) são mantidas como estão.
+    """
+    encoded = {}
+    string_columns = []
+    for key, values in columns.items():
+        if all(v is None or isinstance(v, str) for v in values):
+            encoded[key] = [string_index(v) if v is not None else -1 for v in values]
+            string_columns.append(key)
+        else:
+            encoded[key] = list(values)
+    return encoded, string_columns
+
+
+def encode_compact(graph):
+    """
+    Formato colunar do grafo: tabela de strings + colunas de atributos dos nós
+    + pares de índices (source/target) para as arestas.
+    """
+    strings = []
+    lookup = {}
+
+    def string_index(value):
+        idx = lookup.get(value)
+        if idx is None:
+            idx = lookup[value] = len(strings)
+            strings.append(value)
+        return idx
+
+    nodes = graph["nodes"]
+    edges = dict(graph["edges"])
+    node_pos = {node_id: i for i, node_id in enumerate(nodes.get("id", ()))}
+    node_columns, node_strings = _encode_columns(nodes, string_index)
+
+    # Arestas referenciam a posição do nó, não o id textual
+    sources = edges.pop("source", [])
+    targets = edges.pop("target", [])
+    edge_columns, edge_strings = _encode_columns(edges, string_index)
+    edge_columns["source"] = [node_pos.get(node_id, -1) for node_id in sources]
+    edge_columns["target"] = [node_pos.get(node_id, -1) for node_id in targets]
+
+    return {
+        "v": COMPACT_VERSION,
+        "strings": strings,
+        "nodes": {"count": _count(nodes), "columns": node_columns, "string_columns": node_strings},
+        "edges": {"count": len(sources), "columns": edge_columns, "string_columns": edge_strings}
+    }
+
+
+def graph_response(graph, formato: str = "json"):
+    """
+    Resposta do grafo no formato pedido, a partir das colunas montadas pelos endpoints
+    ({"nodes": {atributo: [valores]}, "edges": {"source": [...], "target": [...], ...}}):
+    json (padrão, elementos do Cytoscape), compacto (colunar em JSON) ou msgpack (colunar binário).
+    Os dicts por elemento do Cytoscape só são criados no formato json.
+    """
+    if formato == "compacto":
+        body = json.dumps(encode_compact(graph), separators=(",", ":"), ensure_ascii=False, default=str)
+        return Response(content=body, media_type="application/json")
+    if formato == "msgpack":
+        if msgpack is None:
+            raise HTTPException(status_code=400, detail="Formato msgpack indisponível no servidor")
+        return Response(content=msgpack.packb(encode_compact(graph), default=str), media_type="application/x-msgpack")
+    return {"elements": to_elements(graph)}
@@ -0,0 +1,310 @@
+from array import array
+from heapq import heappush, heappop, nsmallest
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+import backend.models as models
+from backend.services.cache import OperationCache, data_generation
+
+EDGE_MENSAGEM = 0
+EDGE_IP = 1
+
+
+class GraphIndex:
+    """
+    Adjacência compacta (CSR) de uma operação.
+    Nós: telefones (pelo número) e IPs ("ip_<id>", mesmo id usado em graph.py).
+    Arestas não direcionadas: mensagens trocadas entre dois telefones e uso de IP por um telefone.
+    """
+
+    def __init__(self, labels, edges):
+        self.labels = labels
+        self.index = {label: i for i, label in enumerate(labels)}
+
+        # Atributos por aresta (evidência)
+        self.edge_u = array('i')
+        self.edge_v = array('i')
+        self.edge_kind = array('b')
+        self.edge_count = array('q')
+        self.edge_first = []
+        self.edge_last = []
+
+        degree = [0] * len(labels)
+        for u, v, kind, count, first, last in edges:
+            self.edge_u.append(u)
+            self.edge_v.append(v)
+            self.edge_kind.append(kind)
+            self.edge_count.append(count)
+            self.edge_first.append(first)
+            self.edge_last.append(last)
+            degree[u] += 1
+            degree[v] += 1
+
+        # offsets[n] .. offsets[n+1] delimita os vizinhos do nó n
+        self.offsets = array('q', [0]) * (len(labels) + 1)
+        for n, d in enumerate(degree):
+            self.offsets[n + 1] = self.offsets[n] + d
+
+        self.targets = array('i', [0]) * (2 * len(self.edge_u))
+        self.edge_ids = array('q', [0]) * (2 * len(self.edge_u))
+        pos = array('q', self.offsets[:-1])
+        for e in range(len(self.edge_u)):
+            u, v = self.edge_u[e], self.edge_v[e]
+            self.targets[pos[u]] = v
+            self.edge_ids[pos[u]] = e
+            pos[u] += 1
+            self.targets[pos[v]] = u
+            self.edge_ids[pos[v]] = e
+            pos[v] += 1
+
+    @property
+    def total_edges(self):
+        return len(self.edge_u)
+
+    def is_ip(self, node: int) -> bool:
+        return self.labels[node].startswith("ip_")
+
+    def edge_weight(self, e: int, weighted: bool) -> float:
+        # No modo ponderado, vínculos com mais mensagens "custam" menos
+        return 1.0 / self.edge_count[e] if weighted else 1.0
+
+    def _neighbors(self, u: int, incluir_ips: bool):
+        for i in range(self.offsets[u], self.offsets[u + 1]):
+            e = self.edge_ids[i]
+            if not incluir_ips and self.edge_kind[e] == EDGE_IP:
+                continue
+            yield self.targets[i], e
+
+    def _bidirectional_bfs(self, s: int, t: int, incluir_ips: bool, max_saltos: int,
+                           banned_nodes=frozenset(), banned_edges=frozenset()):
+        """Menor caminho em número de saltos, expandindo sempre a menor fronteira"""
+        if s == t:
+            return (0.0, (s,), ())
+
+        prev_f = {s: None}
+        prev_b = {t: None}
+        frontier_f = [s]
+        frontier_b = [t]
+        depth = 0
+        meet = None
+
+        while frontier_f and frontier_b and depth < max_saltos and meet is None:
+            forward = len(frontier_f) <= len(frontier_b)
+            frontier, prev, other = (frontier_f, prev_f, prev_b) if forward else (frontier_b, prev_b, prev_f)
+            next_frontier = []
+            for u in frontier:
+                for v, e in self._neighbors(u, incluir_ips):
+                    if v in prev or v in banned_nodes or e in banned_edges:
+                        continue
+                    prev[v] = (u, e)
+                    if v in other:
+                        meet = v
+                        break
+                    next_frontier.append(v)
+                if meet is not None:
+                    break
+            if forward:
+                frontier_f = next_frontier
+            else:
+                frontier_b = next_frontier
+            depth += 1
+
+        if meet is None:
+            return None
+
+        nodes = [meet]
+        edges = []
+        node = meet
+        while prev_f[node] is not None:
+            node, e = prev_f[node]
+            nodes.append(node)
+            edges.append(e)
+        nodes.reverse()
+        edges.reverse()
+        node = meet
+        while prev_b[node] is not None:
+            node, e = prev_b[node]
+            nodes.append(node)
+            edges.append(e)
+
+        return (float(len(edges)), tuple(nodes), tuple(edges))
+
+    def _dijkstra(self, s: int, t: int, weighted: bool, incluir_ips: bool, max_saltos: int,
+                  banned_nodes=frozenset(), banned_edges=frozenset(), max_custo=float('inf')):
+        dist = {s: 0.0}
+        hops = {s: 0}
+        prev = {}
+        heap = [(0.0, s)]
+
+        while heap:
+            d, u = heappop(heap)
+            if u == t or d >= max_custo:
+                break
+            if d > dist[u] or hops[u] >= max_saltos:
+                continue
+            for v, e in self._neighbors(u, incluir_ips):
+                if v in banned_nodes or e in banned_edges:
+                    continue
+                nd = d + self.edge_weight(e, weighted)
+                if nd < dist.get(v, float('inf')):
+                    dist[v] = nd
+                    hops[v] = hops[u] + 1
+                    prev[v] = (u, e)
+                    heappush(heap, (nd, v))
+
+        if t not in dist or dist[t] >= max_custo:
+            return None
+
+        nodes = [t]
+        edges = []
+        node = t
+        while node != s:
+            node, e = prev[node]
+            nodes.append(node)
+            edges.append(e)
+        nodes.reverse()
+        edges.reverse()
+        return (dist[t], tuple(nodes), tuple(edges))
+
+    def k_shortest_paths(self, origem: str, destino: str, k: int = 1, weighted: bool = False,
+                         incluir_ips: bool = True, max_saltos: int = 6):
+        """
+        Até k caminhos simples entre dois nós (algoritmo de Yen).
+        Retorna lista de (custo, nós, arestas) com índices internos.
+        """
+        s = self.index[origem]
+        t = self.index[destino]
+
+        if weighted:
+            first = self._dijkstra(s, t, True, incluir_ips, max_saltos)
+        else:
+            first = self._bidirectional_bfs(s, t, incluir_ips, max_saltos)
+        if first is None:
+            return []
+
+        found = [first]
+        seen = {first[1]}
+        candidates = []
+
+        while len(found) < k:
+            _, last_nodes, last_edges = found[-1]
+            for i in range(len(last_nodes) - 1):
+                spur = last_nodes[i]
+                root_nodes = last_nodes[:i + 1]
+                root_edges = last_edges[:i]
+
+                banned_edges = {
+                    p_edges[i] for _, p_nodes, p_edges in found
+                    if len(p_edges) > i and p_nodes[:i + 1] == root_nodes
+                }
+                banned_nodes = set(root_nodes[:-1])
+
+                if weighted:
+                    # Não adianta procurar desvios mais caros que os candidatos já suficientes
+                    max_custo = float('inf')
+                    faltam = k - len(found)
+                    if len(candidates) >= faltam:
+                        root_cost = sum(self.edge_weight(e, True) for e in root_edges)
+                        max_custo = nsmallest(faltam, candidates)[-1][0] - root_cost
+                    spur_path = self._dijkstra(
+                        spur, t, True, incluir_ips, max_saltos - i,
+                        banned_nodes=banned_nodes, banned_edges=banned_edges, max_custo=max_custo
+                    )
+                else:
+                    spur_path = self._bidirectional_bfs(
+                        spur, t, incluir_ips, max_saltos - i,
+                        banned_nodes=banned_nodes, banned_edges=banned_edges
+                    )
+                if spur_path is None:
+                    continue
+
+                nodes = root_nodes[:-1] + spur_path[1]
+                if nodes in seen:
+                    continue
+                edges = root_edges + spur_path[2]
+                cost = sum(self.edge_weight(e, weighted) for e in edges)
+                seen.add(nodes)
+                heappush(candidates, (cost, nodes, edges))
+
+            if not candidates:
+                break
+            found.append(heappop(candidates))
+
+        return found
+
+
+def build_graph_index(db: Session, operacao_id: int) -> GraphIndex:
+    """Monta o índice com duas agregações: pares de telefones e uso de IP por telefone"""
+    pares = db.query(
+        models.Mensagem.remetente,
+        models.Mensagem.destinatario,
+        func.count(models.Mensagem.id),
+        func.min(models.Mensagem.data_hora),
+        func.max(models.Mensagem.data_hora)
+    ).filter(
+        models.Mensagem.operacao_id == operacao_id,
+        models.Mensagem.remetente.isnot(None),
+        models.Mensagem.destinatario.isnot(None)
+    ).group_by(
+        models.Mensagem.remetente,
+        models.Mensagem.destinatario
+    ).all()
+
+    usos_ip = db.query(
+        models.Mensagem.remetente,
+        models.Mensagem.ip_id,
+        func.count(models.Mensagem.id),
+        func.min(models.Mensagem.data_hora),
+        func.max(models.Mensagem.data_hora)
+    ).filter(
+        models.Mensagem.operacao_id == operacao_id,
+        models.Mensagem.ip_id.isnot(None),
+        models.Mensagem.remetente.isnot(None)
+    ).group_by(
+        models.Mensagem.remetente,
+        models.Mensagem.ip_id
+    ).all()
+
+    labels = []
+    index = {}
+
+    def node(label):
+        n = index.get(label)
+        if n is None:
+            n = index[label] = len(labels)
+            labels.append(label)
+        return n
+
+    # A->B e B->A viram uma única aresta com a soma das mensagens
+    mensagens = {}
+    for rem, dest, count, first, last in pares:
+        if rem == dest:
+            continue
+        u, v = node(rem), node(dest)
+        key = (u, v) if u < v else (v, u)
+        acc = mensagens.get(key)
+        if acc is None:
+            mensagens[key] = [count, first, last]
+        else:
+            acc[0] += count
+            if first is not None and (acc[1] is None or first < acc[1]):
+                acc[1] = first
+            if last is not None and (acc[2] is None or last > acc[2]):
+                acc[2] = last
+
+    edges = [(u, v, EDGE_MENSAGEM, c, f, l) for (u, v), (c, f, l) in mensagens.items()]
+    for tel, ip_id, count, first, last in usos_ip:
+        edges.append((node(tel), node(f"ip_{ip_id}"), EDGE_IP, count, first, last))
+
+    return GraphIndex(labels, edges)
+
+
+_index_cache = OperationCache(max_entries=4)
+
+
+def get_graph_index(db: Session, operacao_id: int) -> GraphIndex:
+    """Índice da operação, reaproveitado enquanto nenhum arquivo novo for importado"""
+    generation = data_generation(db, operacao_id)
+    index = _index_cache.get(operacao_id, generation)
+    if index is None:
+        index = _index_cache.put(operacao_id, generation, build_graph_index(db, operacao_id))
+    return index
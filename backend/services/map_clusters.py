@@ -0,0 +1,149 @@
+"""
+Agrupamento dos IPs do mapa em células de grade por nível de zoom.
+
+Cada operação tem um índice espacial em memória (IPs geolocalizados com o total de mensagens
+no período), ordenado por longitude: a janela visível (bbox) é achada por busca binária e só os
+pontos dentro dela são agregados. A célula tem 1/CELLS_PER_TILE do tamanho de um tile do zoom,
+então o número de clusters na tela fica limitado, qualquer que seja o tamanho da operação.
+"""
+import math
+from bisect import bisect_left, bisect_right
+from fastapi import HTTPException
+from sqlalchemy import and_, func
+from sqlalchemy.orm import Session
+import backend.models as models
+from backend.services.cache import OperationCache, source_versions
+from backend.services.message_filters import date_filters
+
+CELLS_PER_TILE = 4
+MAX_ZOOM = 22
+
+
+class PointIndex:
+    """IPs geolocalizados da operação em listas paralelas ordenadas por longitude"""
+
+    def __init__(self, rows):
+        rows = sorted(rows, key=lambda r: (r[2], r[1]))
+        self.ip_ids = [r[0] for r in rows]
+        self.lats = [r[1] for r in rows]
+        self.lons = [r[2] for r in rows]
+        self.totais = [r[3] for r in rows]
+
+    def __len__(self):
+        return len(self.ip_ids)
+
+    def within(self, min_lon, min_lat, max_lon, max_lat):
+        """Posições dos pontos dentro do retângulo (min_lon > max_lon cruza o antimeridiano)"""
+        if min_lon > max_lon:
+            faixas = [(min_lon, 180.0), (-180.0, max_lon)]
+        else:
+            faixas = [(min_lon, max_lon)]
+        for inicio, fim in faixas:
+            for i in range(bisect_left(self.lons, inicio), bisect_right(self.lons, fim)):
+                if min_lat <= self.lats[i] <= max_lat:
+                    yield i
+
+
+_index_cache = OperationCache(max_entries=16)
+
+
+def get_index(db: Session, operacao_id: int, data_inicio=None, data_fim=None) -> PointIndex:
+    """Índice espacial da operação no período (refeito após importações ou novas geolocalizações)"""
+    generation = tuple(source_versions(db, operacao_id, ("mensagens", "ips")).values())
+    key = (operacao_id, data_inicio, data_fim)
+    index = _index_cache.get(key, generation)
+    if index is not None:
+        return index
+
+    rows = db.query(
+        models.IP.id,
+        models.IP.latitude,
+        models.IP.longitude,
+        func.count(models.Mensagem.id)
+    ).join(
+        models.Mensagem, models.Mensagem.ip_id == models.IP.id
+    ).filter(
+        models.Mensagem.operacao_id == operacao_id,
+        models.IP.latitude.isnot(None),
+        models.IP.longitude.isnot(None),
+        *date_filters(data_inicio, data_fim)
+    ).group_by(models.IP.id, models.IP.latitude, models.IP.longitude).all()
+
+    return _index_cache.put(key, generation, PointIndex(rows))
+
+
+def cell_size(zoom: int) -> float:
+    """Lado da célula em graus no zoom"""
+    return 360.0 / (2 ** zoom * CELLS_PER_TILE)
+
+
+def parse_bbox(bbox: str):
+    """'oeste,sul,leste,norte' (formato do Leaflet toBBoxString); 400 se inválido"""
+    try:
+        min_lon, min_lat, max_lon, max_lat = (float(v) for v in bbox.split(","))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="bbox deve ser 'oeste,sul,leste,norte'")
+    if max_lon - min_lon >= 360:
+        min_lon, max_lon = -180.0, 180.0
+    elif min_lon < -180 or max_lon > 180:
+        # O Leaflet devolve longitudes fora de [-180, 180] quando o mapa dá a volta no globo
+        min_lon = (min_lon + 180) % 360 - 180
+        max_lon = (max_lon + 180) % 360 - 180
+    return min_lon, max(min_lat, -90.0), max_lon, min(max_lat, 90.0)
+
+
+def cell_key(zoom: int, lat: float, lon: float) -> str:
+    size = cell_size(zoom)
+    return f"{zoom}/{math.floor((lon + 180) / size)}/{math.floor((lat + 90) / size)}"
+
+
+def cell_bounds(chave: str):
+    """(min_lon, min_lat, max_lon, max_lat) da célula; 400 se a chave for inválida"""
+    try:
+        zoom, x, y = (int(v) for v in chave.split("/"))
+        if not 0 <= zoom <= MAX_ZOOM:
+            raise ValueError
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Cluster inválido")
+    size = cell_size(zoom)
+    return x * size - 180, y * size - 90, (x + 1) * size - 180, (y + 1) * size - 90
+
+
+def clusters(index: PointIndex, bbox, zoom: int):
+    """Clusters da janela: centro ponderado pelas mensagens, quantidade de IPs e de mensagens"""
+    cells = {}
+    for i in index.within(*bbox):
+        key = cell_key(zoom, index.lats[i], index.lons[i])
+        cell = cells.get(key)
+        if cell is None:
+            cell = cells[key] = {"ips": 0, "total": 0, "peso": 0, "lat": 0.0, "lon": 0.0, "ip_id": None}
+        peso = index.totais[i] or 1
+        cell["ips"] += 1
+        cell["total"] += index.totais[i]
+        cell["lat"] += index.lats[i] * peso
+        cell["lon"] += index.lons[i] * peso
+        cell["peso"] += peso
+        cell["ip_id"] = index.ip_ids[i]
+
+    return [
+        {
+            "chave": key,
+            "latitude": cell["lat"] / cell["peso"],
+            "longitude": cell["lon"] / cell["peso"],
+            "total_ips": cell["ips"],
+            "total_mensagens": cell["total"],
+            # Célula com um IP só: o cliente pode mostrar o marcador do próprio IP
+            "ip_id": cell["ip_id"] if cell["ips"] == 1 else None
+        }
+        for key, cell in cells.items()
+    ]
+
+
+
+def cell_filter(chave: str):
+    """Condição dos IPs da célula (intervalos semiabertos, como o arredondamento de cell_key)"""
+    min_lon, min_lat, max_lon, max_lat = cell_bounds(chave)
+    return and_(
+        models.IP.longitude >= min_lon, models.IP.longitude < max_lon,
+        models.IP.latitude >= min_lat, models.IP.latitude < max_lat
+    )
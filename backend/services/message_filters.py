@@ -0,0 +1,116 @@
+"""
+Filtros de período e de busca das mensagens (compartilhados pela listagem e pela exportação).
+
+A busca escolhe o tipo de comparação pelo formato do termo, para que cada caso use um índice:
+- número de telefone completo: igualdade com as colunas de telefone sem separadores
+  (os números ficam gravados como vieram do arquivo: +55 (11) 9...), atendida pelos
+  índices de expressão criados em migrate_indices_performance;
+- IP completo: igualdade em ips.endereco (índice único), filtrando mensagens por ip_id;
+- demais termos: substring (LIKE '%termo%'), atendida pelos índices GIN de trigramas (pg_trgm).
+O IP é filtrado por subconsulta em ips, sem join com mensagens.
+"""
+import ipaddress
+import re
+from typing import Optional
+from sqlalchemy import func, or_, select
+import backend.models as models
+
+# Números completos (DDI + DDD + número) têm pelo menos 12 dígitos
+FULL_PHONE_DIGITS = 12
+
+MODOS_BUSCA = ("auto", "exato", "prefixo", "contem")
+
+_PHONE_RE = re.compile(r"^\+?[\d\s().-]+$")
+
+# Caracteres removidos dos números gravados antes da comparação com os dígitos da busca.
+# A expressão precisa ser a mesma dos índices ix_mensagens_*_digitos (migrate_indices_performance).
+PHONE_SEPARATORS = ("+", " ", "-", "(", ")", ".")
+
+
+def needs_ip_search(search: Optional[str]) -> bool:
+    """A busca só precisa da tabela de IPs se o termo puder ser parte de um endereço"""
+    return bool(search) and any(c.isdigit() or c == '.' or c == ':' for c in search)
+
+
+def date_filters(data_inicio: Optional[str] = None, data_fim: Optional[str] = None):
+    """Condições do período; data_fim no formato YYYY-MM-DD inclui o dia inteiro"""
+    conditions = []
+    if data_inicio:
+        conditions.append(models.Mensagem.data_hora >= data_inicio)
+    if data_fim:
+        if len(data_fim) == 10:  # Formato YYYY-MM-DD
+            data_fim = data_fim + " 23:59:59"
+        conditions.append(models.Mensagem.data_hora <= data_fim)
+    return conditions
+
+
+def _is_ip(term: str) -> bool:
+    try:
+        ipaddress.ip_address(term)
+        return True
+    except ValueError:
+        return False
+
+
+def _phone_digits(term: str) -> Optional[str]:
+    """Dígitos do termo se ele tiver cara de telefone (+55 (11) 9...), senão None"""
+    if not _PHONE_RE.match(term) or '.' in term:
+        return None
+    digits = re.sub(r"\D", "", term)
+    return digits or None
+
+
+def phone_digits_expr(column):
+    """Coluna de telefone sem os separadores (só os dígitos, para números bem formados)"""
+    expr = column
+    for sep in PHONE_SEPARATORS:
+        expr = func.replace(expr, sep, "")
+    return expr
+
+
+def plan_search(search: str, modo: str = "auto"):
+    """
+    Decide a comparação da busca: (modo, termo, colunas de texto, incluir IP).
+    modo final é 'exato', 'prefixo' ou 'contem'.
+    """
+    term = search.strip()
+    text_columns = [
+        models.Mensagem.alvo,
+        models.Mensagem.remetente,
+        models.Mensagem.destinatario,
+        models.Mensagem.tipo_mensagem
+    ]
+    phone_columns = text_columns[:3]
+
+    if modo != "auto":
+        return modo, term, text_columns, needs_ip_search(term)
+
+    if _is_ip(term):
+        return "exato", term, [], True
+
+    digits = _phone_digits(term)
+    if digits and len(digits) >= FULL_PHONE_DIGITS:
+        return "exato", digits, [phone_digits_expr(c) for c in phone_columns], False
+    if digits:
+        # Trecho de número: telefones e IPs (tipos de mensagem não têm dígitos)
+        return "contem", digits, phone_columns, True
+
+    return "contem", term, text_columns, needs_ip_search(term)
+
+
+def _match(column, modo: str, term: str):
+    if modo == "exato":
+        return column == term
+    if modo == "prefixo":
+        return column.startswith(term, autoescape=True)
+    return column.contains(term, autoescape=True)
+
+
+def search_filter(search: str, modo: str = "auto"):
+    """Condição da busca em alvo, remetente, destinatário, tipo e endereço IP"""
+    modo, term, columns, include_ip = plan_search(search, modo)
+    conditions = [_match(column, modo, term) for column in columns]
+    if include_ip:
+        ips = select(models.IP.id).where(_match(models.IP.endereco, modo, term))
+        conditions.append(models.Mensagem.ip_id.in_(ips))
+    return or_(*conditions)
@@ -0,0 +1,76 @@
+"""
+Paginação por cursor (keyset) sobre (coluna de ordenação, id).
+
+O cursor é opaco para o cliente: JSON em base64url com a coluna, a direção,
+os valores da última (ou primeira) linha da página e o sentido da navegação.
+NULL é tratado como o maior valor (padrão do PostgreSQL: NULLS LAST em ASC,
+NULLS FIRST em DESC). A partir de um cursor, a página é lida em etapas (keyset_steps),
+cada uma limitada a uma faixa do índice nos dois sentidos.
+"""
+import base64
+import json
+from datetime import datetime
+from sqlalchemy import and_, tuple_
+from fastapi import HTTPException
+
+
+def encode_cursor(sort_by: str, order: str, value, row_id: int, direction: str) -> str:
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    payload = json.dumps({"s": sort_by, "o": order, "v": value, "i": row_id, "d": direction}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token: str, sort_by: str, order: str, column):
+    """Devolve (valor, id, sentido); 400 se o cursor for inválido ou de outra ordenação"""
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        value, row_id, direction = data["v"], int(data["i"]), data["d"]
+        if data["s"] != sort_by or data["o"] != order or direction not in ("next", "prev"):
+            raise ValueError
+        if value is not None and _is_datetime(column):
+            value = datetime.fromisoformat(value)
+    except HTTPException:
+        raise
+    except Exception:
+        raise HTTPException(status_code=400, detail="Cursor inválido para esta ordenação")
+    return value, row_id, direction
+
+
+def _is_datetime(column) -> bool:
+    try:
+        return column.type.python_type is datetime
+    except NotImplementedError:
+        return False
+
+
+def order_by(column, id_column, descending: bool):
+    """Ordenação estável da página (NULL como maior valor)"""
+    if descending:
+        return [column.desc().nulls_first(), id_column.desc()]
+    return [column.asc().nulls_last(), id_column.asc()]
+
+
+def keyset_steps(column, id_column, value, row_id: int, descending: bool):
+    """
+    Consultas que cobrem, em ordem, as linhas depois de (value, row_id): [(condição, ordenação)].
+    Cada uma lê uma faixa contígua do índice (operacao_id, coluna, id). A comparação de tuplas
+    não alcança os NULL, então eles ficam numa etapa própria: antes dos valores em DESC,
+    depois deles em ASC. Uma etapa só é executada se as anteriores não completaram a página.
+    """
+    if descending:
+        values = [column.desc(), id_column.desc()]
+        if value is None:
+            return [
+                (and_(column.is_(None), id_column < row_id), [id_column.desc()]),
+                (column.isnot(None), values),
+            ]
+        return [(tuple_(column, id_column) < tuple_(value, row_id), values)]
+
+    if value is None:
+        return [(and_(column.is_(None), id_column > row_id), [id_column.asc()])]
+    steps = [(tuple_(column, id_column) > tuple_(value, row_id), [column.asc(), id_column.asc()])]
+    if column is not id_column:
+        steps.append((column.is_(None), [id_column.asc()]))
+    return steps
@@ -3,6 +3,7 @@ from datetime import datetime
 from io import BytesIO
 from sqlalchemy.orm import Session
 import backend.models as models
+from backend.services import geolocation, rollups
 import pypdf
 import re
 
@@ -73,6 +74,12 @@ def _process_data_list(data_list: list, operacao_id: int, db: Session):
     }
     ips_cache = {}
     telefones_cache = {}
+    ips_sem_local = []  # IPs novos (ou ainda não geolocalizados) para a etapa de geolocalização
+    
+    # Intervalo de datas importado (para atualizar os agregados diários)
+    dt_min = None
+    dt_max = None
+    tem_sem_data = False  # mensagens cuja data não foi reconhecida (hora NULL no agregado)
     
     # Listas para batch insert
     mensagens_batch = []
@@ -125,8 +132,11 @@ def _process_data_list(data_list: list, operacao_id: int, db: Session):
                     db.add(new_ip)
                     db.flush()  # Necessário para pegar o ID
                     ips_cache[ip_addr] = new_ip.id
+                    ips_sem_local.append(new_ip.id)
                 else:
                     ips_cache[ip_addr] = existing_ip.id
+                    if existing_ip.latitude is None:
+                        ips_sem_local.append(existing_ip.id)
             ip_id = ips_cache[ip_addr]
 
         # Processar Telefones
@@ -168,6 +178,14 @@ def _process_data_list(data_list: list, operacao_id: int, db: Session):
                     except:
                         pass
             
+            if dt is None:
+                tem_sem_data = True
+            else:
+                if dt_min is None or dt < dt_min:
+                    dt_min = dt
+                if dt_max is None or dt > dt_max:
+                    dt_max = dt
+            
             porta = None
             if data.get('PORTA') and str(data['PORTA']).isdigit():
                 porta = int(data['PORTA'])
@@ -203,6 +221,15 @@ def _process_data_list(data_list: list, operacao_id: int, db: Session):
         db.bulk_insert_mappings(models.Mensagem, mensagens_batch)
         db.commit()
     
+    # Atualizar agregados diários e horários apenas no período afetado
+    # (e o grupo sem data, se a importação trouxe mensagens sem data reconhecida)
+    if dt_min is not None or tem_sem_data:
+        rollups.refresh_import(db, operacao_id, dt_min, dt_max, sem_data=tem_sem_data)
+
+    # Geolocalização dos IPs em segundo plano (já gravados, visíveis para a sessão do worker)
+    if ips_sem_local:
+        geolocation.enqueue_ips(ips_sem_local)
+    
     # Log do resumo
     print(f"\n=== Resumo da importação ===")
     print(f"Mensagens processadas: {processed_count}")
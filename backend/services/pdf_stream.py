@@ -0,0 +1,191 @@
+"""
+Geração de PDFs por grupos de páginas, enviados à medida que ficam prontos.
+
+O ReportLab só serializa o documento (objetos e tabela xref) no fim do build, então montar
+o relatório inteiro de uma vez segura tudo na memória antes do primeiro byte. Aqui cada grupo
+de flowables (uma seção do relatório) é montado como um PDF pequeno e independente, e as
+páginas dele são copiadas para a saída com os objetos renumerados (PDFPageWriter) e enviadas
+em seguida. Só a árvore de páginas, o catálogo e a xref dependem do documento inteiro, e são
+escritos no final. A memória fica limitada ao maior grupo, qualquer que seja o total de páginas.
+
+Um grupo é uma lista de flowables, um PDF já montado (bytes) ou o caminho de um PDF já gerado
+(páginas copiadas como estão). Os grupos podem vir de um gerador: cada um só é montado depois
+que o anterior foi enviado.
+"""
+import io
+from collections import deque
+from fastapi.responses import StreamingResponse
+from pypdf import PdfReader
+from pypdf.generic import ArrayObject, DictionaryObject, IndirectObject, NameObject, NumberObject
+from reportlab.lib.pagesizes import A4
+from reportlab.platypus import PageBreak, SimpleDocTemplate
+
+
+class PDFPageWriter:
+    """
+    Escreve um PDF de forma incremental: cada chamada devolve os bytes a enviar.
+    Os objetos 1 (catálogo) e 2 (árvore de páginas) são reservados e escritos em end().
+    """
+    CATALOG = 1
+    PAGES = 2
+
+    def __init__(self):
+        self.position = 0
+        self.offsets = {}
+        self.pages = []
+        self._next_number = 3
+
+    def _out(self, data: bytes) -> bytes:
+        self.position += len(data)
+        return data
+
+    def _object(self, number: int, obj) -> bytes:
+        self.offsets[number] = self.position
+        buffer = io.BytesIO()
+        buffer.write(f"{number} 0 obj\n".encode("ascii"))
+        obj.write_to_stream(buffer)
+        buffer.write(b"\nendobj\n")
+        return self._out(buffer.getvalue())
+
+    def begin(self) -> bytes:
+        return self._out(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+
+    def add_pages(self, source):
+        """
+        Copia as páginas de um PDF (bytes ou caminho), uma a uma: devolve os bytes de cada
+        página junto com os objetos que ela usa e que ainda não foram escritos (fontes etc.)
+        """
+        reader = PdfReader(io.BytesIO(source) if isinstance(source, bytes) else source)
+        numbers = {}  # objeto no PDF de origem -> número na saída
+        pending = deque()
+
+        def ref(indirect):
+            if indirect.idnum not in numbers:
+                numbers[indirect.idnum] = self._next_number
+                self._next_number += 1
+                pending.append(indirect)
+            return IndirectObject(numbers[indirect.idnum], 0, None)
+
+        page_refs = [page.indirect_reference for page in reader.pages]
+        page_ids = {page_ref.idnum for page_ref in page_refs}
+        for page_ref in page_refs:
+            self.pages.append(ref(page_ref).idnum)
+            chunks = []
+            while pending:
+                source_ref = pending.popleft()
+                obj = source_ref.get_object()
+                is_page = source_ref.idnum in page_ids
+                if is_page:
+                    # A árvore de páginas da origem não é copiada; a página passa a apontar para a nossa
+                    dict.pop(obj, NameObject("/Parent"), None)
+                _remap(obj, ref)
+                if is_page:
+                    obj[NameObject("/Parent")] = IndirectObject(self.PAGES, 0, None)
+                chunks.append(self._object(numbers[source_ref.idnum], obj))
+            # Objetos já escritos não são lidos de novo: libera o cache do leitor (conteúdo das páginas)
+            reader.resolved_objects.clear()
+            yield b"".join(chunks)
+
+    def end(self) -> bytes:
+        pages = DictionaryObject({
+            NameObject("/Type"): NameObject("/Pages"),
+            NameObject("/Kids"): ArrayObject(IndirectObject(n, 0, None) for n in self.pages),
+            NameObject("/Count"): NumberObject(len(self.pages))
+        })
+        catalog = DictionaryObject({
+            NameObject("/Type"): NameObject("/Catalog"),
+            NameObject("/Pages"): IndirectObject(self.PAGES, 0, None)
+        })
+        chunks = [self._object(self.PAGES, pages), self._object(self.CATALOG, catalog)]
+
+        xref = self.position
+        size = self._next_number
+        lines = [f"xref\n0 {size}\n", "0000000000 65535 f \n"]
+        lines += [f"{self.offsets[n]:010d} 00000 n \n" for n in range(1, size)]
+        lines.append(f"trailer\n<< /Size {size} /Root {self.CATALOG} 0 R >>\nstartxref\n{xref}\n%%EOF\n")
+        chunks.append(self._out("".join(lines).encode("ascii")))
+        return b"".join(chunks)
+
+
+def _remap(obj, ref):
+    """Troca, no lugar, as referências do PDF de origem pelas da saída"""
+    if isinstance(obj, IndirectObject):
+        return ref(obj)
+    if isinstance(obj, DictionaryObject):
+        # dict.items/list.__getitem__ para não resolver as referências (o pypdf resolve no [])
+        for key, value in list(dict.items(obj)):
+            dict.__setitem__(obj, key, _remap(value, ref))
+    elif isinstance(obj, ArrayObject):
+        for i in range(len(obj)):
+            list.__setitem__(obj, i, _remap(list.__getitem__(obj, i), ref))
+    return obj
+
+
+def render_pages(flowables, pagesize=A4) -> bytes:
+    """Monta um grupo de flowables como um PDF independente"""
+    buffer = io.BytesIO()
+    SimpleDocTemplate(buffer, pagesize=pagesize).build(list(flowables))
+    return buffer.getvalue()
+
+
+def split_pages(story):
+    """Divide uma story nos PageBreak: cada trecho vira um grupo de páginas"""
+    group = []
+    for flowable in story:
+        if isinstance(flowable, PageBreak):
+            if group:
+                yield group
+            group = []
+        else:
+            group.append(flowable)
+    if group:
+        yield group
+
+
+def iter_pdf(groups, pagesize=A4):
+    """Bytes do PDF, grupo a grupo"""
+    writer = PDFPageWriter()
+    yield writer.begin()
+    for group in groups:
+        if isinstance(group, (str, bytes)):
+            yield from writer.add_pages(group)
+        elif group:
+            yield from writer.add_pages(render_pages(group, pagesize))
+    yield writer.end()
+
+
+def tee_groups(groups, sink, pagesize=A4):
+    """
+    Monta cada grupo e o repassa (em bytes) para quem consome, gravando as mesmas páginas
+    em sink (arquivo aberto em modo binário) como um PDF próprio. O arquivo só fica
+    completo depois que o último grupo foi consumido.
+    """
+    writer = PDFPageWriter()
+    sink.write(writer.begin())
+    for group in groups:
+        if not group:
+            continue
+        data = group if isinstance(group, bytes) else render_pages(group, pagesize)
+        for chunk in writer.add_pages(data):
+            sink.write(chunk)
+        yield data
+    sink.write(writer.end())
+
+
+def write_pdf(path: str, groups, pagesize=A4):
+    """Grava o PDF em disco grupo a grupo (sem montar o documento inteiro na memória)"""
+    with open(path, "wb") as f:
+        for chunk in iter_pdf(groups, pagesize):
+            f.write(chunk)
+
+
+def pdf_streaming_response(groups, filename: str, pagesize=A4) -> StreamingResponse:
+    """
+    Envia o PDF em blocos: cada grupo é montado e enviado antes do seguinte.
+    Os grupos podem ser um gerador, consumido só enquanto a resposta é enviada.
+    """
+    return StreamingResponse(
+        iter_pdf(groups, pagesize),
+        media_type="application/pdf",
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    )
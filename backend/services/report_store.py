@@ -0,0 +1,150 @@
+"""
+Armazenamento dos relatórios em PDF já gerados.
+
+Cada artefato é identificado pela operação e pela impressão digital das versões
+dos dados usados nas análises, e gravado com nome único: um artefato publicado nunca é
+sobrescrito. Os substituídos (versões antigas da operação) e os menos usados, quando o
+diretório passa do tamanho máximo, são removidos depois, só quando não são usados há
+REPORTS_GRACE_SECONDS: uma resposta ainda lendo o arquivo não o perde no meio.
+"""
+import glob
+import hashlib
+import os
+import tempfile
+import time
+import uuid
+from threading import Lock
+
+REPORTS_DIR = os.getenv("REPORTS_DIR", os.path.join(tempfile.gettempdir(), "forense_relatorios"))
+REPORTS_MAX_MB = int(os.getenv("REPORTS_MAX_MB", "256"))
+REPORTS_GRACE_SECONDS = int(os.getenv("REPORTS_GRACE_SECONDS", "600"))
+
+
+def fingerprint(versions) -> str:
+    """Identificador curto e estável para um conjunto de versões"""
+    return hashlib.sha1(repr(versions).encode("utf-8")).hexdigest()[:16]
+
+
+class ReportStore:
+
+    def __init__(self, directory: str, max_bytes: int, grace_seconds: int = REPORTS_GRACE_SECONDS):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.grace_seconds = grace_seconds
+        self._lock = Lock()
+
+    def _new_path(self, operacao_id: int, key: str) -> str:
+        return os.path.join(self.directory, f"relatorio_{operacao_id}_{key}_{uuid.uuid4().hex[:12]}.pdf")
+
+    def _artifacts(self, operacao_id=None, key=None):
+        pattern = "relatorio_*.pdf"
+        if operacao_id is not None:
+            pattern = f"relatorio_{operacao_id}_{key or '*'}_*.pdf"
+        return glob.glob(os.path.join(self.directory, pattern))
+
+    def get(self, operacao_id: int, key: str):
+        """Caminho do relatório já gerado (o mais recente, se houver mais de um), ou None"""
+        for _, path in sorted(((self._mtime(p), p) for p in self._artifacts(operacao_id, key)), reverse=True):
+            try:
+                os.utime(path)  # Marca como usado recentemente para a evicção
+            except FileNotFoundError:
+                continue
+            return path
+        return None
+
+    def save(self, operacao_id: int, key: str, build):
+        """
+        Gera o relatório com build(caminho) em arquivo temporário no diretório
+        e o publica de forma atômica com nome novo. Retorna o caminho final.
+        """
+        tmp_path = self._tmp_path()
+        try:
+            build(tmp_path)
+        except BaseException:
+            self._remove(tmp_path)
+            raise
+        return self._publish(operacao_id, key, tmp_path)
+
+    def save_iter(self, operacao_id: int, key: str, build):
+        """
+        Como save, mas build(arquivo) é um gerador que grava no arquivo aberto enquanto produz
+        itens; os itens são repassados a quem consome (a resposta) à medida que saem. O artefato
+        só é publicado depois do último item: se o consumo parar antes (cliente desconectado),
+        o temporário é removido e nada é publicado.
+        """
+        tmp_path = self._tmp_path()
+        try:
+            with open(tmp_path, "wb") as f:
+                yield from build(f)
+        except BaseException:
+            self._remove(tmp_path)
+            raise
+        self._publish(operacao_id, key, tmp_path)
+
+    def _tmp_path(self) -> str:
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(suffix=".tmp", dir=self.directory)
+        os.close(fd)
+        return tmp_path
+
+    def _publish(self, operacao_id: int, key: str, tmp_path: str) -> str:
+        """Publica o temporário com nome novo e limpa as versões antigas. Retorna o caminho final"""
+        path = self._new_path(operacao_id, key)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._cleanup(operacao_id, keep=path)
+            self._evict(keep=path)
+        return path
+
+    def purge(self, operacao_id: int):
+        """Remove todos os relatórios da operação"""
+        with self._lock:
+            for path in self._artifacts(operacao_id):
+                self._remove(path)
+
+    def _idle(self, mtime: float) -> bool:
+        return time.time() - mtime >= self.grace_seconds
+
+    def _cleanup(self, operacao_id: int, keep: str):
+        """Versões substituídas da operação, que não são lidas há mais que o prazo de carência"""
+        for path in self._artifacts(operacao_id):
+            if path != keep and self._idle(self._mtime(path)):
+                self._remove(path)
+
+    def _evict(self, keep: str):
+        """Remove os relatórios menos usados (e fora da carência) até o diretório caber no limite"""
+        entries = []
+        for path in self._artifacts():
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+
+        used = sum(size for _, size, _ in entries)
+        for mtime, size, path in sorted(entries):
+            if used <= self.max_bytes:
+                break
+            if path == keep or not self._idle(mtime):
+                continue
+            self._remove(path)
+            used -= size
+
+    @staticmethod
+    def _mtime(path: str) -> float:
+        try:
+            return os.stat(path).st_mtime
+        except FileNotFoundError:
+            return 0.0
+
+    @staticmethod
+    def _remove(path: str):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except PermissionError:
+            pass  # Ainda aberto por uma resposta (Windows): fica para a próxima limpeza
+
+
+report_store = ReportStore(REPORTS_DIR, REPORTS_MAX_MB * 1024 * 1024)
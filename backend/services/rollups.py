@@ -0,0 +1,380 @@
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from threading import Lock
+from sqlalchemy import func, select, union_all
+from sqlalchemy.orm import Session
+import backend.models as models
+from backend.services import sql_compat
+from backend.services.hll import HyperLogLog
+
+
+def parse_dia(valor):
+    """Aceita 'YYYY-MM-DD' ou 'YYYY-MM-DD HH:MM:SS' e devolve a data (granularidade diária)"""
+    if valor is None or valor == "":
+        return None
+    if isinstance(valor, datetime):
+        return valor.date()
+    if isinstance(valor, date):
+        return valor
+    return datetime.strptime(valor[:10], "%Y-%m-%d").date()
+
+
+# Chave das travas consultivas (pg_advisory_xact_lock) dos agregados: (classe, operação)
+_ADVISORY_LOCK_CLASS = 4201
+_process_locks = defaultdict(Lock)
+_process_locks_guard = Lock()
+
+
+@contextmanager
+def rollup_lock(db: Session, operacao_id: int):
+    """
+    Serializa a escrita dos agregados de uma operação (importação e preenchimento inicial).
+    Trava do processo e, no PostgreSQL, trava consultiva da transação (vale entre workers);
+    quem usa deve fazer o commit dentro do bloco.
+    """
+    with _process_locks_guard:
+        lock = _process_locks[operacao_id]
+    with lock:
+        if db.bind.dialect.name == "postgresql":
+            db.execute(select(func.pg_advisory_xact_lock(_ADVISORY_LOCK_CLASS, operacao_id)))
+        yield
+
+
+def refresh_daily_edges(db: Session, operacao_id: int, inicio: date, fim: date):
+    """
+    Recalcula as arestas diárias da operação no intervalo [inicio, fim] (dias inclusivos).
+    Só os dias tocados por uma importação são reprocessados.
+    """
+    db.query(models.ArestaDiaria).filter(
+        models.ArestaDiaria.operacao_id == operacao_id,
+        models.ArestaDiaria.dia >= inicio,
+        models.ArestaDiaria.dia <= fim
+    ).delete(synchronize_session=False)
+
+    dia = func.date(models.Mensagem.data_hora)
+    agregado = select(
+        models.Mensagem.operacao_id,
+        dia,
+        models.Mensagem.remetente,
+        models.Mensagem.destinatario,
+        func.count(models.Mensagem.id)
+    ).where(
+        models.Mensagem.operacao_id == operacao_id,
+        models.Mensagem.data_hora >= datetime.combine(inicio, datetime.min.time()),
+        models.Mensagem.data_hora < datetime.combine(fim + timedelta(days=1), datetime.min.time()),
+        models.Mensagem.remetente.isnot(None),
+        models.Mensagem.destinatario.isnot(None)
+    ).group_by(
+        models.Mensagem.operacao_id,
+        dia,
+        models.Mensagem.remetente,
+        models.Mensagem.destinatario
+    )
+
+    db.execute(models.ArestaDiaria.__table__.insert().from_select(
+        ["operacao_id", "dia", "remetente", "destinatario", "quantidade"], agregado
+    ))
+
+
+def _has_daily_edges(db: Session, operacao_id: int) -> bool:
+    return db.query(models.ArestaDiaria.id).filter(
+        models.ArestaDiaria.operacao_id == operacao_id
+    ).first() is not None
+
+
+def _message_period(db: Session, operacao_id: int):
+    return db.query(
+        func.min(models.Mensagem.data_hora),
+        func.max(models.Mensagem.data_hora)
+    ).filter(models.Mensagem.operacao_id == operacao_id).first()
+
+
+def _backfill_daily_edges(db: Session, operacao_id: int):
+    inicio, fim = _message_period(db, operacao_id)
+    if inicio is not None:
+        refresh_daily_edges(db, operacao_id, inicio.date(), fim.date())
+
+
+def ensure_daily_edges(db: Session, operacao_id: int):
+    """Gera as arestas diárias de operações importadas antes da existência da tabela"""
+    if _has_daily_edges(db, operacao_id):
+        return
+
+    with rollup_lock(db, operacao_id):
+        # Outra requisição pode ter gerado o agregado enquanto esta esperava a trava
+        if _has_daily_edges(db, operacao_id):
+            db.commit()
+            return
+
+        _backfill_daily_edges(db, operacao_id)
+        db.commit()
+
+
+def daily_edge_weights(db: Session, operacao_id: int, inicio: date = None, fim: date = None):
+    """Soma das arestas diárias na janela [inicio, fim]: lista de (remetente, destinatario, total)"""
+    ensure_daily_edges(db, operacao_id)
+
+    query = db.query(
+        models.ArestaDiaria.remetente,
+        models.ArestaDiaria.destinatario,
+        func.sum(models.ArestaDiaria.quantidade)
+    ).filter(models.ArestaDiaria.operacao_id == operacao_id)
+
+    if inicio:
+        query = query.filter(models.ArestaDiaria.dia >= inicio)
+    if fim:
+        query = query.filter(models.ArestaDiaria.dia <= fim)
+
+    return [
+        (rem, dest, int(total))
+        for rem, dest, total in query.group_by(
+            models.ArestaDiaria.remetente,
+            models.ArestaDiaria.destinatario
+        ).all()
+    ]
+
+
+def top_edge_phones(db: Session, operacao_id: int, limit: int):
+    """
+    Números com mais mensagens como remetente ou destinatário, somando as arestas diárias:
+    lista de (numero, total). Mensagens sem data ou sem um dos lados não têm aresta e não contam.
+    """
+    ensure_daily_edges(db, operacao_id)
+
+    envolvidos = union_all(
+        select(
+            models.ArestaDiaria.remetente.label("numero"),
+            models.ArestaDiaria.quantidade
+        ).where(
+            models.ArestaDiaria.operacao_id == operacao_id,
+            models.ArestaDiaria.remetente != ''
+        ),
+        select(
+            models.ArestaDiaria.destinatario.label("numero"),
+            models.ArestaDiaria.quantidade
+        ).where(
+            models.ArestaDiaria.operacao_id == operacao_id,
+            models.ArestaDiaria.destinatario != ''
+        )
+    ).subquery()
+
+    total = func.sum(envolvidos.c.quantidade).label("total")
+    return [
+        (numero, int(soma))
+        for numero, soma in db.query(envolvidos.c.numero, total).group_by(
+            envolvidos.c.numero
+        ).order_by(total.desc(), envolvidos.c.numero).limit(limit).all()
+    ]
+
+
+def _hour_floor(dt: datetime) -> datetime:
+    return dt.replace(minute=0, second=0, microsecond=0)
+
+
+def refresh_hourly(db: Session, operacao_id: int, inicio: datetime = None, fim: datetime = None, sem_data: bool = False):
+    """
+    Recalcula o agregado horário da operação nas horas de [inicio, fim].
+    sem_data=True recalcula também o grupo das mensagens sem data (hora NULL).
+    Remetentes e IPs distintos de cada (hora, tipo) viram sketches HyperLogLog.
+    """
+    buckets = defaultdict(lambda: [0, HyperLogLog(), HyperLogLog()])
+
+    if inicio is not None:
+        inicio = _hour_floor(inicio)
+        fim = _hour_floor(fim) + timedelta(hours=1)
+
+        db.query(models.MensagemHoraria).filter(
+            models.MensagemHoraria.operacao_id == operacao_id,
+            models.MensagemHoraria.hora >= inicio,
+            models.MensagemHoraria.hora < fim
+        ).delete(synchronize_session=False)
+
+        hora = sql_compat.time_bucket(db, 'hour', models.Mensagem.data_hora)
+        rows = db.query(
+            hora,
+            models.Mensagem.tipo_mensagem,
+            models.Mensagem.remetente,
+            func.count(models.Mensagem.id)
+        ).filter(
+            models.Mensagem.operacao_id == operacao_id,
+            models.Mensagem.data_hora >= inicio,
+            models.Mensagem.data_hora < fim
+        ).group_by(
+            hora,
+            models.Mensagem.tipo_mensagem,
+            models.Mensagem.remetente
+        ).yield_per(10000)
+
+        for h, tipo, remetente, count in rows:
+            bucket = buckets[(sql_compat.as_datetime(h), tipo)]
+            bucket[0] += count
+            if remetente:
+                bucket[1].add(remetente)
+
+        ips = db.query(
+            hora,
+            models.Mensagem.tipo_mensagem,
+            models.Mensagem.ip_id
+        ).filter(
+            models.Mensagem.operacao_id == operacao_id,
+            models.Mensagem.data_hora >= inicio,
+            models.Mensagem.data_hora < fim,
+            models.Mensagem.ip_id.isnot(None)
+        ).distinct().yield_per(10000)
+
+        for h, tipo, ip_id in ips:
+            buckets[(sql_compat.as_datetime(h), tipo)][2].add(ip_id)
+
+    if sem_data:
+        db.query(models.MensagemHoraria).filter(
+            models.MensagemHoraria.operacao_id == operacao_id,
+            models.MensagemHoraria.hora.is_(None)
+        ).delete(synchronize_session=False)
+
+        rows = db.query(
+            models.Mensagem.tipo_mensagem,
+            models.Mensagem.remetente,
+            func.count(models.Mensagem.id)
+        ).filter(
+            models.Mensagem.operacao_id == operacao_id,
+            models.Mensagem.data_hora.is_(None)
+        ).group_by(
+            models.Mensagem.tipo_mensagem,
+            models.Mensagem.remetente
+        ).yield_per(10000)
+
+        for tipo, remetente, count in rows:
+            bucket = buckets[(None, tipo)]
+            bucket[0] += count
+            if remetente:
+                bucket[1].add(remetente)
+
+        ips = db.query(
+            models.Mensagem.tipo_mensagem,
+            models.Mensagem.ip_id
+        ).filter(
+            models.Mensagem.operacao_id == operacao_id,
+            models.Mensagem.data_hora.is_(None),
+            models.Mensagem.ip_id.isnot(None)
+        ).distinct().yield_per(10000)
+
+        for tipo, ip_id in ips:
+            buckets[(None, tipo)][2].add(ip_id)
+
+    db.bulk_insert_mappings(models.MensagemHoraria, [
+        {
+            "operacao_id": operacao_id,
+            "hora": h,
+            "tipo_mensagem": tipo,
+            "quantidade": count,
+            "remetentes": senders.to_bytes(),
+            "ips": ips.to_bytes()
+        }
+        for (h, tipo), (count, senders, ips) in buckets.items()
+    ])
+
+
+def _has_hourly(db: Session, operacao_id: int) -> bool:
+    return db.query(models.MensagemHoraria.id).filter(
+        models.MensagemHoraria.operacao_id == operacao_id
+    ).first() is not None
+
+
+def _backfill_hourly(db: Session, operacao_id: int):
+    inicio, fim = _message_period(db, operacao_id)
+    refresh_hourly(db, operacao_id, inicio, fim, sem_data=True)
+
+
+def ensure_hourly(db: Session, operacao_id: int):
+    """Gera o agregado horário de operações importadas antes da existência da tabela"""
+    if _has_hourly(db, operacao_id):
+        return
+
+    with rollup_lock(db, operacao_id):
+        # Outra requisição pode ter gerado o agregado enquanto esta esperava a trava
+        if _has_hourly(db, operacao_id):
+            db.commit()
+            return
+
+        _backfill_hourly(db, operacao_id)
+        db.commit()
+
+
+def refresh_import(db: Session, operacao_id: int, inicio: datetime = None, fim: datetime = None, sem_data: bool = False):
+    """
+    Atualiza os agregados depois de uma importação: só o período importado [inicio, fim]
+    e o grupo sem data (sem_data=True). Operações sem agregado ainda (importadas antes
+    das tabelas existirem) são agregadas por inteiro.
+    """
+    with rollup_lock(db, operacao_id):
+        if _has_daily_edges(db, operacao_id):
+            if inicio is not None:
+                refresh_daily_edges(db, operacao_id, inicio.date(), fim.date())
+        else:
+            _backfill_daily_edges(db, operacao_id)
+
+        if _has_hourly(db, operacao_id):
+            refresh_hourly(db, operacao_id, inicio, fim, sem_data=sem_data)
+        else:
+            _backfill_hourly(db, operacao_id)
+        db.commit()
+
+
+def hourly_totals(db: Session, operacao_id: int, com_tipo: bool = False):
+    """
+    Linhas do agregado horário: (hora, quantidade) somando os tipos,
+    ou (hora, tipo, quantidade) com com_tipo=True.
+    """
+    ensure_hourly(db, operacao_id)
+
+    columns = [models.MensagemHoraria.hora]
+    if com_tipo:
+        columns.append(models.MensagemHoraria.tipo_mensagem)
+
+    return db.query(
+        *columns,
+        func.sum(models.MensagemHoraria.quantidade)
+    ).filter(
+        models.MensagemHoraria.operacao_id == operacao_id
+    ).group_by(*columns).all()
+
+
+def hourly_senders(db: Session, operacao_id: int):
+    """(hora, quantidade, sketch de remetentes) por hora e tipo, para agregações por período"""
+    ensure_hourly(db, operacao_id)
+
+    return db.query(
+        models.MensagemHoraria.hora,
+        models.MensagemHoraria.quantidade,
+        models.MensagemHoraria.remetentes
+    ).filter(
+        models.MensagemHoraria.operacao_id == operacao_id
+    ).all()
+
+
+def hourly_rows(db: Session, operacao_id: int):
+    """Todas as linhas do agregado horário: (hora, tipo, quantidade, sketch de remetentes, sketch de IPs)"""
+    ensure_hourly(db, operacao_id)
+
+    return db.query(
+        models.MensagemHoraria.hora,
+        models.MensagemHoraria.tipo_mensagem,
+        models.MensagemHoraria.quantidade,
+        models.MensagemHoraria.remetentes,
+        models.MensagemHoraria.ips
+    ).filter(
+        models.MensagemHoraria.operacao_id == operacao_id
+    ).all()
+
+
+def distinct_ips(db: Session, operacao_id: int) -> int:
+    """IPs distintos da operação (aproximado), combinando os sketches do agregado horário"""
+    ensure_hourly(db, operacao_id)
+
+    sketch = HyperLogLog()
+    for (ips,) in db.query(models.MensagemHoraria.ips).filter(
+        models.MensagemHoraria.operacao_id == operacao_id
+    ):
+        sketch.merge(HyperLogLog.from_bytes(ips))
+    return sketch.count()
@@ -0,0 +1,40 @@
+"""
+Contagem de linhas com custo limitado.
+
+Conta exatamente até EXACT_COUNT_LIMIT linhas (COUNT sobre um LIMIT). Acima disso,
+no PostgreSQL usa a estimativa do planejador (EXPLAIN) e marca o total como aproximado.
+"""
+import json
+import os
+from typing import Optional
+from sqlalchemy import func, select
+from sqlalchemy.orm import Query, Session
+
+EXACT_COUNT_LIMIT = int(os.getenv("EXACT_COUNT_LIMIT", "100000"))
+
+
+def planner_estimate(db: Session, query: Query) -> Optional[int]:
+    """Linhas estimadas pelo planejador do PostgreSQL; None em outros bancos"""
+    if db.bind.dialect.name != "postgresql":
+        return None
+    compiled = query.statement.compile(dialect=db.bind.dialect)
+    row = db.connection().exec_driver_sql("EXPLAIN (FORMAT JSON) " + str(compiled), compiled.params).first()
+    plan = row[0] if not isinstance(row[0], str) else json.loads(row[0])
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+def count_rows(db: Session, query: Query, limit: Optional[int] = None):
+    """(total, aproximado) para as linhas da consulta; limit padrão: EXACT_COUNT_LIMIT"""
+    if limit is None:
+        limit = EXACT_COUNT_LIMIT
+    capped = query.limit(limit + 1).subquery()
+    total = db.execute(select(func.count()).select_from(capped)).scalar()
+    if total <= limit:
+        return total, False
+
+    estimate = planner_estimate(db, query)
+    if estimate is None:
+        # Sem estimativa do banco: conta tudo
+        return query.order_by(None).count(), False
+    # A estimativa nunca fica abaixo do que já foi contado
+    return max(estimate, total), True
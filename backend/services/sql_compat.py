@@ -0,0 +1,52 @@
+"""
+Expressões de agregação que variam entre PostgreSQL (Supabase) e SQLite (uso local/offline).
+
+As funções recebem a sessão (ou o dialeto) e devolvem a expressão equivalente em cada banco,
+para que as mesmas consultas agregadas rodem nos dois.
+"""
+from datetime import date, datetime
+from sqlalchemy import func, text
+from sqlalchemy.orm import Session
+
+# Formato do início de cada intervalo no SQLite (strftime)
+_SQLITE_BUCKETS = {
+    "hour": "%Y-%m-%d %H:00:00",
+    "day": "%Y-%m-%d 00:00:00",
+    "month": "%Y-%m-01 00:00:00",
+}
+
+
+def _dialect(db_or_dialect) -> str:
+    if isinstance(db_or_dialect, str):
+        return db_or_dialect
+    if isinstance(db_or_dialect, Session):
+        return db_or_dialect.bind.dialect.name
+    return db_or_dialect.dialect.name
+
+
+def time_bucket(db_or_dialect, unidade: str, column):
+    """Início do intervalo (hour, day ou month) do timestamp; use as_datetime no resultado"""
+    if unidade not in _SQLITE_BUCKETS:
+        raise ValueError(f"Unidade de tempo inválida: {unidade}")
+    if _dialect(db_or_dialect) == "sqlite":
+        return func.strftime(_SQLITE_BUCKETS[unidade], column)
+    return func.date_trunc(unidade, column)
+
+
+def as_datetime(valor):
+    """Normaliza o resultado de time_bucket (datetime no PostgreSQL, texto no SQLite)"""
+    if valor is None or isinstance(valor, datetime):
+        return valor
+    if isinstance(valor, date):
+        return datetime.combine(valor, datetime.min.time())
+    return datetime.fromisoformat(str(valor))
+
+
+def distinct_string_agg(db_or_dialect, column, separador: str = ","):
+    """Valores distintos concatenados (string_agg no PostgreSQL, group_concat no SQLite)"""
+    if _dialect(db_or_dialect) == "sqlite":
+        # group_concat com DISTINCT só aceita o separador padrão (vírgula)
+        if separador != ",":
+            raise ValueError("SQLite só concatena valores distintos com vírgula")
+        return func.group_concat(column.distinct())
+    return func.string_agg(column.distinct(), text(f"'{separador}'"))
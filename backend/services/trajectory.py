@@ -0,0 +1,102 @@
+"""
+Trajetória de um telefone a partir dos IPs das mensagens que ele enviou.
+
+As mensagens são lidas em ordem cronológica numa única consulta em streaming (yield_per), e
+mensagens consecutivas no mesmo local viram um único segmento (run-length): meses de histórico
+de um alvo se reduzem às mudanças de local. O local é a cidade do IP (agrupar='cidade') ou o
+próprio IP (agrupar='ip'). Mensagens sem local (sem IP ou, por cidade, IP sem geolocalização)
+não interrompem o segmento: entram no segmento corrente (ou no primeiro, se vierem antes dele).
+"""
+from sqlalchemy.orm import Session
+import backend.models as models
+from backend.services.message_filters import date_filters
+
+AGRUPAMENTOS = ("cidade", "ip")
+MAX_IPS_SEGMENTO = 10  # IPs listados por segmento (o total vem em total_ips)
+STREAM_CHUNK = 5000
+
+
+def _location_key(agrupar: str, row):
+    """Local da mensagem, ou None se ela não tem local no agrupamento pedido"""
+    if agrupar == "cidade":
+        return ("cidade", row.pais, row.cidade) if row.cidade else None
+    return ("ip", row.endereco) if row.endereco else None
+
+
+def _new_segment(row):
+    return {
+        "inicio": row.data_hora,
+        "fim": row.data_hora,
+        "cidade": row.cidade,
+        "pais": row.pais,
+        "latitude": row.latitude,
+        "longitude": row.longitude,
+        "ips": [row.endereco] if row.endereco else [],
+        "total_ips": 1 if row.endereco else 0,
+        "total_mensagens": 0
+    }
+
+
+def build_trajectory(db: Session, operacao_id: int, numero: str, agrupar: str = "cidade",
+                     data_inicio: str = None, data_fim: str = None):
+    """Segmentos (início, fim, local, mensagens) em ordem cronológica"""
+    rows = db.query(
+        models.Mensagem.data_hora,
+        models.IP.endereco,
+        models.IP.cidade,
+        models.IP.pais,
+        models.IP.latitude,
+        models.IP.longitude
+    ).outerjoin(
+        models.IP, models.Mensagem.ip_id == models.IP.id
+    ).filter(
+        models.Mensagem.operacao_id == operacao_id,
+        models.Mensagem.remetente == numero,
+        models.Mensagem.data_hora.isnot(None),
+        *date_filters(data_inicio, data_fim)
+    ).order_by(models.Mensagem.data_hora, models.Mensagem.id).yield_per(STREAM_CHUNK)
+
+    segments = []
+    current, current_key, seen_ips = None, None, set()
+    locais = set()
+    total = 0
+    # Mensagens sem local antes do primeiro segmento: início e quantidade
+    pendente_inicio, pendentes = None, 0
+    for row in rows:
+        total += 1
+        key = _location_key(agrupar, row)
+        if key is None:
+            if current is None:
+                pendente_inicio = pendente_inicio or row.data_hora
+                pendentes += 1
+            else:
+                current["fim"] = row.data_hora
+                current["total_mensagens"] += 1
+            continue
+        if key != current_key:
+            current, current_key = _new_segment(row), key
+            seen_ips = {row.endereco}
+            locais.add(key)
+            if pendentes:
+                current["inicio"], current["total_mensagens"] = pendente_inicio, pendentes
+                pendentes = 0
+            segments.append(current)
+        elif row.endereco not in seen_ips:
+            # Mesma cidade por outro IP
+            seen_ips.add(row.endereco)
+            current["total_ips"] += 1
+            if len(current["ips"]) < MAX_IPS_SEGMENTO:
+                current["ips"].append(row.endereco)
+        if current["latitude"] is None and row.latitude is not None:
+            current["latitude"], current["longitude"] = row.latitude, row.longitude
+        current["fim"] = row.data_hora
+        current["total_mensagens"] += 1
+
+    return {
+        "numero": numero,
+        "agrupar": agrupar,
+        "total_mensagens": total,
+        "total_segmentos": len(segments),
+        "locais_distintos": len(locais),
+        "segmentos": segments
+    }
@@ -1,7 +1,6 @@
 import { useEffect, useState } from 'react';
 import {
-    getOperacoes, getStats, getEvolution, getMessageTypes,
-    getActivityHeatmap, getTopInterlocutors, getPeakHours,
+    getOperacoes, getDashboardOverview,
     generateIntelligenceReport,
     Operacao, Stats
 } from '@/services/api';
@@ -34,8 +33,7 @@ export default function Dashboard() {
 
     useEffect(() => {
         if (selectedOp) {
-            loadStats(selectedOp);
-            loadCharts(selectedOp);
+            loadOverview(selectedOp);
         }
     }, [selectedOp]);
 
@@ -57,32 +55,17 @@ export default function Dashboard() {
         }
     };
 
-    const loadStats = async (id: number) => {
+    const loadOverview = async (id: number) => {
         try {
-            const s = await getStats(id);
-            setStats(s);
-            const e = await getEvolution(id);
-            setEvolution(e);
+            const overview = await getDashboardOverview(id);
+            setStats(overview.stats);
+            setEvolution(overview.evolution);
+            setMessageTypes(overview.message_types);
+            setHeatmapData(overview.activity_heatmap);
+            setTopInterlocutors(overview.top_interlocutors);
+            setPeakHours(overview.peak_hours);
         } catch (error) {
-            console.error("Erro ao carregar estatísticas", error);
-        }
-    };
-
-    const loadCharts = async (id: number) => {
-        try {
-            const types = await getMessageTypes(id);
-            setMessageTypes(types);
-
-            const heatmap = await getActivityHeatmap(id);
-            setHeatmapData(heatmap);
-
-            const top = await getTopInterlocutors(id);
-            setTopInterlocutors(top);
-
-            const peak = await getPeakHours(id);
-            setPeakHours(peak);
-        } catch (error) {
-            console.error("Erro ao carregar gráficos", error);
+            console.error("Erro ao carregar dashboard", error);
         }
     };
 
@@ -1,6 +1,6 @@
-import { useState, useEffect } from 'react';
-import { MapContainer, TileLayer, Marker, Popup, Tooltip } from 'react-leaflet';
-import { getOperacoes, getMapData, Operacao } from '@/services/api';
+import { useState, useEffect, useCallback } from 'react';
+import { MapContainer, TileLayer, Marker, Popup, useMap, useMapEvents } from 'react-leaflet';
+import { getOperacoes, getMapClusters, getMapClusterDetails, MapCluster, MapClusterDetails, Operacao } from '@/services/api';
 import { getDefaultOperationId } from '@/utils/defaultOperation';
 import { Card, CardContent } from '@/components/ui/card';
 import 'leaflet/dist/leaflet.css';
@@ -16,10 +16,129 @@ L.Icon.Default.mergeOptions({
     shadowUrl: 'https://unpkg.com/leaflet@1.9.4/dist/images/marker-shadow.png',
 });
 
+interface Filtros {
+    operacaoId: number;
+    dataInicio?: string;
+    dataFim?: string;
+}
+
+// Ícone com a quantidade de IPs agrupados na célula
+const clusterIcon = (cluster: MapCluster) => {
+    const size = cluster.total_ips < 10 ? 30 : cluster.total_ips < 100 ? 38 : 46;
+    return L.divIcon({
+        html: `<div style="width:${size}px;height:${size}px;line-height:${size}px" class="rounded-full bg-primary/80 text-primary-foreground text-xs font-bold text-center border-2 border-white shadow">${cluster.total_ips}</div>`,
+        className: '',
+        iconSize: [size, size],
+    });
+};
+
+function ClusterPopup({ filtros, cluster }: { filtros: Filtros; cluster: MapCluster }) {
+    const [details, setDetails] = useState<MapClusterDetails | null>(null);
+
+    useEffect(() => {
+        // Telefones e IPs do cluster só são buscados quando o popup é aberto
+        getMapClusterDetails(filtros.operacaoId, cluster.chave, filtros.dataInicio, filtros.dataFim)
+            .then(setDetails)
+            .catch(error => console.error("Erro ao carregar cluster", error));
+    }, [filtros, cluster.chave]);
+
+    if (!details) {
+        return <div className="text-sm">Carregando...</div>;
+    }
+
+    const ip = details.ips.length === 1 ? details.ips[0] : null;
+    return (
+        <div className="space-y-2 min-w-[200px]">
+            <div className="border-b pb-1">
+                {ip ? (
+                    <>
+                        <div className="font-bold text-lg">{ip.endereco}</div>
+                        <div className="text-sm text-muted-foreground">{ip.cidade}, {ip.pais}</div>
+                        {ip.provedor && <div className="text-xs text-muted-foreground">{ip.provedor}</div>}
+                    </>
+                ) : (
+                    <>
+                        <div className="font-bold text-lg">{details.total_ips} IPs</div>
+                        <div className="text-sm text-muted-foreground">{cluster.total_mensagens} mensagens</div>
+                        <ul className="text-xs font-mono mt-1 max-h-[100px] overflow-y-auto">
+                            {details.ips.map(i => (
+                                <li key={i.id}>{i.endereco} {i.cidade && `(${i.cidade})`}</li>
+                            ))}
+                        </ul>
+                    </>
+                )}
+            </div>
+
+            {details.telefones.length > 0 && (
+                <div>
+                    <strong className="text-xs uppercase text-muted-foreground">
+                        Usuários {ip ? 'do IP' : 'da área'} ({details.total_telefones}):
+                    </strong>
+                    <ul className="text-sm font-mono mt-1 max-h-[150px] overflow-y-auto">
+                        {details.telefones.map(tel => (
+                            <li key={tel.numero} className="flex items-center gap-1">
+                                <span className="w-2 h-2 rounded-full bg-green-500"></span>
+                                {tel.numero} <span className="text-xs text-muted-foreground">({tel.total_mensagens})</span>
+                            </li>
+                        ))}
+                    </ul>
+                </div>
+            )}
+        </div>
+    );
+}
+
+// Busca os clusters da área visível a cada movimento/zoom do mapa
+function ClusterLayer({ filtros, onLoad }: { filtros: Filtros; onLoad: (totalIps: number, loading: boolean) => void }) {
+    const map = useMap();
+    const [clusters, setClusters] = useState<MapCluster[]>([]);
+
+    const load = useCallback(async () => {
+        onLoad(-1, true);
+        try {
+            const data = await getMapClusters(
+                filtros.operacaoId,
+                map.getBounds().toBBoxString(),
+                map.getZoom(),
+                filtros.dataInicio,
+                filtros.dataFim
+            );
+            setClusters(data.clusters);
+            onLoad(data.total_ips, false);
+        } catch (error) {
+            console.error("Erro ao carregar mapa", error);
+            onLoad(-1, false);
+        }
+    }, [map, filtros, onLoad]);
+
+    useEffect(() => {
+        load();
+    }, [load]);
+
+    useMapEvents({ moveend: load });
+
+    return (
+        <>
+            {clusters.map(c => (
+                <Marker
+                    key={c.chave}
+                    position={[c.latitude, c.longitude]}
+                    {...(c.ip_id === null ? { icon: clusterIcon(c) } : {})}
+                >
+                    <Popup>
+                        <ClusterPopup filtros={filtros} cluster={c} />
+                    </Popup>
+                </Marker>
+            ))}
+        </>
+    );
+}
+
 export default function MapView() {
     const [operacoes, setOperacoes] = useState<Operacao[]>([]);
     const [selectedOp, setSelectedOp] = useState<string>('');
-    const [markers, setMarkers] = useState<any[]>([]);
+    const [filtros, setFiltros] = useState<Filtros | null>(null);
+    const [totalIps, setTotalIps] = useState(0);
     const [loading, setLoading] = useState(false);
     const [dataInicio, setDataInicio] = useState('');
     const [dataFim, setDataFim] = useState('');
@@ -51,27 +170,19 @@ export default function MapView() {
         }
     };
 
-    const loadMapData = async () => {
-        setLoading(true);
-        try {
-            const data = await getMapData(
-                Number(selectedOp),
-                dataInicio || undefined,
-                dataFim || undefined
-            );
-            console.log('Map data received:', data);
-            console.log('Number of markers:', data.length);
-            if (data.length > 0) {
-                console.log('First marker:', data[0]);
-            }
-            setMarkers(data);
-        } catch (error) {
-            console.error("Erro ao carregar mapa", error);
-        } finally {
-            setLoading(false);
-        }
+    const loadMapData = (inicio = dataInicio, fim = dataFim) => {
+        setFiltros({
+            operacaoId: Number(selectedOp),
+            dataInicio: inicio || undefined,
+            dataFim: fim || undefined,
+        });
     };
 
+    const handleClusterLoad = useCallback((total: number, isLoading: boolean) => {
+        if (total >= 0) setTotalIps(total);
+        setLoading(isLoading);
+    }, []);
+
     const handleFilter = () => {
         loadMapData();
     };
@@ -79,8 +190,7 @@ export default function MapView() {
     const handleClearFilters = () => {
         setDataInicio('');
         setDataFim('');
-        // Reload without filters
-        setTimeout(() => loadMapData(), 100);
+        loadMapData('', '');
     };
 
     return (
@@ -144,59 +254,13 @@ export default function MapView() {
                             url="https://{s}.tile.openstreetmap.org/{z}/{x}/{y}.png"
                             attribution='&copy; <a href="https://www.openstreetmap.org/copyright">OpenStreetMap</a> contributors'
                         />
-                        {markers.map(m => (
-                            <Marker key={m.id} position={[m.latitude, m.longitude]}>
-                                <Tooltip direction="top" offset={[0, -20]} opacity={1}>
-                                    <div className="text-xs font-mono">
-                                        {m.telefones && m.telefones.map((t: string) => (
-                                            <div key={t}>{t}</div>
-                                        ))}
-                                    </div>
-                                </Tooltip>
-                                <Popup>
-                                    <div className="space-y-2 min-w-[200px]">
-                                        <div className="border-b pb-1">
-                                            <div className="font-bold text-lg">{m.endereco}</div>
-                                            <div className="text-sm text-muted-foreground">{m.cidade}, {m.pais}</div>
-                                            {m.provedor && <div className="text-xs text-muted-foreground">{m.provedor}</div>}
-                                        </div>
-
-                                        {m.telefones && m.telefones.length > 0 && (
-                                            <div>
-                                                <strong className="text-xs uppercase text-muted-foreground">Usuários do IP:</strong>
-                                                <ul className="text-sm font-mono mt-1">
-                                                    {m.telefones.map((tel: string, idx: number) => (
-                                                        <li key={idx} className="flex items-center gap-1">
-                                                            <span className="w-2 h-2 rounded-full bg-green-500"></span>
-                                                            {tel}
-                                                        </li>
-                                                    ))}
-                                                </ul>
-                                            </div>
-                                        )}
-
-                                        {m.conexoes && m.conexoes.length > 0 && (
-                                            <div className="pt-2 border-t">
-                                                <strong className="text-xs uppercase text-muted-foreground">Ligações (Origem &rarr; Destino):</strong>
-                                                <ul className="text-xs mt-1 space-y-1 max-h-[150px] overflow-y-auto">
-                                                    {m.conexoes.map((conn: string, idx: number) => (
-                                                        <li key={idx} className="font-mono bg-muted p-1 rounded">
-                                                            {conn}
-                                                        </li>
-                                                    ))}
-                                                </ul>
-                                            </div>
-                                        )}
-                                    </div>
-                                </Popup>
-                            </Marker>
-                        ))}
+                        {filtros && <ClusterLayer filtros={filtros} onLoad={handleClusterLoad} />}
                     </MapContainer>
                 </CardContent>
             </Card>
 
             <div className="text-sm text-muted-foreground">
-                {markers.length} IPs geolocalizados
+                {totalIps} IPs geolocalizados
                 {(dataInicio || dataFim) && ' (filtrados)'}
             </div>
         </div>
@@ -1,5 +1,5 @@
 import { useState, useEffect, useRef } from 'react';
-import { getOperacoes, getMessages, Operacao } from '@/services/api';
+import { getOperacoes, getMessages, getMessagesCount, getMessagesPage, MensagensPage, Operacao } from '@/services/api';
 import { getDefaultOperationId } from '@/utils/defaultOperation';
 import { Card, CardContent } from '@/components/ui/card';
 import { FilterState } from '@/components/FilterPanel';
@@ -15,6 +15,7 @@ export default function Messages() {
     const [filters, setFilters] = useState<FilterState>({});
     const [page, setPage] = useState(0);
     const [sortConfig, setSortConfig] = useState({ key: 'data_hora', direction: 'desc' });
+    const [total, setTotal] = useState<{ total: number; aproximado: boolean } | null>(null);
     // const [loading, setLoading] = useState(false);
     // const [backgroundLoading, setBackgroundLoading] = useState(false);
     const limit = 100; // Aumentado de 50 para 100
@@ -30,6 +31,13 @@ export default function Messages() {
         }
     }, [selectedOp, page, filters, sortConfig]);
 
+    // O total não depende da página nem da ordenação
+    useEffect(() => {
+        if (selectedOp) {
+            loadTotal();
+        }
+    }, [selectedOp, filters]);
+
     const loadOperacoes = async () => {
         try {
             const data = await getOperacoes();
@@ -47,6 +55,16 @@ export default function Messages() {
         }
     };
 
+    const loadTotal = async () => {
+        setTotal(null);
+        try {
+            const data = await getMessagesCount(Number(selectedOp), search, filters.dataInicio, filters.dataFim);
+            setTotal(data);
+        } catch (error) {
+            console.error("Erro ao contar mensagens", error);
+        }
+    };
+
     const loadMessagesProgressive = async () => {
         if (loadingRef.current) return;
         loadingRef.current = true;
@@ -54,7 +72,18 @@ export default function Messages() {
 
         try {
             // 1. Carregar as primeiras 100 mensagens IMEDIATAMENTE
-            const initialData = await getMessages(
+            // (na primeira página por cursor, para continuar dela no background)
+            const initialPage = page === 0 ? await getMessagesPage(
+                Number(selectedOp),
+                null,
+                limit,
+                search,
+                sortConfig.key,
+                sortConfig.direction,
+                filters.dataInicio,
+                filters.dataFim
+            ) : null;
+            const initialData = initialPage ? initialPage.mensagens : await getMessages(
                 Number(selectedOp),
                 page * limit,
                 limit,
@@ -69,9 +98,9 @@ export default function Messages() {
             // setLoading(false);
 
             // 2. Carregar o restante em BACKGROUND (para exportação)
-            if (page === 0) { // Só carregar todas se estiver na primeira página
+            if (initialPage) { // Só carregar todas se estiver na primeira página
                 // setBackgroundLoading(true);
-                loadRemainingMessages();
+                loadRemainingMessages(initialPage);
             }
         } catch (error) {
             console.error("Erro ao carregar mensagens", error);
@@ -81,18 +110,18 @@ export default function Messages() {
         }
     };
 
-    const loadRemainingMessages = async () => {
+    const loadRemainingMessages = async (first: MensagensPage) => {
         try {
-            // Carregar em batches de 200 no background
+            // Carregar em batches de 200 no background, seguindo o cursor
             const BATCH_SIZE = 200;
-            let offset = 100; // Já temos as primeiras 100
-            let allData = messages.slice(); // Cópia das mensagens iniciais
-            let hasMore = true;
+            let allData = first.mensagens; // Já temos as primeiras 100
+            let cursor = first.nextCursor;
 
-            while (hasMore) {
-                const batch = await getMessages(
+            // Limitar a 1000 para não travar
+            while (cursor && allData.length < 1000) {
+                const batch = await getMessagesPage(
                     Number(selectedOp),
-                    offset,
+                    cursor,
                     BATCH_SIZE,
                     search,
                     sortConfig.key,
@@ -101,16 +130,9 @@ export default function Messages() {
                     filters.dataFim
                 );
 
-                if (batch.length === 0) {
-                    hasMore = false;
-                } else {
-                    allData = [...allData, ...batch];
-                    setAllMessages(allData);
-                    offset += BATCH_SIZE;
-
-                    // Limitar a 1000 para não travar
-                    if (offset >= 1000) hasMore = false;
-                }
+                allData = [...allData, ...batch.mensagens];
+                setAllMessages(allData);
+                cursor = batch.nextCursor;
             }
         } catch (error) {
             console.error("Erro ao carregar mensagens restantes", error);
@@ -123,6 +145,7 @@ export default function Messages() {
         e.preventDefault();
         setPage(0);
         loadMessagesProgressive();
+        loadTotal();
     };
 
     const handleSort = (key: string) => {
@@ -270,7 +293,10 @@ export default function Messages() {
                     >
                         Anterior
                     </button>
-                    <span>Página {page + 1} ({filteredMessages.length} registros)</span>
+                    <span>
+                        Página {page + 1} ({filteredMessages.length} registros
+                        {total && ` de ${total.aproximado ? '~' : ''}${total.total.toLocaleString('pt-BR')}`})
+                    </span>
                     <button
                         className="px-4 py-2 border rounded disabled:opacity-50 transition-colors hover:bg-accent"
                         disabled={messages.length < limit}
@@ -1,4 +1,5 @@
 import axios from 'axios';
+import { decodeCompactGraph, CompactGraph } from '../utils/compactGraph';
 
 const api = axios.create({
     baseURL: import.meta.env.VITE_API_URL || '',
@@ -98,6 +99,21 @@ export const getEvolution = async (operacaoId: number) => {
     const response = await api.get<{ data: string, total: number }[]>(`/dashboard/${operacaoId}/evolution`); return response.data;
 };
 
+export interface DashboardOverview {
+    stats: Stats;
+    evolution: { data: string, total: number, remetentes: number }[];
+    message_types: { tipo: string, count: number }[];
+    activity_heatmap: { hour: number, day: number, count: number }[];
+    top_interlocutors: { numero: string, total: number }[];
+    peak_hours: { hour: number, count: number }[];
+}
+
+// Todos os widgets do dashboard em uma única chamada
+export const getDashboardOverview = async (operacaoId: number) => {
+    const response = await api.get<DashboardOverview>(`/dashboard/${operacaoId}/overview`);
+    return response.data;
+};
+
 // Upload e Arquivos
 export const getImportedFiles = async (operacaoId: number) => {
     const response = await api.get<ArquivoImportado[]>(`/upload/files/${operacaoId}`);
@@ -130,18 +146,45 @@ export const getPeakHours = async (operacaoId: number) => {
 };
 
 // Grafos
-export const getGeneralGraph = async (operacaoId: number) => {
-    const response = await api.get<any>(`/graph/${operacaoId}/general`);
+export const getGeneralGraph = async (operacaoId: number, dataInicio?: string, dataFim?: string) => {
+    const params: any = { formato: 'compacto' };
+    if (dataInicio) params.data_inicio = dataInicio;
+    if (dataFim) params.data_fim = dataFim;
+
+    const response = await api.get<CompactGraph>(`/graph/${operacaoId}/general`, { params });
+    return decodeCompactGraph(response.data);
+};
+
+export const getGraphDiff = async (
+    operacaoId: number,
+    janelaA: { inicio?: string, fim?: string },
+    janelaB: { inicio?: string, fim?: string }
+) => {
+    const params = { inicio_a: janelaA.inicio, fim_a: janelaA.fim, inicio_b: janelaB.inicio, fim_b: janelaB.fim };
+    const response = await api.get<any>(`/graph/${operacaoId}/diff`, { params });
     return response.data;
 };
 
 export const getCommonIpsGraph = async (operacaoId: number) => {
-    const response = await api.get<any>(`/graph/${operacaoId}/common-ips`);
-    return response.data;
+    const response = await api.get<CompactGraph>(`/graph/${operacaoId}/common-ips`, { params: { formato: 'compacto' } });
+    return decodeCompactGraph(response.data);
 };
 
 export const getSharedIpsGraph = async (operacaoId: number) => {
-    const response = await api.get<any>(`/graph/${operacaoId}/shared-ips`);
+    const response = await api.get<CompactGraph>(`/graph/${operacaoId}/shared-ips`, { params: { formato: 'compacto' } });
+    return decodeCompactGraph(response.data);
+};
+
+export const getConnectionPaths = async (
+    operacaoId: number,
+    origem: string,
+    destino: string,
+    k = 3,
+    modo: 'saltos' | 'peso' = 'saltos',
+    incluirIps = true
+) => {
+    const params = { origem, destino, k, modo, incluir_ips: incluirIps };
+    const response = await api.get<any>(`/graph/${operacaoId}/path`, { params });
     return response.data;
 };
 
@@ -160,6 +203,84 @@ export const getMapData = async (operacaoId: number, dataInicio?: string, dataFi
     return response.data;
 };
 
+export interface MapCluster {
+    chave: string;
+    latitude: number;
+    longitude: number;
+    total_ips: number;
+    total_mensagens: number;
+    ip_id: number | null;
+}
+
+export interface MapClusters {
+    zoom: number;
+    total_ips: number;
+    clusters: MapCluster[];
+}
+
+export interface MapClusterDetails {
+    chave: string;
+    ips: IP[];
+    total_ips: number;
+    telefones: { numero: string; total_mensagens: number }[];
+    total_telefones: number;
+}
+
+// bbox no formato do Leaflet (LatLngBounds.toBBoxString): oeste,sul,leste,norte
+export const getMapClusters = async (operacaoId: number, bbox: string, zoom: number, dataInicio?: string, dataFim?: string) => {
+    const params: any = { bbox, zoom };
+    if (dataInicio) params.data_inicio = dataInicio;
+    if (dataFim) params.data_fim = dataFim;
+
+    const response = await api.get<MapClusters>(`/geolocation/${operacaoId}/clusters`, { params });
+    return response.data;
+};
+
+export const getMapClusterDetails = async (operacaoId: number, chave: string, dataInicio?: string, dataFim?: string) => {
+    const params: any = { chave };
+    if (dataInicio) params.data_inicio = dataInicio;
+    if (dataFim) params.data_fim = dataFim;
+
+    const response = await api.get<MapClusterDetails>(`/geolocation/${operacaoId}/clusters/detalhes`, { params });
+    return response.data;
+};
+
+export interface TrajectorySegment {
+    inicio: string;
+    fim: string;
+    cidade?: string;
+    pais?: string;
+    latitude?: number;
+    longitude?: number;
+    ips: string[];
+    total_ips: number;
+    total_mensagens: number;
+}
+
+export interface Trajectory {
+    numero: string;
+    agrupar: 'cidade' | 'ip';
+    total_mensagens: number;
+    total_segmentos: number;
+    locais_distintos: number;
+    segmentos: TrajectorySegment[];
+}
+
+export const getTrajectory = async (
+    operacaoId: number,
+    numero: string,
+    agrupar: 'cidade' | 'ip' = 'cidade',
+    dataInicio?: string,
+    dataFim?: string
+) => {
+    const params: any = { agrupar };
+    if (dataInicio) params.data_inicio = dataInicio;
+    if (dataFim) params.data_fim = dataFim;
+
+    const response = await api.get<Trajectory>(`/geolocation/${operacaoId}/trajectory/${encodeURIComponent(numero)}`, { params });
+    return response.data;
+};
+
 // Mensagens
 export const getMessages = async (
     operacaoId: number,
@@ -179,6 +300,52 @@ export const getMessages = async (
     return response.data;
 };
 
+export interface MensagensPage {
+    mensagens: Mensagem[];
+    nextCursor: string | null;
+    prevCursor: string | null;
+}
+
+// Total da listagem (aproximado=true quando é estimativa do banco)
+export const getMessagesCount = async (
+    operacaoId: number,
+    search = '',
+    dataInicio?: string,
+    dataFim?: string
+) => {
+    const params: any = {};
+    if (search) params.search = search;
+    if (dataInicio) params.data_inicio = dataInicio;
+    if (dataFim) params.data_fim = dataFim;
+
+    const response = await api.get<{ total: number; aproximado: boolean }>(`/mensagens/${operacaoId}/count`, { params });
+    return response.data;
+};
+
+// Paginação por cursor: custo constante em qualquer página
+export const getMessagesPage = async (
+    operacaoId: number,
+    cursor: string | null,
+    limit = 50,
+    search = '',
+    sortBy = 'data_hora',
+    order = 'desc',
+    dataInicio?: string,
+    dataFim?: string
+): Promise<MensagensPage> => {
+    const params: any = { limit, search, sort_by: sortBy, order };
+    if (cursor) params.cursor = cursor;
+    if (dataInicio) params.data_inicio = dataInicio;
+    if (dataFim) params.data_fim = dataFim;
+
+    const response = await api.get<Mensagem[]>(`/mensagens/${operacaoId}`, { params });
+    return {
+        mensagens: response.data,
+        nextCursor: response.headers['x-next-cursor'] ?? null,
+        prevCursor: response.headers['x-prev-cursor'] ?? null
+    };
+};
+
 // Export
 export const exportPDF = async (operacaoId: number) => {
     const response = await api.get(`/export/pdf/${operacaoId}`, {
@@ -194,6 +361,25 @@ export const exportExcel = async (operacaoId: number) => {
     return response.data;
 };
 
+export const exportMessages = async (
+    operacaoId: number,
+    formato: 'csv' | 'jsonl' | 'parquet' = 'csv',
+    search = '',
+    dataInicio?: string,
+    dataFim?: string
+) => {
+    const params: any = { formato };
+    if (search) params.search = search;
+    if (dataInicio) params.data_inicio = dataInicio;
+    if (dataFim) params.data_fim = dataFim;
+
+    const response = await api.get(`/export/messages/${operacaoId}`, {
+        params,
+        responseType: 'blob'
+    });
+    return response.data;
+};
+
 // Intelligence Report
 export const generateIntelligenceReport = async (operacaoId: number) => {
     const response = await api.get(`/intelligence/${operacaoId}/report`, {
@@ -202,4 +388,9 @@ export const generateIntelligenceReport = async (operacaoId: number) => {
     return response.data;
 };
 
+export const getIntelligenceAnalysis = async (operacaoId: number, name: string) => {
+    const response = await api.get(`/intelligence/${operacaoId}/analysis/${name}`);
+    return response.data;
+};
+
 export default api;
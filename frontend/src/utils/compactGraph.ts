@@ -0,0 +1,47 @@
+// Adaptador do formato colunar ("compacto") dos endpoints de grafo para elementos do Cytoscape
+
+export interface CompactColumns {
+    count: number;
+    columns: Record<string, any[]>;
+    string_columns: string[];
+}
+
+export interface CompactGraph {
+    v: number;
+    strings: string[];
+    nodes: CompactColumns;
+    edges: CompactColumns;
+}
+
+const expand = (block: CompactColumns, strings: string[], skip: string[] = []) => {
+    const rows: Record<string, any>[] = Array.from({ length: block.count }, () => ({}));
+    const stringColumns = new Set(block.string_columns);
+
+    for (const [key, values] of Object.entries(block.columns)) {
+        if (skip.includes(key)) continue;
+        const isString = stringColumns.has(key);
+        for (let i = 0; i < block.count; i++) {
+            const value = values[i];
+            rows[i][key] = isString ? (value < 0 ? null : strings[value]) : value;
+        }
+    }
+    return rows;
+};
+
+export const decodeCompactGraph = (payload: CompactGraph) => {
+    const nodes = expand(payload.nodes, payload.strings);
+    const edges = expand(payload.edges, payload.strings, ['source', 'target']);
+    const { source, target } = payload.edges.columns;
+
+    edges.forEach((edge, i) => {
+        edge.source = nodes[source[i]]?.id;
+        edge.target = nodes[target[i]]?.id;
+    });
+
+    return {
+        elements: {
+            nodes: nodes.map(data => ({ data })),
+            edges: edges.map(data => ({ data })),
+        },
+    };
+};
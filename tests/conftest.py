@@ -0,0 +1,114 @@
+"""
+Fixtures dos testes: banco SQLite temporário (nunca o DATABASE_URL do ambiente)
+e operações de exemplo. Cada teste cria suas próprias operações, então o banco
+é criado uma vez por sessão e os caches por operação não se misturam.
+"""
+import os
+import random
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+_TMP = tempfile.mkdtemp(prefix="forense_testes_")
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(_TMP, "forense.db")
+os.environ.setdefault("REPORTS_DIR", os.path.join(_TMP, "relatorios"))
+
+from backend.database import Base, SessionLocal, engine  # noqa: E402
+import backend.models as models  # noqa: E402
+from backend.services import geolocation  # noqa: E402
+
+Base.metadata.create_all(bind=engine)
+
+BASE_DATE = datetime(2024, 1, 1)
+
+
+@pytest.fixture(autouse=True)
+def sem_geolocalizacao(monkeypatch):
+    """A importação enfileira IPs para geolocalização; nos testes não há acesso à rede"""
+    monkeypatch.setattr(geolocation, "enqueue_ips", lambda ip_ids, retry=False: 0)
+
+
+@pytest.fixture
+def db():
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+def _new_operacao(db, prefixo="op"):
+    operacao = models.Operacao(nome=f"{prefixo}-{random.getrandbits(48):x}")
+    db.add(operacao)
+    db.commit()
+    return operacao.id
+
+
+@pytest.fixture
+def nova_operacao(db):
+    """Cria uma operação vazia e devolve o id"""
+    return lambda prefixo="op": _new_operacao(db, prefixo)
+
+
+def seed_mensagens(db, operacao_id, n_msgs, n_phones=50, n_ips=40, seed=1, cadastrados=None):
+    """
+    Insere mensagens aleatórias (reprodutíveis pela seed) direto na tabela, com telefones,
+    IPs e um arquivo importado. cadastrados: quantos telefones ficam na tabela telefones.
+    """
+    rnd = random.Random(seed)
+    phones = [f"5511{operacao_id:03d}{i:06d}" for i in range(n_phones)]
+    cadastrados = n_phones if cadastrados is None else cadastrados
+    for i, numero in enumerate(phones[:cadastrados]):
+        db.add(models.Telefone(operacao_id=operacao_id, numero=numero, tipo="ALVO" if i == 0 else "SECUNDARIO"))
+
+    ip_ids = []
+    for i in range(n_ips):
+        endereco = f"10.{operacao_id % 256}.{i // 256}.{i % 256}"
+        ip = db.query(models.IP).filter(models.IP.endereco == endereco).first()
+        if ip is None:
+            ip = models.IP(endereco=endereco, pais="Brasil", cidade=f"Cidade {i % 5}",
+                           latitude=-23.5 + i * 0.01, longitude=-46.6 + i * 0.01, provedor="Vivo")
+            db.add(ip)
+            db.flush()
+        ip_ids.append(ip.id)
+    db.add(models.Arquivo(operacao_id=operacao_id, nome="seed.html", hash_md5=f"seed-{operacao_id}-{seed}"))
+
+    batch = []
+    for _ in range(n_msgs):
+        remetente, destinatario = rnd.sample(phones, 2)
+        batch.append({
+            "operacao_id": operacao_id,
+            "alvo": phones[0],
+            "remetente": remetente,
+            "destinatario": destinatario,
+            "ip_id": rnd.choice(ip_ids),
+            "porta": 443,
+            "data_hora": BASE_DATE + timedelta(minutes=rnd.randint(0, 60 * 24 * 90)),
+            "tipo_mensagem": rnd.choice(["text", "media", "call"]),
+        })
+        if len(batch) >= 20000:
+            db.bulk_insert_mappings(models.Mensagem, batch)
+            batch = []
+    if batch:
+        db.bulk_insert_mappings(models.Mensagem, batch)
+    db.commit()
+    return phones
+
+
+@pytest.fixture
+def client():
+    """TestClient com os routers informados"""
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+
+    def build(*routers):
+        app = FastAPI()
+        for router in routers:
+            app.include_router(router.router)
+        return TestClient(app)
+    return build
@@ -0,0 +1,99 @@
+from sqlalchemy import event
+
+import backend.models as models
+from backend.database import SessionLocal, engine, get_db
+from backend.routers import dashboard, messages, telefones, upload
+from backend.services.cache import bump_version, data_generation, ips_version, response_cache_stats
+from conftest import seed_mensagens
+
+
+def _html(quantidade, dia=1):
+    linhas = "".join(
+        f"<tr><td>551190000000</td><td>55119000000{i % 5}</td><td>55119000001{i % 7}</td>"
+        f"<td>10.201.{i % 3}.{i % 200}</td><td>443</td><td>{dia:02d}/03/2024 {i % 24:02d}:{i % 60:02d}:00</td><td>text</td></tr>"
+        for i in range(quantidade)
+    )
+    return ("<html><body><table><tr><th>Alvo</th><th>Remetente</th><th>Destinatário</th>"
+            "<th>IP</th><th>Porta</th><th>Data</th><th>Tipo</th></tr>" + linhas + "</table></body></html>").encode()
+
+
+def test_versao_incrementa_so_no_fim_da_importacao(nova_operacao, client):
+    operacao_id = nova_operacao()
+    c = client(upload, messages)
+    lidas_durante = []
+
+    # Sessão da requisição de upload: após o segundo lote gravado (1000 mensagens),
+    # outra requisição conta as mensagens e guarda o total parcial em cache
+    session = SessionLocal()
+    commit = session.commit
+    commits = {"n": 0}
+
+    def commit_com_leitura():
+        commit()
+        commits["n"] += 1
+        if commits["n"] == 2:
+            leitura = SessionLocal()
+            try:
+                lidas_durante.append(messages.count_mensagens(operacao_id, db=leitura)["total"])
+            finally:
+                leitura.close()
+
+    session.commit = commit_com_leitura
+    c.app.dependency_overrides[get_db] = lambda: session
+    try:
+        resposta = c.post("/upload/", data={"operacao_id": operacao_id},
+                          files=[("files", ("conversa.html", _html(2000), "text/html"))])
+    finally:
+        session.close()
+    assert resposta.status_code == 201
+    assert lidas_durante and lidas_durante[0] < 2000
+
+    c.app.dependency_overrides.clear()
+    assert c.get(f"/mensagens/{operacao_id}/count").json()["total"] == 2000
+
+
+def test_bump_version(db, nova_operacao):
+    operacao_id = nova_operacao()
+    assert data_generation(db, operacao_id) == 0
+    bump_version(db, "mensagens", operacao_id)
+    bump_version(db, "mensagens", operacao_id)
+    assert data_generation(db, operacao_id) == 2
+
+
+def test_acerto_do_cache_faz_uma_consulta_so(db, nova_operacao, client):
+    operacao_id = nova_operacao()
+    seed_mensagens(db, operacao_id, 500, n_phones=10)
+    c = client(dashboard, telefones)
+    assert c.get(f"/dashboard/{operacao_id}/stats").json()["total_telefones"] == 10
+
+    statements = []
+    registrar = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(engine, "before_cursor_execute", registrar)
+    try:
+        assert c.get(f"/dashboard/{operacao_id}/stats").json()["total_telefones"] == 10
+    finally:
+        event.remove(engine, "before_cursor_execute", registrar)
+    assert len(statements) == 1 and "versoes_dados" in statements[0]
+
+
+def test_edicao_de_telefone_invalida_o_cache(db, nova_operacao, client):
+    operacao_id = nova_operacao()
+    seed_mensagens(db, operacao_id, 200, n_phones=5)
+    c = client(dashboard, telefones)
+    falhas = lambda: response_cache_stats()["endpoints"]["dashboard.get_stats"]["misses"]
+
+    c.get(f"/dashboard/{operacao_id}/stats")
+    antes = falhas()
+    c.get(f"/dashboard/{operacao_id}/stats")
+    assert falhas() == antes
+
+    telefone = db.query(models.Telefone).filter(models.Telefone.operacao_id == operacao_id).first()
+    assert c.put(f"/telefones/{telefone.id}", json={"identificacao": "Fulano"}).status_code == 200
+    c.get(f"/dashboard/{operacao_id}/stats")
+    assert falhas() == antes + 1
+
+
+def test_versao_dos_ips_e_global(db, nova_operacao):
+    antes = ips_version(db)
+    bump_version(db, "ips", nova_operacao())
+    assert ips_version(db) == antes + 1
@@ -0,0 +1,193 @@
+import csv
+import io
+import json
+import time
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event
+
+from backend.database import engine
+from backend.routers import export
+from conftest import BASE_DATE, seed_mensagens
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:
+    pq = None
+
+MENSAGENS = 100_000
+MAX_STATEMENTS = 4   # operação, estatísticas e top 10 (folga de 1)
+MAX_SECONDS = 5.0
+
+
+@contextmanager
+def contar_sql():
+    statements = []
+
+    def registrar(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", registrar)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", registrar)
+
+
+@pytest.fixture(scope="module")
+def operacao_grande():
+    from backend.database import SessionLocal
+    import backend.models as models
+    db = SessionLocal()
+    try:
+        operacao = models.Operacao(nome=f"export-grande-{time.time_ns()}")
+        db.add(operacao)
+        db.commit()
+        phones = seed_mensagens(db, operacao.id, MENSAGENS, n_phones=400, n_ips=300, cadastrados=350)
+        return operacao.id, phones
+    finally:
+        db.close()
+
+
+def test_export_pdf_numero_de_consultas_e_tempo(operacao_grande, client):
+    operacao_id, _ = operacao_grande
+    c = client(export)
+
+    inicio = time.perf_counter()
+    with contar_sql() as statements:
+        resposta = c.get(f"/export/pdf/{operacao_id}")
+        conteudo = resposta.content
+    duracao = time.perf_counter() - inicio
+
+    assert resposta.status_code == 200
+    assert conteudo.startswith(b"%PDF")
+    assert len(statements) <= MAX_STATEMENTS, statements
+    assert duracao < MAX_SECONDS
+
+
+
+def test_export_pdf_top_10_e_ips_por_operacao(db, nova_operacao, monkeypatch):
+    import backend.models as models
+    op_a, op_b = nova_operacao("export-a"), nova_operacao("export-b")
+
+    ips = []
+    for i in range(5):
+        ip = models.IP(endereco=f"192.0.2.{op_a % 50 * 5 + i}")
+        db.add(ip)
+        db.flush()
+        ips.append(ip.id)
+
+    # Na operação A, o telefone i tem i + 1 mensagens (ordem inversa à do número)
+    telefones = [f"5521{op_a:04d}{i:04d}" for i in range(12)]
+    for numero in telefones:
+        db.add(models.Telefone(operacao_id=op_a, numero=numero))
+    nao_cadastrado = "5599999999999"
+    for i, numero in enumerate(telefones):
+        for j in range(i + 1):
+            db.add(models.Mensagem(operacao_id=op_a, remetente=numero, destinatario=nao_cadastrado,
+                                   ip_id=ips[j % 3], data_hora=BASE_DATE))
+    # Mensagem para si mesmo conta uma vez; as do não cadastrado não entram no ranking
+    db.add(models.Mensagem(operacao_id=op_a, remetente=telefones[3], destinatario=telefones[3], ip_id=ips[0]))
+    # A operação B usa IPs em comum com A e outros
+    for i, ip_id in enumerate(ips[1:]):
+        db.add(models.Mensagem(operacao_id=op_b, remetente=telefones[0], destinatario=nao_cadastrado, ip_id=ip_id))
+    db.commit()
+
+    capturado = {}
+
+    def pdf_story(operacao, stats, top_phones):
+        capturado.update(stats=tuple(stats), top=[(p.numero, p.total) for p in top_phones])
+        return iter(())
+    monkeypatch.setattr(export, "_pdf_story", pdf_story)
+    export.export_pdf(op_a, db)
+
+    total_mensagens = sum(i + 1 for i in range(12)) + 1
+    assert capturado["stats"] == (12, total_mensagens, 3)
+
+    contagens = {numero: i + 1 for i, numero in enumerate(telefones)}
+    contagens[telefones[3]] += 1
+    esperado = sorted(contagens.items(), key=lambda item: (-item[1], item[0]))[:10]
+    assert capturado["top"] == esperado
+    assert capturado["top"][0] == (telefones[11], 12)
+    # Empate em 5 mensagens (a de si mesmo conta uma vez): desempate pelo número
+    assert capturado["top"][7:] == [(telefones[3], 5), (telefones[4], 5), (telefones[2], 3)]
+
+
+@pytest.fixture(scope="module")
+def operacao_exportacao():
+    from backend.database import SessionLocal
+    import backend.models as models
+    db = SessionLocal()
+    try:
+        operacao = models.Operacao(nome=f"export-mensagens-{time.time_ns()}")
+        db.add(operacao)
+        db.commit()
+        phones = seed_mensagens(db, operacao.id, 3000, n_phones=30, n_ips=20)
+        return operacao.id, phones
+    finally:
+        db.close()
+
+
+def _ids_da_listagem(c, operacao_id, params):
+    """Ids de /mensagens com os mesmos filtros, percorrendo todas as páginas pelo cursor"""
+    ids = []
+    cursor = None
+    while True:
+        pagina = dict(params, limit=500, **({"cursor": cursor} if cursor else {}))
+        resposta = c.get(f"/mensagens/{operacao_id}", params=pagina)
+        ids += [m["id"] for m in resposta.json()]
+        cursor = resposta.headers.get("x-next-cursor")
+        if not cursor:
+            return ids
+
+
+def _linhas_exportadas(c, operacao_id, formato, params=None):
+    resposta = c.get(f"/export/messages/{operacao_id}", params=dict(params or {}, formato=formato))
+    assert resposta.status_code == 200
+    if formato == "csv":
+        linhas = list(csv.reader(io.StringIO(resposta.content.decode("utf-8-sig"))))
+        return linhas[0], [dict(zip(linhas[0], l)) for l in linhas[1:]]
+    if formato == "jsonl":
+        linhas = [json.loads(l) for l in resposta.content.decode("utf-8").splitlines()]
+        return list(linhas[0]), linhas
+    tabela = pq.read_table(io.BytesIO(resposta.content))
+    return tabela.column_names, tabela.to_pylist()
+
+
+@pytest.mark.parametrize("formato", ["csv", "jsonl", "parquet"])
+def test_export_messages_linhas_e_colunas(operacao_exportacao, client, formato):
+    if formato == "parquet" and export.pa is None:
+        pytest.skip("pyarrow não instalado")
+    operacao_id, _ = operacao_exportacao
+    colunas, linhas = _linhas_exportadas(client(export), operacao_id, formato)
+    assert colunas == export.MESSAGE_COLUMNS
+    assert len(linhas) == 3000
+    assert len({int(l["id"]) for l in linhas}) == 3000
+
+
+@pytest.mark.parametrize("filtros", [
+    {"data_inicio": "2024-02-01", "data_fim": "2024-02-15"},
+    {"search": "numero"},
+    {"search": "numero", "modo_busca": "contem", "data_fim": "2024-03-01"},
+    {"search": "numero", "modo_busca": "prefixo"},
+])
+def test_export_messages_filtros_iguais_aos_da_listagem(operacao_exportacao, client, filtros):
+    from backend.routers import messages
+    operacao_id, phones = operacao_exportacao
+    termos = {"exato": phones[3], "contem": phones[4][-6:], "prefixo": phones[15][:-1]}
+    if "search" in filtros:
+        filtros = dict(filtros, search=termos[filtros.get("modo_busca", "exato")])
+    c = client(export, messages)
+
+    _, linhas = _linhas_exportadas(c, operacao_id, "jsonl", filtros)
+    esperado = _ids_da_listagem(c, operacao_id, filtros)
+    assert 0 < len(esperado) < 3000
+    assert sorted(l["id"] for l in linhas) == sorted(esperado)
+
+
+@pytest.mark.parametrize("params", [{"formato": "xlsx"}, {"modo_busca": "regex", "search": "1"}])
+def test_export_messages_parametro_invalido(operacao_exportacao, client, params):
+    operacao_id, _ = operacao_exportacao
+    resposta = client(export).get(f"/export/messages/{operacao_id}", params=params)
+    assert resposta.status_code == 400
@@ -0,0 +1,50 @@
+import pytest
+
+from backend.services import geo_offline
+
+# Linhas no formato do DB-IP "IP to City Lite" (8 colunas, cidade entre aspas quando tem vírgula)
+DBIP_CSV = """\
+1.0.0.0,1.0.0.255,OC,AU,Queensland,"South Brisbane",-27.4767,153.017
+8.8.8.0,8.8.8.255,NA,US,California,Mountain View,37.4223,-122.085
+177.0.0.0,177.0.255.255,SA,BR,"São Paulo","São Paulo, Centro",-23.5475,-46.6361
+2001:db8::,2001:db8::ffff,EU,PT,Lisboa,Lisboa,38.7167,-9.1333
+"""
+
+GENERICO_CSV = """\
+inicio,fim,pais,cidade,lat,lon,provedor
+10.0.0.0,10.0.0.255,Brasil,Recife,-8.05,-34.9,Oi
+"""
+
+
+@pytest.fixture
+def base(tmp_path):
+    def build(conteudo):
+        csv_path = tmp_path / "faixas.csv"
+        csv_path.write_text(conteudo, encoding="utf-8")
+        saida = str(tmp_path / "faixas.bin")
+        geo_offline.build_range_file(str(csv_path), saida)
+        return geo_offline.open_database(saida)
+    return build
+
+
+def test_formato_dbip_city_lite(base):
+    db = base(DBIP_CSV)
+    resultado = db.lookup("8.8.8.8")
+    assert resultado["country"] == "US"
+    assert resultado["city"] == "Mountain View"
+    assert resultado["lat"] == pytest.approx(37.4223)
+    assert resultado["lon"] == pytest.approx(-122.085)
+    assert resultado["isp"] is None
+
+    assert db.lookup("177.0.10.1")["city"] == "São Paulo, Centro"
+    assert db.lookup("2001:db8::1")["country"] == "PT"
+    assert db.lookup("8.8.9.1") is None
+    db.close()
+
+
+def test_formato_generico_com_provedor(base):
+    db = base(GENERICO_CSV)
+    resultado = db.lookup("10.0.0.42")
+    assert (resultado["country"], resultado["city"], resultado["isp"]) == ("Brasil", "Recife", "Oi")
+    assert db.lookup("10.0.1.1") is None
+    db.close()
@@ -0,0 +1,148 @@
+import json
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+
+import pytest
+
+import backend.models as models
+from backend.database import SessionLocal
+from backend.services import geolocation
+
+PREFIXO = "198.51"  # TEST-NET-2: não colide com os IPs do seed_mensagens (10.x)
+
+
+class ServidorBatch:
+    """
+    /batch local no formato do ip-api.com. A segunda requisição recebe HTTP 429;
+    as demais respondem 200 com X-Rl/X-Ttl que liberam 2 requisições por segundo.
+    """
+
+    def __init__(self):
+        self.requisicoes = []  # (instante, endereços do lote, status respondido)
+        self.caminhos = set()
+        self._lock = Lock()
+        servidor = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                corpo = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                enderecos = [item["query"] for item in corpo]
+                with servidor._lock:
+                    status = 429 if len(servidor.requisicoes) == 1 else 200
+                    servidor.requisicoes.append((time.monotonic(), enderecos, status))
+                    servidor.caminhos.add(self.path.split("?")[0])
+
+                if status == 200:
+                    resposta = json.dumps([
+                        {"status": "success", "query": endereco, "country": "Brasil", "city": "Recife",
+                         "lat": -8.0, "lon": -34.9, "isp": "Teste"}
+                        for endereco in enderecos
+                    ]).encode()
+                    self.send_response(200)
+                    self.send_header("X-Rl", "20")
+                    self.send_header("X-Ttl", "10")
+                else:
+                    resposta = b""
+                    self.send_response(status)
+                    self.send_header("X-Ttl", "1")
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(resposta)))
+                self.end_headers()
+                self.wfile.write(resposta)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        self._thread = Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def ips_sem_coordenadas(db):
+    ips = [models.IP(endereco=f"{PREFIXO}.{i // 256}.{i % 256}") for i in range(250)]
+    db.add_all(ips)
+    db.commit()
+    yield ips
+    db.query(models.IP).filter(models.IP.endereco.like(f"{PREFIXO}.%")).delete(synchronize_session=False)
+    db.commit()
+
+
+def _resolvidos():
+    leitura = SessionLocal()
+    try:
+        return leitura.query(models.IP).filter(
+            models.IP.endereco.like(f"{PREFIXO}.%"), models.IP.latitude.isnot(None)
+        ).count()
+    finally:
+        leitura.close()
+
+
+def test_lotes_backoff_token_bucket_e_commit_por_lote(db, ips_sem_coordenadas, monkeypatch):
+    buckets = []
+
+    class BucketRegistrado(geolocation.TokenBucket):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            buckets.append(self)
+
+    monkeypatch.setattr(geolocation, "BACKEND", "api")
+    monkeypatch.setattr(geolocation, "TokenBucket", BucketRegistrado)
+    monkeypatch.setattr(geolocation, "CONCURRENCY", 1)  # Requisições em sequência: ordem determinística
+    # Taxa inicial de 1 requisição a cada 10 s: só termina rápido se o bucket seguir os cabeçalhos
+    monkeypatch.setattr(geolocation, "RATE_PER_MINUTE", 6)
+
+    resolvidos_por_commit = []
+    commit_original = db.commit
+
+    def commit_registrado():
+        commit_original()
+        resolvidos_por_commit.append(_resolvidos())
+
+    monkeypatch.setattr(db, "commit", commit_registrado)
+
+    inicio = time.monotonic()
+    with ServidorBatch() as servidor:
+        monkeypatch.setattr(geolocation, "API_URL", servidor.url)
+        assert geolocation.resolve_ips(ips_sem_coordenadas, db) == 250
+    duracao = time.monotonic() - inicio
+
+    # Lotes de até 100 IPs; o lote recusado com 429 é reenviado igual
+    assert servidor.caminhos == {"/batch"}
+    lotes = [enderecos for _, enderecos, _ in servidor.requisicoes]
+    assert [len(lote) for lote in lotes] == [100, 100, 100, 50]
+    assert [status for _, _, status in servidor.requisicoes] == [200, 429, 200, 200]
+    assert lotes[2] == lotes[1]
+    assert sorted(sum(lotes[:1] + lotes[2:], [])) == sorted(ip.endereco for ip in ips_sem_coordenadas)
+
+    # Backoff: depois do 429 (X-Ttl: 1) o reenvio espera a pausa e o backoff de 1 s
+    instantes = [instante for instante, _, _ in servidor.requisicoes]
+    assert instantes[2] - instantes[1] >= 0.9
+
+    # Token bucket: X-Rl=20, X-Ttl=10 -> 2 requisições por segundo, em vez da taxa inicial
+    assert len(buckets) == 1 and buckets[0].rate == pytest.approx(2.0)
+    assert duracao < 5
+
+    # Um commit por lote resolvido, cada um já visível para outras sessões
+    assert resolvidos_por_commit == [100, 200, 250]
+
+
+def test_sem_requisicoes_restantes_pausa_ate_a_janela_renovar():
+    bucket = geolocation.TokenBucket(rate=1, capacity=2)
+    antes = time.monotonic()
+    bucket.adapt(0, 3)
+    assert bucket.tokens == 0
+    assert bucket.paused_until >= antes + 4
+    assert bucket.rate == 1  # Sem restantes, a taxa não muda; só a pausa
+
+    bucket.adapt(None, 10)
+    assert bucket.rate == 1
@@ -0,0 +1,97 @@
+import json
+
+import pytest
+
+from backend.routers import graph
+from backend.services import graph_codec
+from conftest import seed_mensagens
+
+
+def _expandir(payload):
+    """Mesmo algoritmo do decodificador do frontend (utils/compactGraph.ts)"""
+    def bloco(b, pular=()):
+        linhas = [{} for _ in range(b["count"])]
+        for key, valores in b["columns"].items():
+            if key in pular:
+                continue
+            texto = key in b["string_columns"]
+            for i, v in enumerate(valores):
+                linhas[i][key] = (None if v < 0 else payload["strings"][v]) if texto else v
+        return linhas
+
+    nodes = bloco(payload["nodes"])
+    edges = bloco(payload["edges"], ("source", "target"))
+    for i, edge in enumerate(edges):
+        for lado in ("source", "target"):
+            pos = payload["edges"]["columns"][lado][i]
+            edge[lado] = nodes[pos]["id"] if pos >= 0 else None
+    return {"nodes": [{"data": n} for n in nodes], "edges": [{"data": e} for e in edges]}
+
+
+def _ordenado(elementos):
+    """A ordem pode variar entre o caminho SQL e o motor em memória"""
+    return {
+        "nodes": sorted(elementos["nodes"], key=lambda n: n["data"]["id"]),
+        "edges": sorted(elementos["edges"], key=lambda e: (e["data"]["source"], e["data"]["target"])),
+    }
+
+
+@pytest.mark.parametrize("rota", ["general", "common-ips", "shared-ips"])
+def test_formato_compacto_equivale_ao_json(db, nova_operacao, client, rota):
+    operacao_id = nova_operacao("grafo")
+    seed_mensagens(db, operacao_id, 2000, n_phones=40, n_ips=15)
+    if rota != "general":
+        # Telefones fora do cadastro: nos grafos de IP viram nós só com o número
+        db.query(graph.models.Telefone).filter(
+            graph.models.Telefone.operacao_id == operacao_id,
+            graph.models.Telefone.numero.like("%1")
+        ).delete(synchronize_session=False)
+        db.commit()
+    c = client(graph)
+
+    elementos = c.get(f"/graph/{operacao_id}/{rota}").json()["elements"]
+    compacto = c.get(f"/graph/{operacao_id}/{rota}", params={"formato": "compacto"}).json()
+
+    assert elementos["nodes"] and elementos["edges"]
+    assert _ordenado(_expandir(compacto)) == _ordenado(elementos)
+
+
+def test_colunas_viram_elementos_e_formato_compacto():
+    grafo = {
+        "nodes": graph_codec.concat_columns(
+            {"id": ["ip_1"], "label": ["10.0.0.1"], "ip_id": [1]},
+            {"id": ["a", "b"], "label": ["A", "b"], "categoria": ["SUSPEITO", None]},
+        ),
+        "edges": {"source": ["a", "b"], "target": ["ip_1", "ip_1"], "weight": [3, 1]},
+    }
+
+    assert graph_codec.to_elements(grafo)["nodes"][2] == {
+        "data": {"id": "b", "label": "b", "ip_id": None, "categoria": None}
+    }
+    compacto = graph_codec.encode_compact(grafo)
+    assert compacto["edges"]["columns"]["source"] == [1, 2]
+    assert compacto["edges"]["columns"]["target"] == [0, 0]
+    assert compacto["nodes"]["columns"]["ip_id"] == [1, None, None]
+    assert "categoria" in compacto["nodes"]["string_columns"]
+    assert _expandir(json.loads(json.dumps(compacto))) == graph_codec.to_elements(grafo)
+
+
+def test_grafo_vazio(db, nova_operacao, client):
+    operacao_id = nova_operacao("grafo-vazio")
+    c = client(graph)
+    assert c.get(f"/graph/{operacao_id}/shared-ips").json() == {"elements": {"nodes": [], "edges": []}}
+    compacto = c.get(f"/graph/{operacao_id}/shared-ips", params={"formato": "compacto"}).json()
+    assert compacto["nodes"]["count"] == 0 and compacto["edges"]["count"] == 0
+
+
+@pytest.mark.parametrize("rota,params", [
+    ("general", {"data_inicio": "2024-13-01"}),
+    ("general", {"data_fim": "ontem"}),
+    ("diff", {"inicio_a": "2024-02-30"}),
+    ("diff", {"inicio_a": "2024-01-01", "fim_b": "01/02/2024"}),
+])
+def test_data_invalida_na_janela_devolve_400(db, nova_operacao, client, rota, params):
+    operacao_id = nova_operacao("grafo-datas")
+    resposta = client(graph).get(f"/graph/{operacao_id}/{rota}", params=params)
+    assert resposta.status_code == 400
+    assert resposta.json()["detail"].startswith("Data inválida")
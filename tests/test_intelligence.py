@@ -0,0 +1,134 @@
+import os
+import time
+from collections import Counter
+
+import pytest
+from sqlalchemy import text
+
+import backend.models as models
+from backend.routers import intelligence
+from backend.routers.intelligence import find_unregistered_phones
+from backend.services import analytics
+from backend.services.cache import OperationCache
+from conftest import seed_mensagens
+
+# Orçamento de latência do anti-join com 5 milhões de mensagens (SQLite, máquina de desenvolvimento)
+BENCHMARK_MENSAGENS = int(os.getenv("FORENSE_BENCHMARK_MENSAGENS", "5000000"))
+BENCHMARK_LATENCIA_SEGUNDOS = 20.0
+
+
+def _referencia(db, operacao_id):
+    """Contagem em Python, como a implementação original (uma aparição por papel)"""
+    cadastrados = {n for (n,) in db.query(models.Telefone.numero).filter(models.Telefone.operacao_id == operacao_id)}
+    aparicoes = Counter()
+    for remetente, destinatario in db.query(models.Mensagem.remetente, models.Mensagem.destinatario).filter(
+        models.Mensagem.operacao_id == operacao_id
+    ):
+        for numero in (remetente, destinatario):
+            if numero and numero not in cadastrados:
+                aparicoes[numero] += 1
+    return sorted(aparicoes.items(), key=lambda kv: (-kv[1], kv[0]))[:20]
+
+
+def test_telefones_nao_cadastrados_igual_a_referencia(db, nova_operacao):
+    operacao_id = nova_operacao()
+    phones = seed_mensagens(db, operacao_id, 5000, n_phones=80, cadastrados=30)
+
+    # Casos de borda: destinatário vazio/nulo, mensagem para si mesmo e
+    # número cadastrado só em outra operação (continua "não cadastrado" aqui)
+    outra = nova_operacao()
+    db.add(models.Telefone(operacao_id=outra, numero=phones[-1], tipo="SECUNDARIO"))
+    for destinatario in ("", None, phones[-2]):
+        db.add(models.Mensagem(operacao_id=operacao_id, remetente=phones[-2], destinatario=destinatario, tipo_mensagem="text"))
+    db.commit()
+
+    resultado = find_unregistered_phones(db, operacao_id)
+
+    assert [(r["telefone"], r["aparicoes"]) for r in resultado] == _referencia(db, operacao_id)
+    assert all(r["telefone"] not in phones[:30] for r in resultado)
+
+
+@pytest.mark.benchmark
+@pytest.mark.skipif(os.getenv("FORENSE_BENCHMARK") != "1", reason="benchmark: defina FORENSE_BENCHMARK=1")
+def test_telefones_nao_cadastrados_latencia_5m(db, nova_operacao):
+    operacao_id = nova_operacao("benchmark")
+    # Geração no próprio SQLite (CTE recursiva): 20 mil números, 1000 cadastrados
+    db.execute(text("""
+        INSERT INTO mensagens (operacao_id, alvo, remetente, destinatario, data_hora, tipo_mensagem)
+        WITH RECURSIVE seq(n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM seq WHERE n < :total)
+        SELECT :op_id, '5511000000000',
+               printf('55%09d', abs(random()) % 20000), printf('55%09d', abs(random()) % 20000),
+               datetime('2024-01-01', '+' || (n % 200000) || ' minutes'), 'text'
+        FROM seq
+    """), {"total": BENCHMARK_MENSAGENS, "op_id": operacao_id})
+    db.execute(text("""
+        INSERT INTO telefones (operacao_id, numero, tipo)
+        WITH RECURSIVE seq(n) AS (SELECT 0 UNION ALL SELECT n + 1 FROM seq WHERE n < 999)
+        SELECT :op_id, printf('55%09d', n), 'SECUNDARIO' FROM seq
+    """), {"op_id": operacao_id})
+    db.commit()
+
+    inicio = time.perf_counter()
+    resultado = find_unregistered_phones(db, operacao_id)
+    duracao = time.perf_counter() - inicio
+
+    assert len(resultado) == 20
+    assert duracao < BENCHMARK_LATENCIA_SEGUNDOS, f"{duracao:.1f}s"
+
+
+# Análises aditivas, atualizadas só com as mensagens novas (partial_state)
+INCREMENTAIS = {
+    "stats": intelligence.report_stats,
+    "temporal": intelligence.analyze_temporal,
+    "geographic": intelligence.analyze_geographic,
+    "rankings": intelligence.analyze_top_rankings,
+}
+
+
+@pytest.fixture
+def sem_motor(monkeypatch):
+    """Força o caminho SQL (o motor em memória carrega em segundo plano e mudaria o caminho no meio do teste)"""
+    monkeypatch.setattr(analytics, "get_frame", lambda db, operacao_id: None)
+
+
+def _do_zero(db, operacao_id, monkeypatch):
+    with monkeypatch.context() as m:
+        m.setattr(intelligence, "_partial_states", OperationCache(max_entries=16))
+        return {name: analysis(db, operacao_id) for name, analysis in INCREMENTAIS.items()}
+
+
+def test_analises_aditivas_leem_so_as_mensagens_novas(db, nova_operacao, sem_motor, monkeypatch):
+    operacao_id = nova_operacao("incremental")
+    seed_mensagens(db, operacao_id, 3000, seed=1)
+    for analysis in INCREMENTAIS.values():
+        analysis(db, operacao_id)
+    contadas = {name: intelligence._partial_states.get((operacao_id, name), None)["ate_id"] for name in INCREMENTAIS}
+
+    # Nova importação: cada coletor recebe o estado anterior e lê só ids acima dele
+    seed_mensagens(db, operacao_id, 1000, seed=2, cadastrados=0)
+    chamadas = {}
+    for name, collect in list(intelligence.PARTIAL_COLLECTORS.items()):
+        def registrar(db, filters, state, name=name, collect=collect):
+            chamadas[name] = state["ate_id"]
+            collect(db, filters, state)
+        monkeypatch.setitem(intelligence.PARTIAL_COLLECTORS, name, registrar)
+
+    resultados = {name: analysis(db, operacao_id) for name, analysis in INCREMENTAIS.items()}
+    assert chamadas == contadas
+    assert resultados["stats"]["total_mensagens"] == 4000
+    assert resultados == _do_zero(db, operacao_id, monkeypatch)
+
+
+def test_estado_refeito_quando_mensagens_sao_removidas(db, nova_operacao, sem_motor, monkeypatch):
+    operacao_id = nova_operacao("incremental")
+    seed_mensagens(db, operacao_id, 2000, seed=3)
+    for analysis in INCREMENTAIS.values():
+        analysis(db, operacao_id)
+
+    primeira = db.query(models.Mensagem.id).filter(models.Mensagem.operacao_id == operacao_id).order_by(models.Mensagem.id).first()[0]
+    db.query(models.Mensagem).filter(models.Mensagem.id < primeira + 500).delete(synchronize_session=False)
+    db.commit()
+
+    resultados = {name: analysis(db, operacao_id) for name, analysis in INCREMENTAIS.items()}
+    assert resultados["stats"]["total_mensagens"] == 1500
+    assert resultados == _do_zero(db, operacao_id, monkeypatch)
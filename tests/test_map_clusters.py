@@ -0,0 +1,30 @@
+from sqlalchemy import event
+
+from backend.database import engine
+from backend.routers import geolocation
+from backend.services import map_clusters
+from conftest import seed_mensagens
+
+
+def test_detalhes_do_cluster_paginados_no_banco(db, nova_operacao, client):
+    operacao_id = nova_operacao("mapa")
+    seed_mensagens(db, operacao_id, 3000, n_phones=30, n_ips=40)
+    chave = map_clusters.cell_key(2, -23.4, -46.5)  # célula grande: contém todos os IPs do seed
+    c = client(geolocation)
+
+    completo = c.get(f"/geolocation/{operacao_id}/clusters/detalhes", params={"chave": chave, "limit": 5000}).json()
+    assert completo["total_ips"] == len(completo["ips"]) == 40
+    assert completo["total_telefones"] == len(completo["telefones"]) == 30
+
+    statements = []
+    registrar = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(engine, "before_cursor_execute", registrar)
+    try:
+        pagina = c.get(f"/geolocation/{operacao_id}/clusters/detalhes", params={"chave": chave, "limit": 5}).json()
+    finally:
+        event.remove(engine, "before_cursor_execute", registrar)
+
+    assert pagina["ips"] == completo["ips"][:5]
+    assert pagina["telefones"] == completo["telefones"][:5]
+    assert (pagina["total_ips"], pagina["total_telefones"]) == (40, 30)
+    assert sum("LIMIT" in s for s in statements) == 2
@@ -0,0 +1,35 @@
+import pytest
+
+import backend.models as models
+from backend.services.message_filters import search_filter
+
+FORMATOS = ["5511912345678", "+5511912345678", "+55 (11) 91234-5678", "55 11 91234.5678"]
+
+
+@pytest.fixture
+def operacao_com_formatos(db, nova_operacao):
+    operacao_id = nova_operacao("busca")
+    for numero in FORMATOS:
+        db.add(models.Mensagem(operacao_id=operacao_id, remetente=numero, destinatario="5521900000000", tipo_mensagem="text"))
+    db.add(models.Mensagem(operacao_id=operacao_id, remetente="5511999999999", destinatario="5521900000000", tipo_mensagem="text"))
+    db.commit()
+    return operacao_id
+
+
+def _remetentes(db, operacao_id, termo, modo="auto"):
+    return sorted(r for (r,) in db.query(models.Mensagem.remetente).filter(
+        models.Mensagem.operacao_id == operacao_id, search_filter(termo, modo)
+    ))
+
+
+@pytest.mark.parametrize("termo", ["5511912345678", "+55 11 91234-5678", "(55) 11 912345678"])
+def test_numero_completo_encontra_qualquer_formato_gravado(db, operacao_com_formatos, termo):
+    assert _remetentes(db, operacao_com_formatos, termo) == sorted(FORMATOS)
+
+
+def test_numero_completo_no_destinatario(db, operacao_com_formatos):
+    assert len(_remetentes(db, operacao_com_formatos, "+55 21 90000-0000")) == len(FORMATOS) + 1
+
+
+def test_modo_exato_compara_o_valor_gravado(db, operacao_com_formatos):
+    assert _remetentes(db, operacao_com_formatos, "+5511912345678", modo="exato") == ["+5511912345678"]
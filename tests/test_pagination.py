@@ -0,0 +1,128 @@
+import random
+from datetime import timedelta
+
+import pytest
+from sqlalchemy import event
+
+import backend.models as models
+from backend.database import engine
+from backend.routers import messages
+from conftest import BASE_DATE
+
+POR_PAGINA = 7
+
+
+@pytest.fixture(scope="module")
+def operacao_com_nulos():
+    """Mensagens com NULL e valores repetidos em todas as colunas ordenáveis"""
+    from backend.database import SessionLocal
+    db = SessionLocal()
+    try:
+        operacao = models.Operacao(nome=f"paginacao-{random.getrandbits(48):x}")
+        db.add(operacao)
+        db.flush()
+        ips = []
+        for i in range(3):
+            ip = models.IP(endereco=f"172.16.{operacao.id % 256}.{i}")
+            db.add(ip)
+            db.flush()
+            ips.append(ip.id)
+
+        rnd = random.Random(7)
+
+        def talvez(valor):
+            return None if rnd.random() < 0.2 else valor
+
+        for _ in range(60):
+            db.add(models.Mensagem(
+                operacao_id=operacao.id,
+                data_hora=talvez(BASE_DATE + timedelta(hours=rnd.randint(0, 10))),
+                alvo=talvez(f"55110000{rnd.randint(0, 3)}"),
+                remetente=talvez(f"55119999{rnd.randint(0, 4)}"),
+                destinatario=talvez(f"55118888{rnd.randint(0, 4)}"),
+                tipo_mensagem=talvez(rnd.choice(["text", "media"])),
+                porta=talvez(rnd.choice([443, 5222])),
+                ip_id=talvez(rnd.choice(ips)),
+            ))
+        db.commit()
+
+        linhas = {}
+        for m in db.query(models.Mensagem).filter(models.Mensagem.operacao_id == operacao.id):
+            linhas[m.id] = {
+                "data_hora": m.data_hora, "alvo": m.alvo, "remetente": m.remetente,
+                "destinatario": m.destinatario, "tipo_mensagem": m.tipo_mensagem,
+                "porta": m.porta, "id": m.id, "ip": m.ip_rel.endereco if m.ip_rel else None,
+            }
+        return operacao.id, linhas
+    finally:
+        db.close()
+
+
+def _esperado(linhas, sort_by, order):
+    """Ordem de referência: NULL como maior valor, desempate por id"""
+    def chave(i):
+        valor = linhas[i][sort_by]
+        return (1, 0, i) if valor is None else (0, valor, i)
+    ids = sorted(linhas, key=chave)
+    return ids[::-1] if order == "desc" else ids
+
+
+def _pagina(c, operacao_id, sort_by, order, cursor=None):
+    params = {"sort_by": sort_by, "order": order, "limit": POR_PAGINA}
+    if cursor:
+        params["cursor"] = cursor
+    resposta = c.get(f"/mensagens/{operacao_id}", params=params)
+    assert resposta.status_code == 200
+    return [m["id"] for m in resposta.json()], resposta.headers
+
+
+@pytest.mark.parametrize("order", ["asc", "desc"])
+@pytest.mark.parametrize("sort_by", list(messages.SORTABLE_COLUMNS))
+def test_cursor_percorre_paginas_nos_dois_sentidos(operacao_com_nulos, client, sort_by, order):
+    operacao_id, linhas = operacao_com_nulos
+    c = client(messages)
+    esperado = _esperado(linhas, sort_by, order)
+
+    # Para frente, até a última página
+    paginas = [_pagina(c, operacao_id, sort_by, order)]
+    while "x-next-cursor" in paginas[-1][1]:
+        paginas.append(_pagina(c, operacao_id, sort_by, order, paginas[-1][1]["x-next-cursor"]))
+    assert [i for ids, _ in paginas for i in ids] == esperado
+    assert len(paginas) == -(-len(esperado) // POR_PAGINA)
+
+    # E de volta, da última até a primeira
+    ids, headers = paginas[-1]
+    voltando = [ids]
+    while "x-prev-cursor" in headers:
+        ids, headers = _pagina(c, operacao_id, sort_by, order, headers["x-prev-cursor"])
+        voltando.append(ids)
+    assert voltando[::-1] == [ids for ids, _ in paginas]
+
+
+@pytest.mark.parametrize("order", ["asc", "desc"])
+def test_cursor_limita_a_faixa_do_indice(operacao_com_nulos, client, order):
+    """Nenhuma etapa lê o índice a partir do início da operação"""
+    operacao_id, _ = operacao_com_nulos
+    c = client(messages)
+    _, headers = _pagina(c, operacao_id, "data_hora", order)
+    ida = headers["x-next-cursor"]
+    _, headers = _pagina(c, operacao_id, "data_hora", order, ida)
+
+    executadas = []
+
+    def registrar(conn, cursor, statement, parameters, context, executemany):
+        if "FROM mensagens" in statement:
+            executadas.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", registrar)
+    try:
+        _pagina(c, operacao_id, "data_hora", order, ida)
+        _pagina(c, operacao_id, "data_hora", order, headers["x-prev-cursor"])
+    finally:
+        event.remove(engine, "before_cursor_execute", registrar)
+
+    assert executadas
+    with engine.connect() as conn:
+        for statement, parameters in executadas:
+            plano = " ".join(str(row[-1]) for row in conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters))
+            assert "operacao_id=? AND data_hora" in plano, plano
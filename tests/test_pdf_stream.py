@@ -0,0 +1,142 @@
+import io
+
+import pytest
+from pypdf import PdfReader
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.platypus import PageBreak, Paragraph, Table
+
+from backend.routers import export, intelligence
+from backend.services import pdf_stream
+from backend.services.cache import source_versions
+from backend.services.pdf_stream import iter_pdf, split_pages, write_pdf
+from backend.services.report_store import fingerprint, report_store
+from conftest import seed_mensagens
+
+STYLES = getSampleStyleSheet()
+
+
+def _texto(pagina):
+    return pagina.extract_text().split("\n")[0]
+
+
+def test_grupos_viram_um_pdf_valido_na_ordem():
+    story = [
+        Paragraph("Seção A", STYLES["Normal"]),
+        Table([[str(i), "x"] for i in range(120)]),  # mais de uma página
+        PageBreak(),
+        Paragraph("Seção B", STYLES["Normal"]),
+        PageBreak(),
+    ]
+    dados = b"".join(iter_pdf(split_pages(story)))
+
+    leitor = PdfReader(io.BytesIO(dados), strict=True)
+    assert len(leitor.pages) > 2
+    assert _texto(leitor.pages[0]) == "Seção A"
+    assert _texto(leitor.pages[-1]) == "Seção B"
+
+
+def test_primeiro_grupo_e_enviado_antes_de_montar_os_seguintes():
+    montados = []
+
+    def grupos():
+        for nome in ("um", "dois", "três"):
+            montados.append(nome)
+            yield [Paragraph(nome, STYLES["Normal"])]
+
+    stream = iter_pdf(grupos())
+    assert next(stream).startswith(b"%PDF")
+    assert b"/Type /Page" in next(stream)
+    assert montados == ["um"]
+    assert b"".join(stream).endswith(b"%%EOF\n")
+    assert montados == ["um", "dois", "três"]
+
+
+def test_copia_paginas_de_pdf_ja_gerado(tmp_path):
+    corpo = str(tmp_path / "corpo.pdf")
+    write_pdf(corpo, [[Paragraph(f"pág {i}", STYLES["Normal"])] for i in range(3)])
+
+    dados = b"".join(iter_pdf([[Paragraph("capa", STYLES["Normal"])], corpo]))
+    leitor = PdfReader(io.BytesIO(dados), strict=True)
+    assert [_texto(p) for p in leitor.pages] == ["capa", "pág 0", "pág 1", "pág 2"]
+
+
+def test_relatorio_de_inteligencia(db, nova_operacao, client):
+    operacao_id = nova_operacao("relatorio")
+    seed_mensagens(db, operacao_id, 2000, cadastrados=30)
+
+    resposta = client(intelligence).get(f"/intelligence/{operacao_id}/report")
+    assert resposta.status_code == 200
+    leitor = PdfReader(io.BytesIO(resposta.content), strict=True)
+    assert _texto(leitor.pages[0]) == "RELATÓRIO DE INTELIGÊNCIA"
+    assert len(leitor.pages) >= 5
+
+
+@pytest.fixture
+def montagens(monkeypatch):
+    """
+    Registra cada grupo montado pelo ReportLab. As rotas devolvem o gerador de bytes
+    (iter_pdf) em vez da StreamingResponse, para o teste consumir bloco a bloco.
+    """
+    montados = []
+    original = pdf_stream.render_pages
+
+    def render_pages(flowables, pagesize=pdf_stream.A4):
+        montados.append(len(montados))
+        return original(flowables, pagesize)
+    monkeypatch.setattr(pdf_stream, "render_pages", render_pages)
+    for router in (export, intelligence):
+        monkeypatch.setattr(router, "pdf_streaming_response", lambda groups, filename: iter_pdf(groups))
+    return montados
+
+
+def _ate_primeira_pagina(stream):
+    """Consome o stream até o primeiro bloco com uma página"""
+    for chunk in stream:
+        if b"/Type /Page" in chunk:
+            return
+
+
+def test_export_pdf_envia_a_primeira_secao_antes_de_montar_a_ultima(db, nova_operacao, montagens):
+    operacao_id = nova_operacao("export-stream")
+    seed_mensagens(db, operacao_id, 500)
+
+    stream = export.export_pdf(operacao_id, db)
+    _ate_primeira_pagina(stream)
+    assert len(montagens) == 1
+    assert b"".join(stream).endswith(b"%%EOF\n")
+    assert len(montagens) == 2
+
+
+def test_relatorio_envia_secoes_enquanto_grava_o_artefato(db, nova_operacao, montagens):
+    operacao_id = nova_operacao("relatorio-stream")
+    seed_mensagens(db, operacao_id, 2000, cadastrados=30)
+    key = fingerprint(source_versions(db, operacao_id))
+
+    stream = intelligence.generate_intelligence_report(operacao_id, db)
+    _ate_primeira_pagina(stream)
+    assert len(montagens) == 1  # só a capa
+    _ate_primeira_pagina(stream)
+    assert len(montagens) == 2  # capa e primeira seção
+    assert report_store.get(operacao_id, key) is None
+
+    resto = b"".join(stream)
+    assert resto.endswith(b"%%EOF\n")
+    assert len(montagens) >= 5
+    assert report_store.get(operacao_id, key) is not None
+
+    # Com o artefato publicado, só a capa é montada
+    del montagens[:]
+    b"".join(intelligence.generate_intelligence_report(operacao_id, db))
+    assert montagens == [0]
+
+
+def test_relatorio_interrompido_nao_publica_artefato(db, nova_operacao, montagens):
+    operacao_id = nova_operacao("relatorio-interrompido")
+    seed_mensagens(db, operacao_id, 500, cadastrados=30)
+    key = fingerprint(source_versions(db, operacao_id))
+
+    stream = intelligence.generate_intelligence_report(operacao_id, db)
+    _ate_primeira_pagina(stream)
+    _ate_primeira_pagina(stream)
+    stream.close()
+    assert report_store.get(operacao_id, key) is None
@@ -0,0 +1,86 @@
+import io
+import os
+import time
+from datetime import datetime
+
+from pypdf import PdfReader
+
+from backend.routers import intelligence
+from backend.services.cache import bump_version
+from backend.services.report_store import ReportStore, report_store
+from conftest import seed_mensagens
+
+
+def _gravar(conteudo):
+    def build(path):
+        with open(path, "wb") as f:
+            f.write(conteudo)
+    return build
+
+
+def _envelhecer(path, segundos):
+    instante = time.time() - segundos
+    os.utime(path, (instante, instante))
+
+
+def test_artefato_substituido_so_sai_depois_da_carencia(tmp_path):
+    store = ReportStore(str(tmp_path), max_bytes=10 * 1024 * 1024, grace_seconds=60)
+    antigo = store.save(1, "a" * 16, _gravar(b"v1"))
+    novo = store.save(1, "b" * 16, _gravar(b"v2"))
+
+    # Uma resposta que pegou o caminho antigo ainda consegue lê-lo
+    assert antigo != novo and os.path.exists(antigo)
+    assert store.get(1, "b" * 16) == novo
+
+    _envelhecer(antigo, 120)
+    terceiro = store.save(1, "c" * 16, _gravar(b"v3"))
+    assert not os.path.exists(antigo)
+    assert os.path.exists(novo) and os.path.exists(terceiro)
+
+
+def test_mesma_chave_nunca_sobrescreve(tmp_path):
+    store = ReportStore(str(tmp_path), max_bytes=10 * 1024 * 1024, grace_seconds=60)
+    primeiro = store.save(7, "a" * 16, _gravar(b"v1"))
+    segundo = store.save(7, "a" * 16, _gravar(b"v1"))
+    assert primeiro != segundo
+    with open(primeiro, "rb") as f:
+        assert f.read() == b"v1"
+
+
+def test_evicao_respeita_a_carencia(tmp_path):
+    store = ReportStore(str(tmp_path), max_bytes=10, grace_seconds=60)
+    outro = store.save(1, "a" * 16, _gravar(b"x" * 8))
+    store.save(2, "b" * 16, _gravar(b"x" * 8))
+    assert os.path.exists(outro)  # passou do limite, mas foi usado agora
+
+    _envelhecer(outro, 120)
+    store.save(3, "c" * 16, _gravar(b"x" * 8))
+    assert not os.path.exists(outro)
+
+
+def test_data_de_geracao_muda_a_cada_resposta(db, nova_operacao, client, monkeypatch):
+    operacao_id = nova_operacao("capa")
+    seed_mensagens(db, operacao_id, 1000, seed=4)
+    bump_version(db, "mensagens", operacao_id)
+    c = client(intelligence)
+
+    class Relogio:
+        agora = None
+
+        @classmethod
+        def now(cls):
+            return cls.agora
+
+    monkeypatch.setattr(intelligence, "datetime", Relogio)
+    paginas = []
+    for agora in ("01/02/2030 10:00", "03/04/2031 11:30"):
+        Relogio.agora = datetime.strptime(agora, "%d/%m/%Y %H:%M")
+        resposta = c.get(f"/intelligence/{operacao_id}/report")
+        assert resposta.status_code == 200
+        leitor = PdfReader(io.BytesIO(resposta.content), strict=True)
+        assert f"Data de Geração: {agora}" in leitor.pages[0].extract_text()
+        paginas.append([p.extract_text() for p in leitor.pages[1:]])
+
+    # As seções vêm do mesmo artefato, gerado uma vez
+    assert paginas[0] == paginas[1]
+    assert len(report_store._artifacts(operacao_id)) == 1
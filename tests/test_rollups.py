@@ -0,0 +1,138 @@
+import re
+from collections import Counter
+from threading import Barrier, Thread
+
+import pytest
+from sqlalchemy import event, func
+
+import backend.models as models
+from backend.database import SessionLocal, engine
+from backend.routers import dashboard, dashboard_extended
+from backend.services import parser, rollups
+from conftest import seed_mensagens
+
+
+def _linhas(quantidade, com_data=True, ip="10.200.0.1"):
+    return [{
+        "TIPO": "text" if i % 2 else "media",
+        "REMETENTE": f"55119000000{i % 3}",
+        "DESTINATÁRIO": f"55119000001{i % 4}",
+        "ALVO": "551190000000",
+        "DATA": f"0{1 + i % 9}/02/2024 10:{i % 60:02d}:00" if com_data else "data ilegível",
+        "IP": ip,
+    } for i in range(quantidade)]
+
+
+def _total_no_agregado(db, operacao_id):
+    return db.query(func.sum(models.MensagemHoraria.quantidade)).filter(
+        models.MensagemHoraria.operacao_id == operacao_id
+    ).scalar() or 0
+
+
+def test_mensagens_sem_data_entram_no_agregado(db, nova_operacao, client):
+    operacao_id = nova_operacao()
+    parser._process_data_list(_linhas(5) + _linhas(3, com_data=False), operacao_id, db)
+    parser._process_data_list(_linhas(5) + _linhas(4, com_data=False), operacao_id, db)
+
+    c = client(dashboard, dashboard_extended)
+    stats = c.get(f"/dashboard/{operacao_id}/stats").json()
+    tipos = c.get(f"/dashboard/message-types/{operacao_id}").json()
+
+    assert stats["total_mensagens"] == 17
+    assert sum(t["count"] for t in tipos) == 17
+
+
+def test_importacao_so_com_mensagens_sem_data(db, nova_operacao):
+    operacao_id = nova_operacao()
+    parser._process_data_list(_linhas(2), operacao_id, db)
+    parser._process_data_list(_linhas(6, com_data=False), operacao_id, db)
+
+    assert _total_no_agregado(db, operacao_id) == 8
+
+
+def test_preenchimento_inicial_concorrente_nao_duplica(db, nova_operacao):
+    operacao_id = nova_operacao()
+    seed_mensagens(db, operacao_id, 3000)  # sem agregados: leitura dispara o preenchimento
+
+    largada = Barrier(4)
+    erros = []
+
+    def ler():
+        session = SessionLocal()
+        try:
+            largada.wait()
+            rollups.ensure_hourly(session, operacao_id)
+            rollups.ensure_daily_edges(session, operacao_id)
+        except Exception as e:
+            erros.append(e)
+        finally:
+            session.close()
+
+    threads = [Thread(target=ler) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert erros == []
+    assert _total_no_agregado(db, operacao_id) == 3000
+    total_arestas = db.query(func.sum(models.ArestaDiaria.quantidade)).filter(
+        models.ArestaDiaria.operacao_id == operacao_id
+    ).scalar()
+    assert total_arestas == 3000
+
+
+def test_ips_distintos_vem_do_agregado(db, nova_operacao, client):
+    operacao_id = nova_operacao()
+    seed_mensagens(db, operacao_id, 3000, n_ips=120)
+    parser._process_data_list(_linhas(6, com_data=False, ip="10.201.0.1"), operacao_id, db)
+    esperado = db.query(func.count(func.distinct(models.Mensagem.ip_id))).filter(
+        models.Mensagem.operacao_id == operacao_id
+    ).scalar()
+    rollups.ensure_hourly(db, operacao_id)
+
+    lidas = []
+
+    def registrar(conn, cursor, statement, parameters, context, executemany):
+        lidas.extend(re.findall(r"\bmensagens\b(?!_)", statement))
+
+    c = client(dashboard)
+    event.listen(engine, "before_cursor_execute", registrar)
+    try:
+        stats = c.get(f"/dashboard/{operacao_id}/stats").json()
+    finally:
+        event.remove(engine, "before_cursor_execute", registrar)
+
+    # HyperLogLog: erro padrão ~1,6%
+    assert stats["total_ips"] == pytest.approx(esperado, rel=0.03)
+    assert c.get(f"/dashboard/{operacao_id}/overview").json()["stats"]["total_ips"] == stats["total_ips"]
+    assert lidas == []
+
+
+def test_overview_le_so_os_agregados(db, nova_operacao, client):
+    operacao_id = nova_operacao()
+    seed_mensagens(db, operacao_id, 3000, n_phones=30)
+    rollups.ensure_hourly(db, operacao_id)
+    rollups.ensure_daily_edges(db, operacao_id)
+
+    aparicoes = Counter()
+    for remetente, destinatario in db.query(models.Mensagem.remetente, models.Mensagem.destinatario).filter(
+        models.Mensagem.operacao_id == operacao_id
+    ):
+        aparicoes[remetente] += 1
+        aparicoes[destinatario] += 1
+    esperado = sorted(aparicoes.items(), key=lambda item: (-item[1], item[0]))[:5]
+
+    lidas = []
+
+    def registrar(conn, cursor, statement, parameters, context, executemany):
+        lidas.extend(re.findall(r"\bmensagens\b(?!_)", statement))
+
+    event.listen(engine, "before_cursor_execute", registrar)
+    try:
+        overview = client(dashboard).get(f"/dashboard/{operacao_id}/overview", params={"limit": 5}).json()
+    finally:
+        event.remove(engine, "before_cursor_execute", registrar)
+
+    assert [(i["numero"], i["total"]) for i in overview["top_interlocutors"]] == esperado
+    assert lidas == []
@@ -0,0 +1,57 @@
+from sqlalchemy import event
+
+import backend.models as models
+from backend.database import engine
+from backend.routers import messages
+from backend.services import row_counts
+from conftest import seed_mensagens
+
+
+def _consulta(db, operacao_id):
+    return db.query(models.Mensagem.id).filter(models.Mensagem.operacao_id == operacao_id)
+
+
+def test_abaixo_do_limite_conta_exato(db, nova_operacao):
+    operacao_id = nova_operacao()
+    seed_mensagens(db, operacao_id, 40)
+    assert row_counts.count_rows(db, _consulta(db, operacao_id), limit=50) == (40, False)
+
+
+def test_acima_do_limite_sem_estimativa_conta_tudo_no_sqlite(db, nova_operacao, monkeypatch):
+    operacao_id = nova_operacao()
+    seed_mensagens(db, operacao_id, 300)
+    monkeypatch.setattr(row_counts, "EXACT_COUNT_LIMIT", 25)
+
+    statements = []
+    registrar = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(engine, "before_cursor_execute", registrar)
+    try:
+        assert row_counts.count_rows(db, _consulta(db, operacao_id)) == (300, False)
+    finally:
+        event.remove(engine, "before_cursor_execute", registrar)
+    # Primeiro a contagem limitada (LIMIT 26), depois a exata; nunca o EXPLAIN
+    assert len(statements) == 2
+    assert "LIMIT" in statements[0] and "LIMIT" not in statements[1]
+    assert not any("EXPLAIN" in s for s in statements)
+
+
+def test_endpoint_com_limite_baixo(db, nova_operacao, client, monkeypatch):
+    operacao_id = nova_operacao()
+    seed_mensagens(db, operacao_id, 120)
+    monkeypatch.setattr(row_counts, "EXACT_COUNT_LIMIT", 10)
+    c = client(messages)
+
+    assert c.get(f"/mensagens/{operacao_id}/count").json() == {"total": 120, "aproximado": False}
+    filtrada = c.get(f"/mensagens/{operacao_id}/count",
+                     params={"data_inicio": "2099-01-01"}).json()
+    assert filtrada == {"total": 0, "aproximado": False}
+
+
+def test_estimativa_do_planejador_marca_aproximado(db, nova_operacao, monkeypatch):
+    operacao_id = nova_operacao()
+    seed_mensagens(db, operacao_id, 60)
+    # A estimativa nunca fica abaixo do que já foi contado (limit + 1)
+    monkeypatch.setattr(row_counts, "planner_estimate", lambda db, query: 5)
+    assert row_counts.count_rows(db, _consulta(db, operacao_id), limit=20) == (21, True)
+    monkeypatch.setattr(row_counts, "planner_estimate", lambda db, query: 5000)
+    assert row_counts.count_rows(db, _consulta(db, operacao_id), limit=20) == (5000, True)
@@ -0,0 +1,58 @@
+from datetime import timedelta
+
+import backend.models as models
+from backend.services import trajectory
+from conftest import BASE_DATE
+
+
+def _ip(db, endereco, cidade=None):
+    ip = models.IP(endereco=endereco, pais="Brasil" if cidade else None, cidade=cidade)
+    db.add(ip)
+    db.flush()
+    return ip.id
+
+
+def _mensagens(db, operacao_id, numero, ip_ids):
+    for i, ip_id in enumerate(ip_ids):
+        db.add(models.Mensagem(operacao_id=operacao_id, remetente=numero, destinatario="5511000000000",
+                               ip_id=ip_id, data_hora=BASE_DATE + timedelta(hours=i)))
+    db.commit()
+
+
+def test_mensagens_sem_local_nao_quebram_o_segmento(db, nova_operacao):
+    operacao_id = nova_operacao("trajetoria")
+    a1 = _ip(db, f"198.51.{operacao_id % 256}.1", "Campinas")
+    a2 = _ip(db, f"198.51.{operacao_id % 256}.2", "Campinas")
+    sem_cidade = _ip(db, f"198.51.{operacao_id % 256}.3")
+    numero = "5519999990000"
+    # A, sem IP, A (outro IP), IP sem cidade, A
+    _mensagens(db, operacao_id, numero, [a1, None, a2, sem_cidade, a1])
+
+    resultado = trajectory.build_trajectory(db, operacao_id, numero, "cidade")
+    assert resultado["total_segmentos"] == 1
+    assert resultado["locais_distintos"] == 1
+    segmento = resultado["segmentos"][0]
+    assert segmento["cidade"] == "Campinas"
+    assert segmento["total_mensagens"] == 5
+    assert segmento["inicio"] == BASE_DATE and segmento["fim"] == BASE_DATE + timedelta(hours=4)
+    assert segmento["total_ips"] == 2
+
+
+def test_mensagens_sem_local_no_inicio_e_por_ip(db, nova_operacao):
+    operacao_id = nova_operacao("trajetoria")
+    a = _ip(db, f"203.0.{operacao_id % 256}.1", "Campinas")
+    b = _ip(db, f"203.0.{operacao_id % 256}.2", "Santos")
+    numero = "5513999990000"
+    _mensagens(db, operacao_id, numero, [None, None, a, None, b, a])
+
+    por_cidade = trajectory.build_trajectory(db, operacao_id, numero, "cidade")
+    assert [(s["cidade"], s["total_mensagens"]) for s in por_cidade["segmentos"]] == [
+        ("Campinas", 4), ("Santos", 1), ("Campinas", 1)
+    ]
+    assert por_cidade["segmentos"][0]["inicio"] == BASE_DATE
+    assert por_cidade["locais_distintos"] == 2
+
+    por_ip = trajectory.build_trajectory(db, operacao_id, numero, "ip")
+    assert por_ip["total_segmentos"] == 3
+    assert por_ip["locais_distintos"] == 2
+    assert sum(s["total_mensagens"] for s in por_ip["segmentos"]) == por_ip["total_mensagens"] == 6